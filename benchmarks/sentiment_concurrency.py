@@ -0,0 +1,99 @@
+"""
+Sentiment job wall time against group concurrency.
+
+Runs modules.sentiment.analyze_groups over synthetic groups against a local
+fake OpenAI-compatible server that answers every completion after a fixed
+delay, so the numbers reflect how well API latency is overlapped rather than
+model speed.
+
+    python -m benchmarks.sentiment_concurrency
+    python -m benchmarks.sentiment_concurrency --groups 40 --latency-ms 800 --concurrency 1,4,8,16
+
+--serve only starts the fake server, for running the real job against it:
+
+    python -m benchmarks.sentiment_concurrency --serve --port 8089
+    OPENAI_BASE_URL=http://127.0.0.1:8089/v1 OPENAI_API_KEY=x uvicorn main:app
+"""
+import argparse
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+FAKE_ANALYSIS = {
+    "sentiment_data": {"Positive": 3, "Neutral": 5, "Negative": 1, "Commercial": 1},
+    "topic_data": [{"topic": "delivery", "frequency": 4}, {"topic": "pricing", "frequency": 2}],
+}
+
+
+def make_handler(latency):
+    class CompletionHandler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            time.sleep(latency)
+            body = json.dumps({
+                "id": "chatcmpl-bench",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": "gpt-4",
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": json.dumps(FAKE_ANALYSIS)},
+                    "finish_reason": "stop",
+                }],
+                "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+            }).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    return CompletionHandler
+
+
+def start_server(port, latency):
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(latency))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main(args):
+    server = start_server(args.port, args.latency_ms / 1000)
+    if args.serve:
+        print(f"Fake completions on http://127.0.0.1:{server.server_address[1]}/v1 (Ctrl+C to stop)")
+        try:
+            threading.Event().wait()
+        except KeyboardInterrupt:
+            return
+
+    os.environ["OPENAI_BASE_URL"] = f"http://127.0.0.1:{server.server_address[1]}/v1"
+    os.environ.setdefault("OPENAI_API_KEY", "bench")
+    from modules.sentiment import analyze_groups
+
+    groups = [((f"group-{i}", "bench"), [f"message {m} in group {i}" for m in range(args.messages)])
+              for i in range(args.groups)]
+
+    print(f"{'concurrency':>12} {'wall s':>9} {'groups/s':>10}")
+    for concurrency in [int(n) for n in args.concurrency.split(",")]:
+        started = time.perf_counter()
+        results = list(analyze_groups(groups, concurrency))
+        elapsed = time.perf_counter() - started
+        assert [key for key, _ in results] == [key for key, _ in groups]
+        print(f"{concurrency:>12} {elapsed:>9.2f} {len(groups) / elapsed:>10.1f}")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--groups", type=int, default=24, help="Synthetic groups to analyze")
+    parser.add_argument("--messages", type=int, default=50, help="Messages per group")
+    parser.add_argument("--latency-ms", type=float, default=500, help="Delay of every fake completion")
+    parser.add_argument("--concurrency", default="1,2,4,8,16", help="Comma separated concurrency levels")
+    parser.add_argument("--port", type=int, default=0, help="Port of the fake server (0 picks a free one)")
+    parser.add_argument("--serve", action="store_true", help="Only run the fake server")
+    main(parser.parse_args())
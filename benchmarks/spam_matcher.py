@@ -0,0 +1,89 @@
+"""
+Spam keyword matching throughput against keyword count.
+
+Compares the compiled Aho-Corasick matcher (modules.spam_matcher), with the
+pyahocorasick C extension and with the pure-Python fallback, against the
+straightforward approach of testing every keyword against every message, on
+synthetic chat messages of typical length. No database is needed.
+
+    python -m benchmarks.spam_matcher
+    python -m benchmarks.spam_matcher --keywords 10,100,1000,10000 --messages 20000
+"""
+import argparse
+import random
+import string
+import time
+
+from modules import spam_matcher
+from modules.spam_matcher import KeywordAutomaton
+
+WORDS = ("hello team meeting tomorrow please share the update on delivery order price offer "
+         "thanks everyone good morning call me when free link group join admin payment done").split()
+
+
+def random_word(rng):
+    return "".join(rng.choices(string.ascii_lowercase, k=rng.randint(4, 9)))
+
+
+def make_keywords(count, rng):
+    keywords = {}
+    while len(keywords) < count:
+        words = [random_word(rng) for _ in range(rng.choice((1, 1, 1, 2)))]
+        keywords[" ".join(words)] = rng.choice(("warn", "remove", "mute"))
+    return keywords
+
+
+def make_messages(count, keywords, rng, spam_ratio=0.1):
+    keyword_list = list(keywords)
+    messages = []
+    for _ in range(count):
+        words = rng.choices(WORDS, k=rng.randint(5, 25))
+        if rng.random() < spam_ratio:
+            words.insert(rng.randrange(len(words) + 1), rng.choice(keyword_list))
+        messages.append(" ".join(words))
+    return messages
+
+
+def naive_classify(keywords, message):
+    # One substring test per keyword per message
+    text = message.casefold()
+    return [keyword for keyword in keywords if keyword in text]
+
+
+def throughput(func, messages):
+    started = time.perf_counter()
+    for message in messages:
+        func(message)
+    return len(messages) / (time.perf_counter() - started)
+
+
+def main(args):
+    rng = random.Random(args.seed)
+    print(f"{'keywords':>9} {'build ms':>9} {'naive msg/s':>12} {'python msg/s':>13} {'native msg/s':>13} {'speedup':>8}")
+    for count in [int(n) for n in args.keywords.split(",")]:
+        keywords = make_keywords(count, rng)
+        messages = make_messages(args.messages, keywords, rng)
+
+        started = time.perf_counter()
+        automaton = KeywordAutomaton(keywords)
+        build_ms = (time.perf_counter() - started) * 1000
+
+        # The same automaton without the C extension
+        native_module, spam_matcher.ahocorasick = spam_matcher.ahocorasick, None
+        python_automaton = KeywordAutomaton(keywords)
+        spam_matcher.ahocorasick = native_module
+
+        naive = throughput(lambda message: naive_classify(keywords, message), messages)
+        python = throughput(python_automaton.classify, messages)
+        native = throughput(automaton.classify, messages) if native_module is not None else None
+        best = native or python
+        print(f"{count:>9} {build_ms:>9.1f} {naive:>12,.0f} {python:>13,.0f} "
+              f"{(f'{native:,.0f}' if native else 'n/a'):>13} {best / naive:>7.1f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--keywords", default="10,100,500,1000,5000", help="Comma separated keyword counts")
+    parser.add_argument("--messages", type=int, default=10000, help="Messages classified per keyword count")
+    parser.add_argument("--seed", type=int, default=7)
+    main(parser.parse_args())
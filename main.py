@@ -1,11 +1,23 @@
 from fastapi import FastAPI
-from router import groups_details,bot_config as bot,schedule_message as sch_msg,dashboard,contacts
+from router import groups_details,bot_config as bot,schedule_message as sch_msg,dashboard,contacts,admin
 from fastapi.middleware.cors import CORSMiddleware
 from apscheduler.schedulers.background import BackgroundScheduler
 from apscheduler.jobstores.sqlalchemy import SQLAlchemyJobStore
 from apscheduler.executors.pool import ThreadPoolExecutor
-from modules.sentiment import get_groups_message,save_sentiment_data,analyze_topic_and_sentiment
-from datetime import datetime, timedelta
+from modules.sentiment import run_sentiment_analysis, SENTIMENT_INTERVAL_MINUTES
+from modules.db import close_pool
+from modules.db_async import run_sync,close_async_pool
+from modules.schema import ensure_schema
+from modules.store_get_data.message_rollup import refresh_message_rollup
+from modules.dispatcher import dispatcher
+from modules.bot_log_sink import bot_log_sink
+from modules.log import configure_logging
+from modules.metrics import MetricsMiddleware, route_metrics
+import logging
+
+# Structured, sampled logs for every module (LOG_LEVEL, LOG_FORMAT, LOG_SAMPLE_RATE)
+configure_logging()
+
 # Create the FastAPI app
 app = FastAPI(title="WhatsApp Automation API")
 
@@ -19,6 +31,9 @@ app.add_middleware(
     allow_headers=["*"],  # Allows all headers
 )
 
+# Per-route latency histograms and in-flight counts, served on /metrics
+app.add_middleware(MetricsMiddleware, metrics=route_metrics, routes=app.router.routes)
+
 
 # Include routers
 app.include_router(dashboard.dashboard_router)
@@ -26,43 +41,36 @@ app.include_router(groups_details.router,prefix="/group_details")
 app.include_router(bot.bot_config_router,prefix="/bot_details")
 app.include_router(sch_msg.router,prefix="/schedule_message")
 app.include_router(contacts.contactrouter,prefix="/contact")
+# Operational endpoints, only with ADMIN_TOKEN
+app.include_router(admin.admin_router)
 
-print("Starting scheduler...")
-# Scheduler to run the task at midnight every day
+logging.info("Starting scheduler...")
+# Background jobs: incremental sentiment analysis and the message rollup
 scheduler = BackgroundScheduler()
-scheduler.add_job(get_groups_message, 'cron', hour=00, minute=00)  # Run at midnight
+scheduler.add_job(run_sentiment_analysis, 'interval', minutes=SENTIMENT_INTERVAL_MINUTES)  # Analyze new messages since each group's watermark
+scheduler.add_job(refresh_message_rollup, 'interval', minutes=5)  # Keep the daily message rollup current
 scheduler.start()
 
+@app.on_event("startup")
+async def startup():
+    # Apply pending schema migrations; slow index builds continue in the background
+    await run_sync(ensure_schema)
+    # Sends due scheduled messages when DISPATCHER_ENABLED is set
+    dispatcher.start()
+    # Batches bot log rows into whatsapp_bot_logs
+    bot_log_sink.start()
+
 @app.get("/sentiment")
 async def get_sentiment():
-    grouped_messages = get_groups_message()  # Fetch messages grouped by group
-    print("Grouped Messages in get_sentiment:", grouped_messages) 
-    
-    # Check if the return type is a dictionary
-    if isinstance(grouped_messages, list):
-        return {"error": "Expected a dictionary, but got a list. Check the get_groups_message function."}
-    
-    # Loop through grouped messages and process each group
-    for (group_name, tenant_id), messages in grouped_messages.items():  # Unpack group_name and tenant_id correctly
-        sentiment_data = {"Positive": 0, "Neutral": 0, "Negative": 0, "Commercial": 0}
-        topic_data = {}
-        print("Group:", group_name)
-        print("Messages:", messages)
-
-        # Directly analyze the entire list of messages for the group
-        analysis = analyze_topic_and_sentiment(messages)
-        if analysis:
-            sentiment_data = analysis.get("sentiment_data", {"Positive": 0, "Neutral": 0, "Negative": 0, "Commercial": 0})
-            topic_data = analysis.get("topic_data", {})
-
-            # Get current timestamp for the time when the sentiment data is processed
-            current_time = datetime.now()
-
-            # Save the sentiment and topic data into the database
-            save_sentiment_data(group_name, sentiment_data, topic_data, current_time, tenant_id)
-
-    return {"status": "Sentiment analysis completed successfully"}
+    # Fetching, GPT calls and inserts are all blocking; keep them off the event loop
+    return await run_sync(run_sentiment_analysis)
 
 @app.on_event("shutdown")
-def shutdown():
-    scheduler.shutdown()
\ No newline at end of file
+async def shutdown():
+    scheduler.shutdown()
+    # Waits for in-flight sends and hands unfired claims back to other workers
+    await run_sync(dispatcher.stop)
+    # Writes out buffered bot logs before the pool closes
+    await run_sync(bot_log_sink.stop)
+    close_pool()
+    await close_async_pool()
\ No newline at end of file
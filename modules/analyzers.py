@@ -0,0 +1,189 @@
+"""
+Sentiment/topic analyzer backends.
+
+Every backend takes a list of message strings and returns the same shape the
+GPT prompt asks for, or None when it could not produce a result:
+
+    {"sentiment_data": {"Positive": int, "Neutral": int, "Negative": int, "Commercial": int},
+     "topic_data": [{"topic": str, "frequency": int}, ...],
+     "analyzer": str}
+
+"analyzer" is the name of the backend that actually produced the result, so
+a FallbackAnalyzer's output says whether GPT or the lexicon answered.
+
+LexiconAnalyzer runs entirely offline: messages are tokenized into unigrams
+and bigrams, and the lexicon weights of every token are summed per message
+with NumPy scatter-adds, so a batch is scored in a handful of array
+operations. It is less nuanced than the model but costs nothing, which makes
+it the fallback when GPT is unavailable and the fast path for very large
+groups. The GPT backend lives in modules/sentiment.py.
+"""
+import logging
+import re
+from abc import ABC, abstractmethod
+
+import numpy as np
+
+SENTIMENT_CLASSES = ("Positive", "Negative", "Commercial")  # Scored columns; Neutral is the absence of a signal
+
+# term -> (positive, negative, commercial) weight. Bigrams are written with a single space.
+LEXICON = {
+    # Positive
+    "good": (1, 0, 0), "great": (2, 0, 0), "excellent": (2, 0, 0), "awesome": (2, 0, 0), "amazing": (2, 0, 0),
+    "nice": (1, 0, 0), "love": (2, 0, 0), "loved": (2, 0, 0), "like": (0.5, 0, 0), "happy": (1.5, 0, 0),
+    "thanks": (1, 0, 0), "thank": (1, 0, 0), "thankyou": (1, 0, 0), "congrats": (2, 0, 0),
+    "congratulations": (2, 0, 0), "welcome": (1, 0, 0), "helpful": (1.5, 0, 0), "perfect": (2, 0, 0),
+    "best": (1.5, 0, 0), "well done": (2, 0, 0), "super": (1.5, 0, 0), "glad": (1, 0, 0),
+    "appreciate": (1.5, 0, 0), "resolved": (1, 0, 0), "fixed": (1, 0, 0), "wow": (1.5, 0, 0),
+    "badhiya": (1.5, 0, 0), "accha": (1, 0, 0), "mast": (1.5, 0, 0), "shukriya": (1, 0, 0), "dhanyavad": (1, 0, 0),
+    # Negative
+    "bad": (0, 1, 0), "worst": (0, 2, 0), "terrible": (0, 2, 0), "awful": (0, 2, 0), "poor": (0, 1, 0),
+    "hate": (0, 2, 0), "angry": (0, 1.5, 0), "sad": (0, 1, 0), "problem": (0, 1, 0), "issue": (0, 1, 0),
+    "complaint": (0, 1.5, 0), "broken": (0, 1.5, 0), "delay": (0, 1, 0), "delayed": (0, 1, 0),
+    "late": (0, 1, 0), "refund": (0, 1, 0), "fraud": (0, 2, 0), "scam": (0, 2, 0), "spam": (0, 1.5, 0),
+    "disappointed": (0, 2, 0), "useless": (0, 2, 0), "waste": (0, 1.5, 0), "wrong": (0, 1, 0),
+    "error": (0, 1, 0), "failed": (0, 1, 0), "not working": (0, 2, 0), "no response": (0, 1.5, 0),
+    "bekar": (0, 1.5, 0), "ganda": (0, 1.5, 0),
+    # Commercial
+    "sale": (0, 0, 1.5), "offer": (0, 0, 1.5), "offers": (0, 0, 1.5), "discount": (0, 0, 2), "price": (0, 0, 1),
+    "buy": (0, 0, 1.5), "order": (0, 0, 1), "shop": (0, 0, 1), "deal": (0, 0, 1.5), "deals": (0, 0, 1.5),
+    "free": (0, 0, 1), "cashback": (0, 0, 2), "coupon": (0, 0, 2), "promo": (0, 0, 2), "rs": (0, 0, 1),
+    "inr": (0, 0, 1), "₹": (0, 0, 1), "emi": (0, 0, 1.5), "sponsored": (0, 0, 2), "limited": (0, 0, 0.5),
+    "call now": (0, 0, 2), "dm for": (0, 0, 2), "for sale": (0, 0, 2), "limited offer": (0, 0, 2),
+    "book now": (0, 0, 2), "whatsapp me": (0, 0, 1.5), "click here": (0, 0, 2), "register now": (0, 0, 1.5),
+}
+
+# A negation swaps the positive and negative weights of the word that follows it
+NEGATIONS = frozenset({"not", "no", "never", "dont", "don't", "didnt", "didn't", "isnt", "isn't",
+                       "wasnt", "wasn't", "cant", "can't", "wont", "won't", "nahi", "nahin"})
+
+STOPWORDS = frozenset("""
+a an the and or but if of to in on at for from by with about as into is are was were be been being am
+i me my we our you your he she it its they them their this that these those there here what which who
+whom when where why how all any both each few more most other some such only own same so than too very
+can will just should now also have has had do does did get got please ok okay yes yeah hi hello hey
+pls plz u ur im i'm it's dont don't not no will would could also one two like good thanks thank
+hai hain ka ki ke ko se bhi aur ye yeh wo woh kya tha thi
+""".split())
+
+TOKEN_PATTERN = re.compile(r"[₹]|[\w']+")
+
+
+def tokenize(message):
+    return TOKEN_PATTERN.findall(str(message).lower())
+
+
+class SentimentAnalyzer(ABC):
+    """A sentiment/topic backend. analyze() returns the dict shape above, or None on failure."""
+
+    name = "base"
+
+    @abstractmethod
+    def analyze(self, messages):
+        ...
+
+
+class LexiconAnalyzer(SentimentAnalyzer):
+    """Offline lexicon/n-gram scorer, vectorized over a whole batch of messages."""
+
+    name = "lexicon"
+
+    def __init__(self, lexicon=LEXICON, top_topics=10, commercial_threshold=1.5):
+        self.top_topics = top_topics
+        self.commercial_threshold = commercial_threshold
+        self._term_ids = {term: index for index, term in enumerate(lexicon)}
+        self._weights = np.array([lexicon[term] for term in lexicon], dtype=np.float32)
+
+    def _extract(self, messages):
+        """Flatten every message's lexicon hits into parallel (message, term, negated) arrays."""
+        message_index, term_index, negated = [], [], []
+        topic_counts = {}
+        term_ids = self._term_ids
+        for position, message in enumerate(messages):
+            tokens = tokenize(message)
+            seen_topics = set()
+            previous = None
+            for i, token in enumerate(tokens):
+                term = term_ids.get(token)
+                if term is not None:
+                    message_index.append(position)
+                    term_index.append(term)
+                    negated.append(previous in NEGATIONS)
+                if i:
+                    bigram = term_ids.get(f"{previous} {token}")
+                    if bigram is not None:
+                        message_index.append(position)
+                        term_index.append(bigram)
+                        negated.append(False)
+                if token not in STOPWORDS and len(token) > 2 and not token.isdigit():
+                    seen_topics.add(token)
+                previous = token
+            # Topic frequency is the number of messages mentioning the word
+            for token in seen_topics:
+                topic_counts[token] = topic_counts.get(token, 0) + 1
+        return (np.array(message_index, dtype=np.int64), np.array(term_index, dtype=np.int64),
+                np.array(negated, dtype=bool), topic_counts)
+
+    def score(self, messages):
+        """Per-message (positive, negative, commercial) scores as an (n, 3) array, plus topic counts."""
+        message_index, term_index, negated, topic_counts = self._extract(messages)
+        scores = np.zeros((len(messages), len(SENTIMENT_CLASSES)), dtype=np.float32)
+        if len(term_index):
+            weights = self._weights[term_index]
+            # Negated terms swap their positive and negative weights
+            weights[negated] = weights[negated][:, [1, 0, 2]]
+            np.add.at(scores, message_index, weights)
+        return scores, topic_counts
+
+    def classify(self, scores):
+        """Label per message: 0 Positive, 1 Negative, 2 Commercial, 3 Neutral."""
+        positive, negative, commercial = scores[:, 0], scores[:, 1], scores[:, 2]
+        labels = np.full(len(scores), 3, dtype=np.int8)
+        labels[(positive > negative) & (positive > 0)] = 0
+        labels[(negative > positive) & (negative > 0)] = 1
+        is_commercial = (commercial >= self.commercial_threshold) & (commercial >= np.maximum(positive, negative))
+        labels[is_commercial] = 2
+        return labels
+
+    def analyze(self, messages):
+        messages = [message for message in messages if message]
+        if not messages:
+            return {"sentiment_data": {"Positive": 0, "Neutral": 0, "Negative": 0, "Commercial": 0}, "topic_data": [],
+                    "analyzer": self.name}
+
+        scores, topic_counts = self.score(messages)
+        counts = np.bincount(self.classify(scores), minlength=4)
+
+        topics = sorted(topic_counts.items(), key=lambda item: (-item[1], item[0]))[:self.top_topics]
+        return {
+            "sentiment_data": {
+                "Positive": int(counts[0]),
+                "Neutral": int(counts[3]),
+                "Negative": int(counts[1]),
+                "Commercial": int(counts[2]),
+            },
+            "topic_data": [{"topic": topic, "frequency": frequency} for topic, frequency in topics],
+            "analyzer": self.name,
+        }
+
+
+class FallbackAnalyzer(SentimentAnalyzer):
+    """
+    Use `primary`, falling back to `fallback` when it fails. Groups with at least
+    `fallback_above` messages go straight to the fallback (0 disables that).
+    """
+
+    def __init__(self, primary, fallback, fallback_above=0):
+        self.primary = primary
+        self.fallback = fallback
+        self.fallback_above = fallback_above
+        self.name = f"{primary.name}+{fallback.name}"
+
+    def analyze(self, messages):
+        if self.fallback_above and len(messages) >= self.fallback_above:
+            return self.fallback.analyze(messages)
+        result = self.primary.analyze(messages)
+        if result is None:
+            logging.warning(f"{self.primary.name} analyzer failed for {len(messages)} messages; using {self.fallback.name}")
+            return self.fallback.analyze(messages)
+        return result
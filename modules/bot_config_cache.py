@@ -0,0 +1,76 @@
+"""
+Per-tenant cache of bot configurations with version counters.
+
+Bot configs are read on every /bot_details/get_bot_config call but change
+rarely, so the BotConfigResponse built for a tenant is kept and handed out
+again until the tenant's version moves. Every write path bumps the version:
+store/update/delete of a config and reassigning a group's bot bump the
+config version, and writes to whatsapp_bot_logs bump the log version, since
+the response carries each bot's latest log lines.
+
+Readers note the version before loading and store the result under it, so a
+write that lands while a load is in flight makes that result stale instead of
+caching it under the new version. Compiled spam matchers (modules/spam_matcher.py)
+follow the config version only, so a burst of bot log writes doesn't force
+recompiling them.
+
+Versions are per process; the TTL bounds how long a write made by another
+worker can go unseen.
+"""
+import threading
+
+from modules.config.cache import bot_config_cache_config
+from modules.dashboard_cache import LRUCache
+
+
+class BotConfigCache:
+    def __init__(self, ttl, max_tenants, max_bots):
+        self.ttl = ttl
+        self._cache = LRUCache(max_tenants, max_bots)  # Entry size is the tenant's bots plus log rows
+        self._versions = {}   # tenant -> [config version, log version]
+        self._lock = threading.Lock()
+        self._counters = {"hits": 0, "misses": 0, "config_bumps": 0, "log_bumps": 0}
+
+    def version(self, tenant_id):
+        with self._lock:
+            return tuple(self._versions.get(tenant_id, (0, 0)))
+
+    def config_version(self, tenant_id):
+        return self.version(tenant_id)[0]
+
+    def _bump(self, tenant_id, slot, counter):
+        with self._lock:
+            versions = self._versions.setdefault(tenant_id, [0, 0])
+            versions[slot] += 1
+            self._counters[counter] += 1
+
+    def bump(self, tenant_id):
+        """A bot config for the tenant was created, changed, deleted or reassigned."""
+        self._bump(tenant_id, 0, "config_bumps")
+
+    def bump_logs(self, tenant_id):
+        """Bot log rows were written for the tenant."""
+        self._bump(tenant_id, 1, "log_bumps")
+
+    def get(self, tenant_id, load, size=len):
+        """The cached value for the tenant if still current, otherwise load() under the current version."""
+        version = self.version(tenant_id)
+        entry = self._cache.get(tenant_id)
+        if entry is not None and entry[0] == version:
+            with self._lock:
+                self._counters["hits"] += 1
+            return entry[1]
+
+        with self._lock:
+            self._counters["misses"] += 1
+        value = load()
+        self._cache.set(tenant_id, (version, value), max(1, size(value)), self.ttl)
+        return value
+
+    def stats(self):
+        with self._lock:
+            counters = dict(self._counters)
+        return {**counters, "tenants": len(self._cache), "bots": self._cache.size_bytes}
+
+
+bot_configs = BotConfigCache(**bot_config_cache_config)
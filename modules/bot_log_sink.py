@@ -0,0 +1,192 @@
+"""
+Buffered writer for whatsapp_bot_logs.
+
+Bot actions arrive in bursts during spam waves; writing every log row in its
+own transaction would put one round trip and one commit per warning on the
+database exactly when it is busiest. submit() only appends rows to an
+in-memory buffer, and a background thread flushes them with COPY once
+batch_size rows are waiting or the oldest has waited flush_interval seconds.
+
+The buffer holds at most max_buffered rows. When it is full, the overflow
+policy decides:
+
+- "block": the submitting thread waits up to block_timeout for the flusher to
+  make room, then drops its rows (the caller slows down instead of memory
+  growing)
+- "drop_oldest": the oldest buffered rows make room for the new ones
+- "drop_newest": the new rows are dropped
+
+A batch whose flush fails is put back at the front of the buffer and retried
+up to retry_limit times. Dropped rows are counted in stats(). stop() flushes
+whatever is buffered before returning, so a clean shutdown loses nothing.
+"""
+import csv
+import io
+import logging
+import threading
+import time
+from collections import deque
+
+from modules.bot_config_cache import bot_configs
+from modules.config.bot_logs import bot_log_sink_config
+from modules.db import get_connection
+
+COLUMNS = ("bot_id", "message", "action", "phone_or_name", "group_name", "timestamp", "tenant_id")
+COPY_SQL = f"COPY whatsapp_bot_logs ({', '.join(COLUMNS)}) FROM STDIN WITH (FORMAT csv)"
+OVERFLOW_POLICIES = ("block", "drop_oldest", "drop_newest")
+
+
+def write_bot_logs(rows):
+    """COPY (bot_id, message, action, phone_or_name, group_name, timestamp, tenant_id) rows in one transaction."""
+    buffer = io.StringIO()
+    # csv writes None as an unquoted empty field, which COPY reads back as NULL
+    csv.writer(buffer).writerows(rows)
+    buffer.seek(0)
+    with get_connection() as conn, conn.cursor() as cursor:
+        cursor.copy_expert(COPY_SQL, buffer)
+        conn.commit()
+    # get_bot_config responses carry each bot's latest logs
+    for tenant_id in {row[6] for row in rows}:
+        bot_configs.bump_logs(tenant_id)
+
+
+class BotLogSink:
+    def __init__(self, batch_size, flush_interval, max_buffered, overflow, block_timeout, retry_limit, writer=write_bot_logs):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"overflow must be one of {', '.join(OVERFLOW_POLICIES)}")
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_buffered = max_buffered
+        self.overflow = overflow
+        self.block_timeout = block_timeout
+        self.retry_limit = retry_limit
+        self._writer = writer
+        self._buffer = deque()   # (row, failed flushes)
+        self._oldest = None      # monotonic time the oldest buffered row arrived
+        self._blocked = 0        # Submitters waiting for room; the flusher doesn't wait for a full batch then
+        self._condition = threading.Condition()
+        self._thread = None
+        self._stopping = False
+        self._counters = {"submitted": 0, "written": 0, "dropped": 0, "flushes": 0, "failed_flushes": 0, "blocked": 0}
+
+    def start(self):
+        with self._condition:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stopping = False
+            self._thread = threading.Thread(target=self._run, name="bot-log-sink", daemon=True)
+            self._thread.start()
+
+    def submit(self, rows):
+        """Buffer rows for writing. Returns how many were accepted; the rest were dropped by the overflow policy."""
+        if not rows:
+            return 0
+        if self._thread is None:
+            self.start()  # Scripts and workers that never ran the startup hook
+        with self._condition:
+            self._counters["submitted"] += len(rows)
+            room = self.max_buffered - len(self._buffer)
+            if room < len(rows):
+                if self.overflow == "block":
+                    self._counters["blocked"] += 1
+                    self._blocked += 1
+                    self._condition.notify_all()
+                    deadline = time.monotonic() + self.block_timeout
+                    try:
+                        while self.max_buffered - len(self._buffer) < len(rows) and not self._stopping:
+                            remaining = deadline - time.monotonic()
+                            if remaining <= 0:
+                                break
+                            self._condition.wait(remaining)
+                    finally:
+                        self._blocked -= 1
+                    room = self.max_buffered - len(self._buffer)
+                elif self.overflow == "drop_oldest":
+                    evict = min(len(rows) - room, len(self._buffer))
+                    for _ in range(evict):
+                        self._buffer.popleft()
+                    self._counters["dropped"] += evict
+                    room += evict
+            if room >= len(rows):
+                accepted = rows
+            elif self.overflow == "drop_oldest":
+                accepted = rows[len(rows) - max(0, room):]  # More rows than the whole buffer: keep the newest
+            else:
+                accepted = rows[:max(0, room)]
+            self._counters["dropped"] += len(rows) - len(accepted)
+            if accepted:
+                if not self._buffer:
+                    self._oldest = time.monotonic()
+                self._buffer.extend((row, 0) for row in accepted)
+                if len(self._buffer) >= self.batch_size:
+                    self._condition.notify_all()
+        if len(accepted) < len(rows):
+            logging.warning(f"Bot log buffer full; dropped {len(rows) - len(accepted)} rows")
+        return len(accepted)
+
+    def _take_batch(self):
+        # Caller holds the condition
+        batch = [self._buffer.popleft() for _ in range(min(self.batch_size, len(self._buffer)))]
+        self._oldest = time.monotonic() if self._buffer else None
+        self._condition.notify_all()  # Room for blocked submitters
+        return batch
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._stopping and not (self._blocked and self._buffer) and (
+                    len(self._buffer) < self.batch_size
+                    and (self._oldest is None or time.monotonic() - self._oldest < self.flush_interval)
+                ):
+                    timeout = None if self._oldest is None else self.flush_interval - (time.monotonic() - self._oldest)
+                    self._condition.wait(timeout)
+                if self._stopping and not self._buffer:
+                    return
+                batch = self._take_batch()
+            self._flush(batch)
+
+    def _flush(self, batch):
+        try:
+            self._writer([row for row, _ in batch])
+        except Exception as e:
+            logging.error(f"Error writing {len(batch)} bot log rows: {e}")
+            retry = [(row, failures + 1) for row, failures in batch if failures + 1 < self.retry_limit]
+            with self._condition:
+                self._counters["failed_flushes"] += 1
+                self._counters["dropped"] += len(batch) - len(retry)
+                # Retried first, ahead of newer rows, unless they no longer fit
+                room = max(0, self.max_buffered - len(self._buffer))
+                self._counters["dropped"] += max(0, len(retry) - room)
+                self._buffer.extendleft(reversed(retry[:room]))
+                if self._buffer and self._oldest is None:
+                    self._oldest = time.monotonic()
+                stopping = self._stopping
+            if not stopping:
+                time.sleep(min(self.flush_interval, 1.0))  # Don't spin against a database that is down
+            return
+        with self._condition:
+            self._counters["flushes"] += 1
+            self._counters["written"] += len(batch)
+
+    def stop(self, timeout=30):
+        """Flush everything buffered, then stop the flusher thread."""
+        with self._condition:
+            self._stopping = True
+            self._condition.notify_all()
+            thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+        self._thread = None
+
+    def stats(self):
+        with self._condition:
+            return {
+                **self._counters,
+                "buffered": len(self._buffer),
+                "max_buffered": self.max_buffered,
+                "overflow": self.overflow,
+                "running": self._thread is not None and self._thread.is_alive(),
+            }
+
+
+bot_log_sink = BotLogSink(**bot_log_sink_config)
@@ -0,0 +1,6 @@
+import os
+
+# Operational endpoints (see router/admin.py)
+admin_config = {
+    'token': os.getenv("ADMIN_TOKEN"),  # Bearer token for the admin routes; they answer 404 while unset
+}
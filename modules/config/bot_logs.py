@@ -0,0 +1,11 @@
+import os
+
+# Buffered writer for whatsapp_bot_logs (see modules/bot_log_sink.py)
+bot_log_sink_config = {
+    'batch_size': 500,          # Flush as soon as this many rows are buffered
+    'flush_interval': 1.0,      # Seconds a row may wait for a batch to fill
+    'max_buffered': 50000,      # Rows held in memory at most
+    'overflow': os.getenv("BOT_LOG_OVERFLOW", "block"),  # "block", "drop_oldest" or "drop_newest" when full
+    'block_timeout': 2.0,       # Seconds "block" waits for room before dropping the new rows
+    'retry_limit': 3,           # Failed flushes of a batch before its rows are dropped
+}
@@ -0,0 +1,31 @@
+import os
+
+# Dashboard result cache configuration (see modules/dashboard_cache.py)
+dashboard_cache_config = {
+    'ttl': 300,                          # Seconds before a cached dashboard is recomputed regardless
+    'max_entries': 2000,                 # Tenants kept in the in-process LRU
+    'max_bytes': 64 * 1024 * 1024,       # Serialized size budget for the in-process LRU
+    'redis_url': os.getenv("REDIS_URL"), # Optional shared backend for entries; generations live in Postgres without it
+}
+
+# Persistent cache of GPT sentiment/topic results (see modules/gpt_cache.py)
+gpt_cache_config = {
+    'backend': os.getenv("GPT_CACHE_BACKEND", "sqlite"),          # "sqlite", "postgres" or "none"
+    'sqlite_path': os.getenv("GPT_CACHE_PATH", "gpt_cache.sqlite3"),
+    'max_bytes': 256 * 1024 * 1024,      # Stored result size budget; least recently used entries go first
+    'evict_every': 100,                  # Check the size budget once per this many writes
+}
+
+# Compiled spam keyword matchers per bot (see modules/spam_matcher.py)
+spam_matcher_cache_config = {
+    'ttl': 60,                  # Seconds before a matcher is rebuilt from the database regardless
+    'max_bots': 1000,           # Bots kept compiled
+    'max_patterns': 500000,     # Keyword budget across all compiled bots
+}
+
+# Per-tenant bot configuration cache (see modules/bot_config_cache.py)
+bot_config_cache_config = {
+    'ttl': 300,             # Seconds before a tenant's configs are reread regardless (writes on other workers)
+    'max_tenants': 5000,    # Tenants kept in the in-process LRU
+    'max_bots': 100000,     # Bot configs plus log rows budget across all cached tenants
+}
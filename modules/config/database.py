@@ -1,3 +1,5 @@
+import os
+
 # Database connection configuration
 conn_config = {
     'dbname': 'nurenpostgres_Whatsapp',
@@ -6,4 +8,40 @@ conn_config = {
     'host': 'nurenaistore.postgres.database.azure.com',
     'port': '5432',
     'sslmode': 'require'
-}
\ No newline at end of file
+}
+
+# Connection pool configuration (see modules/db.py)
+pool_config = {
+    'minconn': 1,                  # Connections opened eagerly when the pool is created
+    'maxconn': 20,                 # Hard upper bound on open connections per worker process
+    'checkout_timeout': 30,        # Seconds to wait for a free connection before giving up
+    'max_lifetime': 30 * 60,       # Recycle connections older than this (seconds)
+    'health_check_after': 60,      # Ping connections that sat idle longer than this (seconds)
+}
+
+# Async (asyncpg) pool configuration (see modules/db_async.py)
+async_pool_config = {
+    'min_size': 1,
+    'max_size': 20,
+    'max_inactive_connection_lifetime': 300,   # Close connections idle longer than this (seconds)
+    'command_timeout': 60,
+}
+
+# Threads available to run_sync() for blocking code called from async endpoints.
+# Kept equal to pool_config['maxconn'] so offloaded calls never queue on the pool.
+executor_workers = pool_config['maxconn']
+
+# Per-statement timing (see modules/query_stats.py)
+query_stats_config = {
+    'enabled': os.getenv("QUERY_STATS", "1").lower() not in ("0", "false", "no"),
+    'slow_query_ms': float(os.getenv("SLOW_QUERY_MS", "500")),  # Statements slower than this are logged with their plan
+    'explain_interval': 300,       # Seconds before the same slow statement is EXPLAINed again
+    'max_statements': 2000,        # Distinct (route, statement) pairs tracked; the rest are counted under "other"
+}
+
+# Schema migrations applied at startup (see modules/schema.py)
+migration_config = {
+    'lock_wait': 60,               # Seconds to wait for another worker's migrations before starting without them
+    # 'background': build CONCURRENTLY indexes on a thread after startup; 'manual': leave them to python -m modules.schema
+    'index_builds': os.getenv("SCHEMA_INDEX_BUILDS", "background"),
+}
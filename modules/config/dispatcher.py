@@ -0,0 +1,16 @@
+import os
+
+# Scheduled message dispatcher configuration (see modules/dispatcher.py)
+dispatcher_config = {
+    'enabled': os.getenv("DISPATCHER_ENABLED", "").lower() in ("1", "true", "yes"),  # Off unless asked for
+    'sender': os.getenv("DISPATCHER_SENDER"),  # "package.module:ClassName" of a MessageSender; logs only when unset
+    'poll_interval': 15,        # Seconds between claim passes (new rows saved by this worker wake it sooner)
+    'lookahead': 60,            # Claim rows due within this many seconds and hold them in the timer heap
+    'batch_size': 100,          # Rows claimed per statement
+    'max_held': 1000,           # Stop claiming while this many rows are waiting in memory
+    'claim_timeout': 600,       # Seconds before another worker may take over an abandoned claim
+    'max_lateness': 3600,       # Seconds past schedule_time after which a pending row is expired instead of sent
+    'max_attempts': 3,          # Send attempts before a message is marked failed
+    'send_workers': 4,          # Messages sent in parallel
+    'timezone': 'Asia/Kolkata', # schedule_time is stored as naive local time in this zone
+}
@@ -0,0 +1,11 @@
+import os
+
+# Per-sender message rate limiting for BotConfig.messageLimit (see modules/rate_limiter.py)
+rate_limit_config = {
+    'window_seconds': 60,   # messageLimit is the number of messages a sender may post per window in one group
+    'shards': 64,           # Independently locked partitions of the counter table (power of two)
+    'idle_ttl': 600,        # Seconds without a message before a sender's counters are dropped
+    'sweep_interval': 30,   # Seconds between idle sweeps of a shard
+    'default_action': 'warn',  # Action logged when the bot has no "messageLimit" entry in spamKeywordsActions
+    'redis_url': os.getenv("REDIS_URL"),  # Shared counters so the limit holds across workers; per worker when unset
+}
@@ -0,0 +1,244 @@
+"""
+Tenant-scoped cache for /dashboard results.
+
+The dashboard only changes when sentiment rows are written (or messages
+arrive), yet it used to be recomputed on every page load. Results are kept in
+an in-process LRU bounded by entry count and serialized size, optionally
+backed by Redis so several workers share entries.
+
+Invalidation is generation based: every tenant has a counter that
+invalidate() bumps, and entries are stored under the generation they were
+computed for. The counter is shared by every worker, so an invalidation on
+one worker makes every other worker's local copy stale on its next read: it
+lives in Redis when one is configured, otherwise in
+whatsapp_dashboard_generations (one primary key lookup per dashboard read,
+still far cheaper than the four dashboard queries).
+"""
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from modules.config.cache import dashboard_cache_config
+from modules.db import get_connection
+from modules.db_async import async_connection, run_sync
+
+
+class LRUCache:
+    """Thread-safe LRU with per-entry TTL, bounded by entry count and total size."""
+
+    def __init__(self, max_entries, max_bytes):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()   # key -> (expires_at, size, value)
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, size, value = entry
+            if expires_at <= time.monotonic():
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, size, ttl):
+        if size > self.max_bytes:
+            return  # Never let one tenant evict everybody else
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (time.monotonic() + ttl, size, value)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+
+    def delete(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+    def _remove(self, key):
+        _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def size_bytes(self):
+        return self._bytes
+
+
+class RedisBackend:
+    def __init__(self, url, prefix="dashboard"):
+        import redis  # Only needed when a shared backend is configured
+
+        self._client = redis.Redis.from_url(url, socket_timeout=0.5, socket_connect_timeout=0.5)
+        self._prefix = prefix
+
+    def generation(self, tenant_id):
+        value = self._client.get(f"{self._prefix}:gen:{tenant_id}")
+        return int(value) if value else 0
+
+    def bump_generation(self, tenant_id):
+        return self._client.incr(f"{self._prefix}:gen:{tenant_id}")
+
+    def get(self, tenant_id, generation):
+        return self._client.get(f"{self._prefix}:data:{tenant_id}:{generation}")
+
+    def set(self, tenant_id, generation, payload, ttl):
+        self._client.set(f"{self._prefix}:data:{tenant_id}:{generation}", payload, ex=ttl)
+
+
+class PostgresGenerations:
+    """Tenant generations in whatsapp_dashboard_generations, for deployments without Redis."""
+
+    def generation(self, tenant_id):
+        with get_connection() as conn, conn.cursor() as cursor:
+            cursor.execute("SELECT generation FROM whatsapp_dashboard_generations WHERE tenant_id = %s", (tenant_id,))
+            row = cursor.fetchone()
+            conn.commit()
+        return row[0] if row else 0
+
+    async def ageneration(self, tenant_id):
+        # The dashboard route reads it on the asyncpg pool, without a hop to the executor
+        async with async_connection() as conn:
+            generation = await conn.fetchval(
+                "SELECT generation FROM whatsapp_dashboard_generations WHERE tenant_id = $1", tenant_id)
+        return generation or 0
+
+    def bump_generation(self, tenant_id):
+        with get_connection() as conn, conn.cursor() as cursor:
+            cursor.execute("""
+                INSERT INTO whatsapp_dashboard_generations (tenant_id, generation, updated_at)
+                VALUES (%s, 1, now())
+                ON CONFLICT (tenant_id)
+                DO UPDATE SET generation = whatsapp_dashboard_generations.generation + 1, updated_at = now()
+                RETURNING generation;
+            """, (tenant_id,))
+            generation = cursor.fetchone()[0]
+            conn.commit()
+        return generation
+
+
+class DashboardCache:
+    def __init__(self, ttl, max_entries, max_bytes, redis_url=None):
+        self.ttl = ttl
+        self._local = LRUCache(max_entries, max_bytes)
+        self._lock = threading.Lock()
+        self._backend = RedisBackend(redis_url) if redis_url else None
+        self._generations = self._backend or PostgresGenerations()
+        self._counters = {"hits": 0, "shared_hits": 0, "misses": 0, "invalidations": 0, "backend_errors": 0}
+
+    def _count(self, name):
+        with self._lock:
+            self._counters[name] += 1
+
+    def generation(self, tenant_id):
+        """Current generation for a tenant; read it before computing so set() can detect races."""
+        try:
+            return self._generations.generation(tenant_id)
+        except Exception as e:
+            logging.warning(f"Dashboard cache backend unavailable: {e}")
+            self._count("backend_errors")
+            return None
+
+    def get(self, tenant_id):
+        return self._get(tenant_id, self.generation(tenant_id))
+
+    def _get(self, tenant_id, generation):
+        if generation is None:
+            self._count("misses")
+            return None
+
+        entry = self._local.get(tenant_id)
+        if entry is not None and entry[0] == generation:
+            self._count("hits")
+            return entry[1]
+
+        if self._backend is not None:
+            try:
+                payload = self._backend.get(tenant_id, generation)
+            except Exception as e:
+                logging.warning(f"Dashboard cache backend unavailable: {e}")
+                self._count("backend_errors")
+                payload = None
+            if payload is not None:
+                value = json.loads(payload)
+                self._local.set(tenant_id, (generation, value), len(payload), self.ttl)
+                self._count("shared_hits")
+                return value
+
+        self._count("misses")
+        return None
+
+    def set(self, tenant_id, value, generation):
+        """Store a result computed while `generation` was current. Stale results are dropped."""
+        self._set(tenant_id, value, generation, self.generation(tenant_id))
+
+    def _set(self, tenant_id, value, generation, current):
+        if generation is None or generation != current:
+            return
+        payload = json.dumps(value, default=str)
+        self._local.set(tenant_id, (generation, value), len(payload), self.ttl)
+        if self._backend is not None:
+            try:
+                self._backend.set(tenant_id, generation, payload, self.ttl)
+            except Exception as e:
+                logging.warning(f"Dashboard cache backend unavailable: {e}")
+                self._count("backend_errors")
+
+    def invalidate(self, tenant_id):
+        self._local.delete(tenant_id)
+        self._count("invalidations")
+        try:
+            self._generations.bump_generation(tenant_id)
+        except Exception as e:
+            logging.error(f"Failed to invalidate shared dashboard cache for tenant {tenant_id}: {e}")
+            self._count("backend_errors")
+
+    # Async variants for the event loop: Redis calls are blocking and go to the executor,
+    # Postgres generations are read on the asyncpg pool, local lookups need neither
+    async def aget(self, tenant_id):
+        if self._backend is not None:
+            return await run_sync(self.get, tenant_id)
+        return self._get(tenant_id, await self.ageneration(tenant_id))
+
+    async def ageneration(self, tenant_id):
+        if self._backend is not None:
+            return await run_sync(self.generation, tenant_id)
+        try:
+            return await self._generations.ageneration(tenant_id)
+        except Exception as e:
+            logging.warning(f"Dashboard cache generations unavailable: {e}")
+            self._count("backend_errors")
+            return None
+
+    async def aset(self, tenant_id, value, generation):
+        if self._backend is not None:
+            return await run_sync(self.set, tenant_id, value, generation)
+        return self._set(tenant_id, value, generation, await self.ageneration(tenant_id))
+
+    def stats(self):
+        with self._lock:
+            counters = dict(self._counters)
+        lookups = counters["hits"] + counters["shared_hits"] + counters["misses"]
+        return {
+            **counters,
+            "hit_ratio": ((counters["hits"] + counters["shared_hits"]) / lookups) if lookups else 0.0,
+            "entries": len(self._local),
+            "bytes": self._local.size_bytes,
+            "max_entries": self._local.max_entries,
+            "max_bytes": self._local.max_bytes,
+            "shared_backend": self._backend is not None,
+        }
+
+
+dashboard_cache = DashboardCache(**dashboard_cache_config)
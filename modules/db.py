@@ -0,0 +1,296 @@
+"""
+Shared PostgreSQL connection pool.
+
+Every store function used to open its own TLS connection with
+psycopg2.connect(**conn_config) and close it again, so the SSL handshake to
+Azure cost more than the queries themselves. The pool below keeps a bounded
+set of connections per worker process and hands them out through the
+get_connection() context manager:
+
+    with get_connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute(...)
+        conn.commit()
+
+Connections are health-checked when they have been idle for a while,
+recycled after max_lifetime, and rolled back before going back to the pool
+so a forgotten commit never leaks an open transaction to the next caller.
+"""
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import psycopg2
+from psycopg2 import extensions
+
+from modules.config.database import conn_config, pool_config
+from modules.query_stats import TimedCursor
+
+
+class PoolTimeout(psycopg2.OperationalError):
+    """Raised when no connection becomes available within checkout_timeout."""
+
+
+class _Waiter:
+    __slots__ = ("ready", "handoff")
+
+    def __init__(self):
+        self.ready = False
+        self.handoff = None
+
+
+class ConnectionPool:
+    def __init__(self, dsn_config, minconn=1, maxconn=20, checkout_timeout=30,
+                 max_lifetime=1800, health_check_after=60):
+        if maxconn < 1 or minconn > maxconn:
+            raise ValueError("Invalid pool bounds: minconn must be <= maxconn and maxconn >= 1")
+
+        self.dsn_config = dsn_config
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.checkout_timeout = checkout_timeout
+        self.max_lifetime = max_lifetime
+        self.health_check_after = health_check_after
+
+        self._cond = threading.Condition()
+        self._idle = deque()        # (conn, created_at, last_used) - LIFO keeps warm connections hot
+        self._in_use = {}           # id(conn) -> created_at
+        self._opening = 0           # Slots reserved for connections being opened
+        self._waiters = deque()     # Callers blocked in getconn(), served first come first served
+        self._closed = False
+
+        # Counters exposed through stats()
+        self._counters = {
+            "connections_created": 0,
+            "connections_recycled": 0,
+            "connections_discarded": 0,
+            "health_checks_failed": 0,
+            "checkouts": 0,
+            "checkout_timeouts": 0,
+            "total_wait_time": 0.0,
+        }
+
+        for _ in range(minconn):
+            conn = self._connect()
+            now = time.monotonic()
+            self._idle.append((conn, now, now))
+
+    def _connect(self):
+        # Every cursor on a pooled connection reports its statements to query_stats
+        conn = psycopg2.connect(**self.dsn_config, cursor_factory=TimedCursor)
+        with self._cond:
+            self._counters["connections_created"] += 1
+        return conn
+
+    def _close_quietly(self, conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _is_healthy(self, conn, created_at, last_used):
+        """Return False if the connection should not be handed out again."""
+        now = time.monotonic()
+        if conn.closed:
+            return False
+        if now - created_at > self.max_lifetime:
+            with self._cond:
+                self._counters["connections_recycled"] += 1
+            return False
+        if now - last_used > self.health_check_after:
+            try:
+                with conn.cursor() as cursor:
+                    cursor.execute("SELECT 1")
+                conn.rollback()
+            except Exception as e:
+                logging.warning(f"Discarding unhealthy pooled connection: {e}")
+                with self._cond:
+                    self._counters["health_checks_failed"] += 1
+                return False
+        return True
+
+    def getconn(self, timeout=None):
+        timeout = self.checkout_timeout if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+        started = time.monotonic()
+
+        while True:
+            candidate = None
+            with self._cond:
+                if self._closed:
+                    raise psycopg2.InterfaceError("Connection pool is closed")
+
+                if self._idle and not self._waiters:
+                    # Reserve the slot now, check health outside the lock
+                    candidate = self._idle.pop()
+                    self._in_use[id(candidate[0])] = candidate[1]
+                elif len(self._in_use) + self._opening < self.maxconn and not self._waiters:
+                    self._opening += 1
+                else:
+                    # Queue up; putconn hands connections (or freed slots) to waiters in FIFO order
+                    waiter = _Waiter()
+                    self._waiters.append(waiter)
+                    while not waiter.ready:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            self._waiters.remove(waiter)
+                            self._counters["checkout_timeouts"] += 1
+                            raise PoolTimeout(
+                                f"Timed out after {timeout}s waiting for a database connection "
+                                f"({self.maxconn} in use)"
+                            )
+                        self._cond.wait(remaining)
+                    if self._closed:
+                        raise psycopg2.InterfaceError("Connection pool is closed")
+                    candidate = waiter.handoff
+
+            if candidate is not None:
+                conn, created_at, last_used = candidate
+                if self._is_healthy(conn, created_at, last_used):
+                    return self._checkout(conn, started)
+                self._close_quietly(conn)
+                with self._cond:
+                    self._in_use.pop(id(conn), None)
+                    self._counters["connections_discarded"] += 1
+                    # The slot is free again; open a replacement in it
+                    self._opening += 1
+
+            # Open a new connection in the slot reserved above
+            try:
+                conn = self._connect()
+            except Exception:
+                with self._cond:
+                    self._opening -= 1
+                    self._release_slot()
+                raise
+            with self._cond:
+                self._opening -= 1
+                self._in_use[id(conn)] = time.monotonic()
+            return self._checkout(conn, started)
+
+    def _checkout(self, conn, started):
+        with self._cond:
+            self._counters["checkouts"] += 1
+            self._counters["total_wait_time"] += time.monotonic() - started
+        return conn
+
+    def _release_slot(self):
+        # Called with the lock held when a slot frees up without a connection to hand over
+        if self._waiters:
+            waiter = self._waiters.popleft()
+            self._opening += 1
+            waiter.handoff = None
+            waiter.ready = True
+            self._cond.notify_all()
+
+    def putconn(self, conn, discard=False):
+        # Reset the session outside the lock; rollback is a network round-trip
+        if not discard and not conn.closed:
+            try:
+                if conn.info.transaction_status != extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+            except Exception:
+                discard = True
+
+        with self._cond:
+            created_at = self._in_use.pop(id(conn), None)
+            if created_at is None:
+                raise psycopg2.InterfaceError("Connection does not belong to this pool")
+
+            if discard or conn.closed or self._closed:
+                self._counters["connections_discarded"] += 1
+                self._close_quietly(conn)
+                self._release_slot()
+            elif self._waiters:
+                # Hand the connection straight to the longest waiting caller
+                waiter = self._waiters.popleft()
+                self._in_use[id(conn)] = created_at
+                waiter.handoff = (conn, created_at, time.monotonic())
+                waiter.ready = True
+                self._cond.notify_all()
+            else:
+                self._idle.append((conn, created_at, time.monotonic()))
+
+    @contextmanager
+    def connection(self, timeout=None):
+        conn = self.getconn(timeout)
+        discard = False
+        try:
+            yield conn
+        except Exception:
+            # A broken connection must not go back to the pool
+            discard = bool(conn.closed)
+            if not discard:
+                try:
+                    conn.rollback()
+                except Exception:
+                    discard = True
+            raise
+        finally:
+            self.putconn(conn, discard=discard)
+
+    def stats(self):
+        with self._cond:
+            checkouts = self._counters["checkouts"]
+            return {
+                "maxconn": self.maxconn,
+                "minconn": self.minconn,
+                "in_use": len(self._in_use) + self._opening,
+                "idle": len(self._idle),
+                "waiting": len(self._waiters),
+                "connections_created": self._counters["connections_created"],
+                "connections_recycled": self._counters["connections_recycled"],
+                "connections_discarded": self._counters["connections_discarded"],
+                "health_checks_failed": self._counters["health_checks_failed"],
+                "checkouts": checkouts,
+                "checkout_timeouts": self._counters["checkout_timeouts"],
+                "avg_wait_ms": (self._counters["total_wait_time"] / checkouts * 1000) if checkouts else 0.0,
+            }
+
+    def closeall(self):
+        with self._cond:
+            self._closed = True
+            while self._idle:
+                conn, _, _ = self._idle.pop()
+                self._close_quietly(conn)
+            # Wake everybody still waiting so they fail fast instead of timing out
+            while self._waiters:
+                self._waiters.popleft().ready = True
+            self._cond.notify_all()
+
+
+# Process-wide pool, created lazily so importing a module never touches the network
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(conn_config, **pool_config)
+    return _pool
+
+
+@contextmanager
+def get_connection(timeout=None):
+    """Check a connection out of the shared pool for the duration of the block."""
+    with get_pool().connection(timeout) as conn:
+        yield conn
+
+
+def pool_stats():
+    if _pool is None:
+        return {"initialized": False}
+    return {"initialized": True, **_pool.stats()}
+
+
+def close_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.closeall()
+            _pool = None
@@ -0,0 +1,98 @@
+"""
+Async data-access layer for the `async def` endpoints.
+
+Blocking psycopg2 calls inside an `async def` route stall the whole event loop,
+so one slow tenant delays every other request on the worker. Routes should
+either talk to Postgres through the asyncpg pool here:
+
+    async with async_connection() as conn:
+        rows = await conn.fetch("SELECT ... WHERE tenant_id = $1", tenant_id)
+
+or, for store functions that are still synchronous, hand them to the bounded
+executor explicitly:
+
+    result = await run_sync(save_scheduled_message_to_db, data, tenant_id)
+"""
+import asyncio
+import contextvars
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+
+import asyncpg
+
+from modules.config.database import conn_config, async_pool_config, executor_workers
+from modules.query_stats import TimedConnection
+
+_pool = None
+_pool_lock = None
+_executor = None
+
+
+def _connect_kwargs():
+    # Translate the libpq-style conn_config into asyncpg keyword arguments
+    return {
+        "database": conn_config["dbname"],
+        "user": conn_config["user"],
+        "password": conn_config["password"],
+        "host": conn_config["host"],
+        "port": int(conn_config["port"]),
+        "ssl": conn_config.get("sslmode") or None,
+    }
+
+
+async def get_async_pool():
+    global _pool, _pool_lock
+    if _pool is None:
+        if _pool_lock is None:
+            _pool_lock = asyncio.Lock()
+        async with _pool_lock:
+            if _pool is None:
+                _pool = await asyncpg.create_pool(**_connect_kwargs(), **async_pool_config,
+                                                  connection_class=TimedConnection)
+    return _pool
+
+
+@asynccontextmanager
+async def async_connection():
+    """Acquire an asyncpg connection from the shared pool for the duration of the block."""
+    pool = await get_async_pool()
+    async with pool.acquire() as conn:
+        yield conn
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=executor_workers, thread_name_prefix="db-sync")
+    return _executor
+
+
+async def run_sync(func, *args, **kwargs):
+    """Run blocking code on the bounded executor instead of the event loop."""
+    loop = asyncio.get_running_loop()
+    # Carry the caller's context (the route queries are attributed to) into the worker thread
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(get_executor(), functools.partial(context.run, func, *args, **kwargs))
+
+
+def async_pool_stats():
+    if _pool is None:
+        return {"initialized": False}
+    return {
+        "initialized": True,
+        "size": _pool.get_size(),
+        "idle": _pool.get_idle_size(),
+        "min_size": _pool.get_min_size(),
+        "max_size": _pool.get_max_size(),
+    }
+
+
+async def close_async_pool():
+    global _pool, _executor
+    if _pool is not None:
+        await _pool.close()
+        _pool = None
+    if _executor is not None:
+        _executor.shutdown(wait=True)
+        _executor = None
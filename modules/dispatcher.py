@@ -0,0 +1,352 @@
+"""
+Dispatcher for whatsapp_scheduled_messages.
+
+save_scheduled_message_to_db() stores rows with status 'pending'. Every worker
+running the dispatcher:
+
+1. Claims pending rows due within the lookahead window in batches, with
+   FOR UPDATE SKIP LOCKED, so concurrent workers never claim the same row
+   ('pending' -> 'claimed', claimed_by = this worker).
+2. Holds claimed rows in an in-memory heap ordered by schedule_time. A timer
+   thread sleeps until the earliest one is due instead of polling the table.
+3. When rows fall due, re-reads them while moving them to 'sending', which
+   requires the claim to still be ours and picks up edits made since
+   claiming. Then it sends them through the configured MessageSender in
+   rounds of send_workers, writing each round's outcomes in one bulk UPDATE
+   ('sent', back to 'pending' for a retry, or 'failed' after max_attempts)
+   and renewing the claim on the rows still waiting.
+
+Pending rows more than max_lateness past their schedule_time are moved to
+'expired' instead of being claimed: a message that is hours or months late
+(e.g. saved before anything sent scheduled messages) is not worth sending.
+
+Claims abandoned by a dead worker go back to 'pending' after claim_timeout.
+Rows it left in 'sending' may already have gone out, so they are marked
+'failed' rather than retried: a message is never sent twice.
+"""
+import heapq
+import importlib
+import logging
+import os
+import socket
+import threading
+import uuid
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import pytz
+from psycopg2.extras import execute_values
+
+from modules.config.dispatcher import dispatcher_config
+from modules.db import get_connection
+from modules.model.schedule_model import ScheduledMessage
+
+SELECT_COLUMNS = "id, tenant_id, groups, message_type, message_content, schedule_time, media, attempts"
+
+
+class MessageSender(ABC):
+    """Delivers one scheduled message. Raise to report a failure; the message is retried."""
+
+    @abstractmethod
+    def send(self, message: ScheduledMessage) -> None:
+        ...
+
+
+class LoggingSender(MessageSender):
+    """Stand-in sender that only logs what would be sent."""
+
+    def send(self, message: ScheduledMessage) -> None:
+        logging.info(
+            f"[dispatcher] would send {message.message_type} message {message.id} "
+            f"to {', '.join(message.groups)} for tenant {message.tenant_id}"
+        )
+
+
+def load_sender(path):
+    if not path:
+        return LoggingSender()
+    module_name, _, class_name = path.partition(":")
+    return getattr(importlib.import_module(module_name), class_name)()
+
+
+def _to_message(row):
+    id, tenant_id, groups, message_type, content, schedule_time, media, attempts = row
+    return ScheduledMessage(
+        id=id,
+        tenant_id=tenant_id,
+        groups=[group.strip() for group in (groups or "").split(",") if group.strip()],
+        message_type=message_type,
+        content=content,
+        schedule_time=schedule_time,
+        media=media,
+        attempts=attempts or 0,
+    )
+
+
+class ScheduledMessageDispatcher:
+    def __init__(self, enabled, sender, poll_interval, lookahead, batch_size, max_held,
+                 claim_timeout, max_lateness, max_attempts, send_workers, timezone):
+        self.enabled = enabled
+        self.sender_path = sender
+        self.poll_interval = poll_interval
+        self.lookahead = timedelta(seconds=lookahead)
+        self.batch_size = batch_size
+        self.max_held = max_held
+        self.claim_timeout = claim_timeout
+        self.max_lateness = timedelta(seconds=max_lateness)
+        self.max_attempts = max_attempts
+        self.send_workers = send_workers
+        self.timezone = pytz.timezone(timezone)
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+        self._heap = []                  # (schedule_time, id) of claimed rows waiting to fire
+        self._cond = threading.Condition()
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+        self._threads = []
+        self._sender = None
+        self._executor = None
+        self._counters = {"claimed": 0, "sent": 0, "retried": 0, "failed": 0, "expired": 0, "lost": 0, "unrecorded": 0, "recovered": 0, "errors": 0}
+
+    def _count(self, name, amount=1):
+        with self._cond:
+            self._counters[name] += amount
+
+    def now(self):
+        # schedule_time is naive local time, so comparisons happen in the same zone
+        return datetime.now(self.timezone).replace(tzinfo=None)
+
+    # Lifecycle
+
+    def start(self):
+        if not self.enabled or self._threads:
+            return
+        self._sender = load_sender(self.sender_path)
+        self._executor = ThreadPoolExecutor(max_workers=self.send_workers, thread_name_prefix="dispatch-send")
+        self._stopping.clear()
+        self._threads = [
+            threading.Thread(target=self._claim_loop, name="dispatch-claim", daemon=True),
+            threading.Thread(target=self._timer_loop, name="dispatch-timer", daemon=True),
+        ]
+        for thread in self._threads:
+            thread.start()
+        logging.info(f"Scheduled message dispatcher started as {self.worker_id}")
+
+    def stop(self, timeout=10):
+        if not self._threads:
+            return
+        self._stopping.set()
+        self._wake.set()
+        with self._cond:
+            self._cond.notify_all()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+        self._executor.shutdown(wait=True)
+        self._release_claims()
+
+    def wake(self):
+        """Claim right away, e.g. after a message due soon was saved."""
+        if self._threads:
+            self._wake.set()
+
+    # Claiming
+
+    def _claim_loop(self):
+        while not self._stopping.is_set():
+            claimed = 0
+            try:
+                self.recover_stale_claims()
+                with self._cond:
+                    room = self.max_held - len(self._heap)
+                if room > 0:
+                    claimed = self._claim(min(room, self.batch_size))
+            except Exception as e:
+                logging.error(f"Error claiming scheduled messages: {e}")
+                self._count("errors")
+            # A full batch means there may be more due rows; otherwise wait for the next pass
+            if claimed < self.batch_size:
+                self._wake.wait(self.poll_interval)
+                self._wake.clear()
+
+    def _claim(self, limit):
+        now = self.now()
+        with get_connection() as conn, conn.cursor() as cursor:
+            # Too late to be worth sending; these would otherwise all go out at once
+            cursor.execute("""
+                UPDATE whatsapp_scheduled_messages
+                SET status = 'expired', last_error = %(error)s, updated_at = now()
+                WHERE status = 'pending' AND schedule_time < %(cutoff)s;
+            """, {"cutoff": now - self.max_lateness,
+                  "error": f"Not sent: more than {int(self.max_lateness.total_seconds())}s past its schedule_time"})
+            expired = cursor.rowcount
+            cursor.execute("""
+                UPDATE whatsapp_scheduled_messages
+                SET status = 'claimed', claimed_by = %(worker)s, claimed_at = now(), updated_at = now()
+                WHERE id IN (
+                    SELECT id FROM whatsapp_scheduled_messages
+                    WHERE status = 'pending' AND schedule_time <= %(horizon)s
+                    ORDER BY schedule_time
+                    LIMIT %(limit)s
+                    FOR UPDATE SKIP LOCKED
+                )
+                RETURNING id, schedule_time;
+            """, {"worker": self.worker_id, "horizon": now + self.lookahead, "limit": limit})
+            rows = cursor.fetchall()
+            conn.commit()
+
+        if expired:
+            logging.warning(f"Expired {expired} scheduled messages more than {self.max_lateness} overdue")
+            self._count("expired", expired)
+
+        if rows:
+            with self._cond:
+                for id, schedule_time in rows:
+                    heapq.heappush(self._heap, (schedule_time, id))
+                self._counters["claimed"] += len(rows)
+                self._cond.notify()
+        return len(rows)
+
+    def recover_stale_claims(self):
+        with get_connection() as conn, conn.cursor() as cursor:
+            cursor.execute("""
+                UPDATE whatsapp_scheduled_messages
+                SET status = CASE status WHEN 'claimed' THEN 'pending' ELSE 'failed' END,
+                    last_error = CASE status WHEN 'sending' THEN 'worker stopped while sending' ELSE last_error END,
+                    claimed_by = NULL, claimed_at = NULL, updated_at = now()
+                WHERE status IN ('claimed', 'sending')
+                  AND claimed_at < now() - %s * INTERVAL '1 second'
+                RETURNING status;
+            """, (self.claim_timeout,))
+            statuses = [row[0] for row in cursor.fetchall()]
+            conn.commit()
+        if statuses:
+            self._count("recovered", statuses.count("pending"))
+            self._count("lost", statuses.count("failed"))
+            logging.warning(f"Recovered {len(statuses)} abandoned scheduled message claims")
+
+    def _release_claims(self):
+        # Hand rows we claimed but never fired back to other workers
+        try:
+            with get_connection() as conn, conn.cursor() as cursor:
+                cursor.execute("""
+                    UPDATE whatsapp_scheduled_messages
+                    SET status = 'pending', claimed_by = NULL, claimed_at = NULL, updated_at = now()
+                    WHERE status = 'claimed' AND claimed_by = %s;
+                """, (self.worker_id,))
+                conn.commit()
+            with self._cond:
+                self._heap.clear()
+        except Exception as e:
+            logging.error(f"Error releasing scheduled message claims: {e}")
+
+    # Firing
+
+    def _timer_loop(self):
+        while not self._stopping.is_set():
+            with self._cond:
+                if not self._heap:
+                    self._cond.wait(self.poll_interval)
+                    continue
+                delay = (self._heap[0][0] - self.now()).total_seconds()
+                if delay > 0:
+                    self._cond.wait(delay)
+                    continue
+                now = self.now()
+                due = []
+                while self._heap and self._heap[0][0] <= now:
+                    due.append(heapq.heappop(self._heap)[1])
+            try:
+                self.fire(due)
+            except Exception as e:
+                # The rows stay claimed and are recovered after claim_timeout
+                logging.error(f"Error dispatching scheduled messages {due}: {e}")
+                self._count("errors")
+
+    def fire(self, ids):
+        with get_connection() as conn, conn.cursor() as cursor:
+            # Only rows still claimed by us: deleted or recovered rows drop out, edits are picked up
+            cursor.execute(f"""
+                UPDATE whatsapp_scheduled_messages
+                SET status = 'sending', claimed_at = now(), updated_at = now()
+                WHERE id = ANY(%s) AND status = 'claimed' AND claimed_by = %s
+                RETURNING {SELECT_COLUMNS};
+            """, (ids, self.worker_id))
+            messages, invalid = [], []
+            for row in cursor.fetchall():
+                try:
+                    messages.append(_to_message(row))
+                except Exception as e:
+                    # A row that can't be sent never will be; retrying it would only fail the batch again
+                    logging.error(f"Scheduled message {row[0]} is invalid and won't be sent: {e}")
+                    invalid.append((row[0], "failed", f"Invalid message: {e}"[:500], self.worker_id))
+            if invalid:
+                execute_values(cursor, """
+                    UPDATE whatsapp_scheduled_messages AS s
+                    SET status = v.status, last_error = v.error, claimed_by = NULL, claimed_at = NULL, updated_at = now()
+                    FROM (VALUES %s) AS v(id, status, error, worker)
+                    WHERE s.id = v.id AND s.claimed_by = v.worker;
+                """, invalid)
+                self._count("failed", len(invalid))
+            conn.commit()
+
+        if not messages:
+            return
+        # Send in rounds of send_workers. Each round records its outcomes and renews the claim on the
+        # rows still waiting, so a long batch never looks abandoned to recover_stale_claims()
+        for start in range(0, len(messages), self.send_workers):
+            outcomes = list(self._executor.map(self._send, messages[start:start + self.send_workers]))
+            self._record(outcomes, [message.id for message in messages[start + self.send_workers:]])
+
+    def _record(self, outcomes, waiting):
+        with get_connection() as conn, conn.cursor() as cursor:
+            recorded = execute_values(cursor, """
+                UPDATE whatsapp_scheduled_messages AS s
+                SET status = v.status, last_error = v.error, attempts = s.attempts + 1,
+                    claimed_by = NULL, claimed_at = NULL, updated_at = now()
+                FROM (VALUES %s) AS v(id, status, error, worker)
+                WHERE s.id = v.id AND s.claimed_by = v.worker
+                RETURNING s.id;
+            """, [(id, status, error, self.worker_id) for id, status, error in outcomes], fetch=True)
+            if waiting:
+                cursor.execute("""
+                    UPDATE whatsapp_scheduled_messages
+                    SET claimed_at = now()
+                    WHERE id = ANY(%s) AND status = 'sending' AND claimed_by = %s;
+                """, (waiting, self.worker_id))
+            conn.commit()
+
+        # The claim was taken over (a send outlived claim_timeout); the row no longer says what happened
+        recorded = {row[0] for row in recorded}
+        unrecorded = [(id, status) for id, status, _ in outcomes if id not in recorded]
+        if unrecorded:
+            logging.error(f"Outcomes of scheduled messages were not recorded, their claims were recovered: {unrecorded}")
+            self._count("unrecorded", len(unrecorded))
+
+    def _send(self, message):
+        try:
+            self._sender.send(message)
+            self._count("sent")
+            return (message.id, "sent", None)
+        except Exception as e:
+            logging.error(f"Sending scheduled message {message.id} failed: {e}")
+            if message.attempts + 1 >= self.max_attempts:
+                self._count("failed")
+                return (message.id, "failed", str(e)[:500])
+            self._count("retried")
+            return (message.id, "pending", str(e)[:500])
+
+    def stats(self):
+        with self._cond:
+            return {
+                **self._counters,
+                "enabled": self.enabled,
+                "running": bool(self._threads),
+                "worker_id": self.worker_id,
+                "held": len(self._heap),
+                "next_due": self._heap[0][0] if self._heap else None,
+            }
+
+
+dispatcher = ScheduledMessageDispatcher(**dispatcher_config)
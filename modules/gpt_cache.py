@@ -0,0 +1,197 @@
+"""
+Content-addressed cache for GPT sentiment/topic results.
+
+Rerunning /sentiment after the midnight job, or rerunning the job itself,
+used to send the same message batches to the model again. Results are stored
+under a SHA-256 of the normalized batch, the prompt version and the model, so
+an identical batch is answered from the cache with no API call.
+
+Entries live in a local SQLite file or in Postgres (whatsapp_gpt_cache, see
+modules/schema.py) and are evicted least-recently-used first once their total
+size exceeds the configured budget. Cache failures are logged and treated as
+misses; they never fail an analysis.
+"""
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+
+from modules.config.cache import gpt_cache_config
+from modules.db import get_connection
+
+
+def normalize_batch(messages):
+    # Whitespace and order differences don't change what the model is asked to judge
+    return sorted(" ".join(str(message).split()) for message in messages)
+
+
+def cache_key(messages, prompt_version, model):
+    payload = json.dumps([prompt_version, model, normalize_batch(messages)], ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class SqliteBackend:
+    def __init__(self, path):
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS gpt_cache (
+                key TEXT PRIMARY KEY,
+                result TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                last_used REAL NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS gpt_cache_last_used ON gpt_cache (last_used)")
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            row = self._conn.execute("SELECT result FROM gpt_cache WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                self._conn.execute("UPDATE gpt_cache SET last_used = ? WHERE key = ?", (time.time(), key))
+        return row[0] if row else None
+
+    def set(self, key, payload):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO gpt_cache (key, result, size, last_used) VALUES (?, ?, ?, ?)",
+                (key, payload, len(payload), time.time()),
+            )
+
+    def evict(self, max_bytes):
+        with self._lock:
+            total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM gpt_cache").fetchone()[0]
+            if total <= max_bytes:
+                return 0
+            # Walk entries oldest-first until enough bytes are freed
+            excess, victims = total - max_bytes, []
+            for key, size in self._conn.execute("SELECT key, size FROM gpt_cache ORDER BY last_used"):
+                victims.append((key,))
+                excess -= size
+                if excess <= 0:
+                    break
+            self._conn.executemany("DELETE FROM gpt_cache WHERE key = ?", victims)
+            return len(victims)
+
+    def size(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM gpt_cache").fetchone()
+
+
+class PostgresBackend:
+    def get(self, key):
+        with get_connection() as conn, conn.cursor() as cursor:
+            cursor.execute("""
+                UPDATE whatsapp_gpt_cache SET last_used = now()
+                WHERE cache_key = %s
+                RETURNING result::text;
+            """, (key,))
+            row = cursor.fetchone()
+            conn.commit()
+        return row[0] if row else None
+
+    def set(self, key, payload):
+        with get_connection() as conn, conn.cursor() as cursor:
+            cursor.execute("""
+                INSERT INTO whatsapp_gpt_cache (cache_key, result, size)
+                VALUES (%s, %s, %s)
+                ON CONFLICT (cache_key) DO UPDATE SET result = EXCLUDED.result, size = EXCLUDED.size, last_used = now();
+            """, (key, payload, len(payload)))
+            conn.commit()
+
+    def evict(self, max_bytes):
+        with get_connection() as conn, conn.cursor() as cursor:
+            # Keep the most recently used entries whose running size fits the budget
+            cursor.execute("""
+                DELETE FROM whatsapp_gpt_cache
+                WHERE cache_key IN (
+                    SELECT cache_key
+                    FROM (
+                        SELECT cache_key, SUM(size) OVER (ORDER BY last_used DESC, cache_key) AS running_size
+                        FROM whatsapp_gpt_cache
+                    ) ranked
+                    WHERE running_size > %s
+                );
+            """, (max_bytes,))
+            evicted = cursor.rowcount
+            conn.commit()
+        return evicted
+
+    def size(self):
+        with get_connection() as conn, conn.cursor() as cursor:
+            cursor.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM whatsapp_gpt_cache;")
+            return cursor.fetchone()
+
+
+class GPTResultCache:
+    def __init__(self, backend, sqlite_path, max_bytes, evict_every):
+        self.backend_name = backend
+        self.sqlite_path = sqlite_path
+        self.max_bytes = max_bytes
+        self.evict_every = evict_every
+        self._backend = None
+        self._writes = 0
+        self._lock = threading.Lock()
+        self._counters = {"hits": 0, "misses": 0, "writes": 0, "evicted": 0, "backend_errors": 0}
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self._counters[name] += amount
+
+    def _get_backend(self):
+        # Created on first use so importing the module never touches disk or the database
+        if self._backend is None and self.backend_name != "none":
+            with self._lock:
+                if self._backend is None:
+                    if self.backend_name == "postgres":
+                        self._backend = PostgresBackend()
+                    else:
+                        self._backend = SqliteBackend(self.sqlite_path)
+        return self._backend
+
+    def get(self, key):
+        try:
+            backend = self._get_backend()
+            payload = backend.get(key) if backend else None
+        except Exception as e:
+            logging.warning(f"GPT cache unavailable: {e}")
+            self._count("backend_errors")
+            payload = None
+        if payload is None:
+            self._count("misses")
+            return None
+        self._count("hits")
+        return json.loads(payload)
+
+    def set(self, key, result):
+        try:
+            backend = self._get_backend()
+            if backend is None:
+                return
+            backend.set(key, json.dumps(result))
+            self._count("writes")
+            with self._lock:
+                self._writes += 1
+                due = self._writes % self.evict_every == 0
+            if due:
+                self._count("evicted", backend.evict(self.max_bytes))
+        except Exception as e:
+            logging.warning(f"GPT cache unavailable: {e}")
+            self._count("backend_errors")
+
+    def stats(self):
+        with self._lock:
+            counters = dict(self._counters)
+        lookups = counters["hits"] + counters["misses"]
+        return {
+            **counters,
+            "hit_ratio": (counters["hits"] / lookups) if lookups else 0.0,
+            "backend": self.backend_name,
+            "max_bytes": self.max_bytes,
+        }
+
+
+gpt_cache = GPTResultCache(**gpt_cache_config)
@@ -0,0 +1,76 @@
+"""
+Structured, sampled logging for the service.
+
+The modules log through the standard `logging` calls; configure_logging()
+installs one handler on the root logger that
+
+- writes one JSON object per line (LOG_FORMAT=text for plain lines when
+  reading a terminal), with any `extra={...}` fields as top-level keys:
+
+      logging.info("Saved sentiment rows", extra={"rows": 120, "seconds": 0.4})
+
+- drops records below LOG_LEVEL (default INFO) before they are formatted, and
+- keeps only a LOG_SAMPLE_RATE fraction of DEBUG and INFO records (default 1,
+  everything). A call can pass its own rate for very chatty lines:
+
+      logging.debug(f"Group: {group_name}", extra={"sample": 0.01})
+
+  WARNING and above are never sampled out.
+"""
+import json
+import logging
+import os
+import random
+import sys
+from datetime import datetime, timezone
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json").lower()
+LOG_SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", "1"))
+
+# Attributes every LogRecord has; anything else was passed through extra=
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "sample"}
+
+
+class SamplingFilter(logging.Filter):
+    def __init__(self, rate):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING:
+            return True
+        rate = getattr(record, "sample", self.rate)
+        return rate >= 1 or random.random() < rate
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES:
+                entry[key] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+def configure_logging(level=LOG_LEVEL, fmt=LOG_FORMAT, sample_rate=LOG_SAMPLE_RATE):
+    """Route all logging through one structured, sampled stderr handler. Safe to call more than once."""
+    handler = logging.StreamHandler(sys.stderr)
+    if fmt == "text":
+        handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s %(message)s"))
+    else:
+        handler.setFormatter(JsonFormatter())
+    handler.addFilter(SamplingFilter(sample_rate))
+
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    root.setLevel(level)
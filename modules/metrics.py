@@ -0,0 +1,172 @@
+"""
+Per-route request metrics.
+
+MetricsMiddleware wraps the ASGI app and records, for every request, the
+route template it matched ("/group_details/get_group_details/{id}", not the
+raw path, so label cardinality stays bounded), how long the response took and
+its status. Latencies go into a fixed-bucket histogram per route, and the
+number of requests currently being handled is tracked per route.
+
+route_metrics.render() produces the Prometheus text exposition served on
+/metrics; snapshot() is the same data as JSON with estimated percentiles.
+"""
+import threading
+import time
+
+from starlette.routing import Match
+
+from modules.query_stats import current_route
+
+# Histogram bucket upper bounds in seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, float("inf"))
+UNMATCHED_ROUTE = "unmatched"
+
+
+class RouteStats:
+    __slots__ = ("buckets", "count", "total", "in_flight", "statuses")
+
+    def __init__(self):
+        self.buckets = [0] * len(LATENCY_BUCKETS)
+        self.count = 0
+        self.total = 0.0
+        self.in_flight = 0
+        self.statuses = {}
+
+    def percentile(self, fraction):
+        # Linear interpolation inside the bucket holding the requested rank, like Prometheus' histogram_quantile
+        if not self.count:
+            return None
+        rank = fraction * self.count
+        seen, lower = 0, 0.0
+        for bound, hits in zip(LATENCY_BUCKETS, self.buckets):
+            if hits and seen + hits >= rank:
+                if bound == float("inf"):
+                    return lower
+                return lower + (bound - lower) * (rank - seen) / hits
+            seen += hits
+            lower = bound
+        return LATENCY_BUCKETS[-2]
+
+
+class RouteMetrics:
+    def __init__(self):
+        self._routes = {}   # (method, route) -> RouteStats
+        self._lock = threading.Lock()
+
+    def _stats(self, key):
+        stats = self._routes.get(key)
+        if stats is None:
+            stats = self._routes.setdefault(key, RouteStats())
+        return stats
+
+    def started(self, key):
+        with self._lock:
+            self._stats(key).in_flight += 1
+
+    def finished(self, key, status, seconds):
+        with self._lock:
+            stats = self._stats(key)
+            stats.in_flight -= 1
+            stats.count += 1
+            stats.total += seconds
+            for index, bound in enumerate(LATENCY_BUCKETS):
+                if seconds <= bound:
+                    stats.buckets[index] += 1
+                    break
+            stats.statuses[status] = stats.statuses.get(status, 0) + 1
+
+    def snapshot(self):
+        with self._lock:
+            routes = []
+            for (method, route), stats in sorted(self._routes.items(), key=lambda item: (item[0][1], item[0][0])):
+                routes.append({
+                    "method": method,
+                    "route": route,
+                    "count": stats.count,
+                    "in_flight": stats.in_flight,
+                    "mean_ms": round(stats.total / stats.count * 1000, 2) if stats.count else None,
+                    "p50_ms": _ms(stats.percentile(0.50)),
+                    "p95_ms": _ms(stats.percentile(0.95)),
+                    "p99_ms": _ms(stats.percentile(0.99)),
+                    "statuses": {str(status): hits for status, hits in sorted(stats.statuses.items())},
+                })
+        return {"routes": routes}
+
+    def render(self):
+        """Prometheus text exposition format."""
+        lines = [
+            "# HELP http_requests_in_flight Requests currently being handled.",
+            "# TYPE http_requests_in_flight gauge",
+        ]
+        with self._lock:
+            items = sorted(self._routes.items())
+            for (method, route), stats in items:
+                lines.append(f'http_requests_in_flight{{method="{method}",route="{_escape(route)}"}} {stats.in_flight}')
+
+            lines += ["# HELP http_request_duration_seconds Request latency by route.",
+                      "# TYPE http_request_duration_seconds histogram"]
+            for (method, route), stats in items:
+                labels = f'method="{method}",route="{_escape(route)}"'
+                cumulative = 0
+                for bound, hits in zip(LATENCY_BUCKETS, stats.buckets):
+                    cumulative += hits
+                    le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                    lines.append(f'http_request_duration_seconds_bucket{{{labels},le="{le}"}} {cumulative}')
+                lines.append(f"http_request_duration_seconds_sum{{{labels}}} {stats.total:.6f}")
+                lines.append(f"http_request_duration_seconds_count{{{labels}}} {stats.count}")
+
+            lines += ["# HELP http_responses_total Responses by route and status code.",
+                      "# TYPE http_responses_total counter"]
+            for (method, route), stats in items:
+                for status, hits in sorted(stats.statuses.items()):
+                    lines.append(f'http_responses_total{{method="{method}",route="{_escape(route)}",status="{status}"}} {hits}')
+        return "\n".join(lines) + "\n"
+
+
+def _ms(seconds):
+    return None if seconds is None else round(seconds * 1000, 2)
+
+
+def _escape(value):
+    return value.replace("\\", "\\\\").replace('"', '\\"')
+
+
+class MetricsMiddleware:
+    """Pure ASGI middleware; BaseHTTPMiddleware would add a task and a stream copy per request."""
+
+    def __init__(self, app, metrics, routes):
+        self.app = app
+        self.metrics = metrics
+        self.routes = routes  # The application's route list, matched here to label requests by template
+
+    def _route(self, scope):
+        for route in self.routes:
+            match, _ = route.matches(scope)
+            if match == Match.FULL:
+                return getattr(route, "path", UNMATCHED_ROUTE)
+        return UNMATCHED_ROUTE
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        key = (scope["method"], self._route(scope))
+        status = 500  # Reported if the app raises before sending a response
+        started = time.perf_counter()
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        self.metrics.started(key)
+        token = current_route.set(key[1])  # Queries run for this request are attributed to the route
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            current_route.reset(token)
+            self.metrics.finished(key, status, time.perf_counter() - started)
+
+
+route_metrics = RouteMetrics()
@@ -24,4 +24,17 @@ class BotConfig(BaseModel):
 
     
 class BotConfigResponse(BaseModel):
-    bots: List[BotConfig]
\ No newline at end of file
+    bots: List[BotConfig]
+
+class ClassifyMessagesRequest(BaseModel):
+    message: Optional[str] = None          # A single message, or
+    messages: Optional[List[str]] = None   # a batch classified in one call
+
+class IncomingMessage(BaseModel):
+    group_name: str
+    sender: str                          # Phone number or display name, as logged in phone_or_name
+    message: str
+    timestamp: Optional[datetime] = None # When the message was sent; defaults to now
+
+class EvaluateMessagesRequest(BaseModel):
+    messages: List[IncomingMessage]
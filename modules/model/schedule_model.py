@@ -1,6 +1,6 @@
 from pydantic import BaseModel,HttpUrl
 from datetime import datetime
-from typing import Optional,List
+from typing import Optional,List,Any
 
 class Media(BaseModel):
     url: HttpUrl
@@ -13,3 +13,14 @@ class ScheduleMessageRequest(BaseModel):
     content: str
     media: Optional[Media] = None
     scheduledTime: datetime
+
+# A claimed row of whatsapp_scheduled_messages as handed to a MessageSender
+class ScheduledMessage(BaseModel):
+    id: int
+    tenant_id: str
+    groups: List[str]
+    message_type: str
+    content: str
+    schedule_time: datetime
+    media: Optional[Any] = None
+    attempts: int = 0
@@ -0,0 +1,268 @@
+"""
+Per-statement timing for every query the service runs.
+
+Both drivers are instrumented where statements are executed:
+
+- psycopg2: pooled connections are opened with cursor_factory=TimedCursor,
+  so every cursor.execute()/executemany()/copy_expert() is timed, including
+  the ones issued by execute_values.
+- asyncpg: the pool is created with connection_class=TimedConnection, which
+  times fetch/fetchrow/fetchval/execute/executemany.
+
+Each statement is reduced to a fingerprint: literals and parameters become
+"?", IN/VALUES lists collapse to one element and whitespace is normalized, so
+"... WHERE id = 3" and "... WHERE id = 7" (or %s / $1) aggregate together.
+Calls, total/max time and rows are kept per (route, fingerprint). The route is
+the request's route template, set by the metrics middleware through
+current_route; work outside a request is recorded under "background".
+
+A statement slower than slow_query_ms is logged together with its EXPLAIN
+plan, at most once per explain_interval per fingerprint.
+"""
+import contextvars
+import logging
+import re
+import threading
+import time
+from functools import lru_cache
+
+import asyncpg
+from psycopg2 import extensions
+
+from modules.config.database import query_stats_config
+
+current_route = contextvars.ContextVar("current_route", default="background")
+
+OVERFLOW_FINGERPRINT = "other"
+EXPLAINABLE = ("select", "with", "insert", "update", "delete")
+
+_COMMENTS = re.compile(r"--[^\n]*|/\*.*?\*/", re.S)
+_STRINGS = re.compile(r"'(?:[^']|'')*'")
+_NUMBERS = re.compile(r"(?<![\w$])-?\d+(?:\.\d+)?\b")
+_KEYWORD_VALUES = re.compile(r"(?<=[(,])(\s*)(?:NULL|TRUE|FALSE)\b", re.I)  # Only as list elements; "IS NULL" stays
+_PARAMETERS = re.compile(r"%\(\w+\)s|%s|\$\d+")
+_LISTS = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_VALUES_ROWS = re.compile(r"(\(\?\))(?:\s*,\s*\(\?\))+")
+_WHITESPACE = re.compile(r"\s+")
+
+
+@lru_cache(maxsize=4096)
+def fingerprint(sql):
+    """Normalized statement text used to aggregate executions of the same query."""
+    if isinstance(sql, bytes):
+        sql = sql.decode("utf-8", "replace")
+    sql = _COMMENTS.sub(" ", str(sql))
+    sql = _STRINGS.sub("?", sql)
+    sql = _PARAMETERS.sub("?", sql)
+    sql = _NUMBERS.sub("?", sql)
+    sql = _KEYWORD_VALUES.sub(r"\1?", sql)
+    sql = _LISTS.sub("(?)", sql)         # IN (?, ?, ?) and VALUES (?, ?, ?) rows
+    sql = _VALUES_ROWS.sub(r"\1", sql)   # VALUES (?), (?), ... from execute_values
+    return _WHITESPACE.sub(" ", sql).strip().rstrip(";")
+
+
+class QueryStats:
+    def __init__(self, enabled, slow_query_ms, explain_interval, max_statements):
+        self.enabled = enabled
+        self.slow_query_seconds = slow_query_ms / 1000
+        self.explain_interval = explain_interval
+        self.max_statements = max_statements
+        self._stats = {}         # (route, fingerprint) -> [calls, total seconds, max seconds, rows]
+        self._explained = {}     # fingerprint -> monotonic time of the last EXPLAIN
+        self._lock = threading.Lock()
+
+    def record(self, sql, seconds, rows):
+        """Add one execution; returns the fingerprint when the statement was slow and is due for an EXPLAIN."""
+        statement = fingerprint(sql)
+        key = (current_route.get(), statement)
+        with self._lock:
+            entry = self._stats.get(key)
+            if entry is None:
+                if len(self._stats) >= self.max_statements:
+                    key = (key[0], OVERFLOW_FINGERPRINT)
+                    entry = self._stats.get(key)
+                if entry is None:
+                    entry = self._stats[key] = [0, 0.0, 0.0, 0]
+            entry[0] += 1
+            entry[1] += seconds
+            if seconds > entry[2]:
+                entry[2] = seconds
+            if rows and rows > 0:
+                entry[3] += rows
+
+            if seconds < self.slow_query_seconds:
+                return None
+            now = time.monotonic()
+            if now - self._explained.get(statement, float("-inf")) < self.explain_interval:
+                return None
+            self._explained[statement] = now
+        return statement
+
+    def snapshot(self, route=None, sort="total_ms", limit=50):
+        with self._lock:
+            items = [(key, list(entry)) for key, entry in self._stats.items() if route is None or key[0] == route]
+        statements = [
+            {
+                "route": statement_route,
+                "statement": statement,
+                "calls": calls,
+                "total_ms": round(total * 1000, 3),
+                "mean_ms": round(total / calls * 1000, 3),
+                "max_ms": round(longest * 1000, 3),
+                "rows": rows,
+            }
+            for (statement_route, statement), (calls, total, longest, rows) in items
+        ]
+        statements.sort(key=lambda entry: entry.get(sort) or 0, reverse=True)
+        return {
+            "enabled": self.enabled,
+            "slow_query_ms": self.slow_query_seconds * 1000,
+            "tracked": len(items),
+            "statements": statements[:limit],
+        }
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+            self._explained.clear()
+
+
+query_stats = QueryStats(**query_stats_config)
+
+
+def _explainable(sql):
+    if isinstance(sql, bytes):
+        sql = sql.decode("utf-8", "replace")
+    words = _COMMENTS.sub(" ", sql).split(None, 1)
+    return bool(words) and words[0].lower() in EXPLAINABLE
+
+
+def _log_slow(statement, seconds, rows, plan):
+    logging.warning(
+        f"Slow query ({seconds * 1000:.1f} ms) on {current_route.get()}: {statement}",
+        extra={"duration_ms": round(seconds * 1000, 3), "rows": rows, "route": current_route.get(), "plan": plan},
+    )
+
+
+class TimedCursor(extensions.cursor):
+    """psycopg2 cursor that reports every statement to query_stats."""
+
+    def _timed(self, query, vars, call, *args):
+        if not query_stats.enabled:
+            return call(*args)
+        started = time.perf_counter()
+        try:
+            return call(*args)
+        finally:
+            seconds = time.perf_counter() - started
+            statement = query_stats.record(query, seconds, self.rowcount)
+            if statement is not None:
+                _log_slow(statement, seconds, self.rowcount, self._explain(query, vars))
+
+    def execute(self, query, vars=None):
+        return self._timed(query, vars, super().execute, query, vars)
+
+    def executemany(self, query, vars_list):
+        return self._timed(query, None, super().executemany, query, vars_list)
+
+    def copy_expert(self, sql, file, size=8192):
+        return self._timed(sql, None, super().copy_expert, sql, file, size)
+
+    def _explain(self, query, vars):
+        # Server-side (named) cursors and failed transactions can't run another statement here
+        connection = self.connection
+        status = connection.info.transaction_status
+        if self.name or not _explainable(query) or status == extensions.TRANSACTION_STATUS_INERROR:
+            return None
+        # A plain cursor, so the EXPLAIN itself isn't timed; a savepoint keeps a failing EXPLAIN
+        # from aborting the caller's transaction
+        in_transaction = status == extensions.TRANSACTION_STATUS_INTRANS
+        text = query.decode() if isinstance(query, bytes) else query
+        cursor = extensions.cursor(connection)
+        try:
+            if in_transaction:
+                cursor.execute("SAVEPOINT query_stats_explain")
+            cursor.execute("EXPLAIN " + text, vars)
+            plan = "\n".join(row[0] for row in cursor.fetchall())
+            if in_transaction:
+                cursor.execute("RELEASE SAVEPOINT query_stats_explain")
+            return plan
+        except Exception as e:
+            if in_transaction:
+                try:
+                    cursor.execute("ROLLBACK TO SAVEPOINT query_stats_explain")
+                except Exception:
+                    pass
+            return f"EXPLAIN failed: {e}"
+        finally:
+            cursor.close()
+
+
+_ROW_COUNT = re.compile(r"(\d+)$")
+
+
+def _status_rows(status):
+    # Command status such as "UPDATE 3" or "INSERT 0 5"
+    match = _ROW_COUNT.search(status or "")
+    return int(match.group(1)) if match else 0
+
+
+class TimedConnection(asyncpg.Connection):
+    """asyncpg connection that reports every statement to query_stats."""
+
+    _resetting = False
+
+    async def reset(self, *, timeout=None):
+        # The pool's own cleanup statement on release isn't the route's query
+        self._resetting = True
+        try:
+            return await super().reset(timeout=timeout)
+        finally:
+            self._resetting = False
+
+    async def _timed(self, query, args, call, rows_of):
+        if not query_stats.enabled or self._resetting:
+            return await call()
+        started = time.perf_counter()
+        result = None
+        try:
+            result = await call()
+            return result
+        finally:
+            seconds = time.perf_counter() - started
+            rows = rows_of(result)
+            statement = query_stats.record(query, seconds, rows)
+            if statement is not None:
+                _log_slow(statement, seconds, rows, await self._explain(query, args))
+
+    async def fetch(self, query, *args, **kwargs):
+        return await self._timed(query, args, lambda: super(TimedConnection, self).fetch(query, *args, **kwargs),
+                                 lambda result: len(result) if result is not None else 0)
+
+    async def fetchrow(self, query, *args, **kwargs):
+        return await self._timed(query, args, lambda: super(TimedConnection, self).fetchrow(query, *args, **kwargs),
+                                 lambda result: int(result is not None))
+
+    async def fetchval(self, query, *args, **kwargs):
+        return await self._timed(query, args, lambda: super(TimedConnection, self).fetchval(query, *args, **kwargs),
+                                 lambda result: int(result is not None))
+
+    async def execute(self, query, *args, **kwargs):
+        return await self._timed(query, args, lambda: super(TimedConnection, self).execute(query, *args, **kwargs),
+                                 _status_rows)
+
+    async def executemany(self, command, args, **kwargs):
+        args = list(args)
+        return await self._timed(command, tuple(args[0]) if args else (),
+                                 lambda: super(TimedConnection, self).executemany(command, args, **kwargs),
+                                 lambda result: len(args))
+
+    async def _explain(self, query, args):
+        # Only outside explicit transactions; a failing EXPLAIN would abort the caller's
+        if self.is_in_transaction() or not _explainable(query):
+            return None
+        try:
+            rows = await super().fetch("EXPLAIN " + query, *args)
+            return "\n".join(row[0] for row in rows)
+        except Exception as e:
+            return f"EXPLAIN failed: {e}"
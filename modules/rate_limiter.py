@@ -0,0 +1,209 @@
+"""
+Per-sender message rate limiting for BotConfig.messageLimit.
+
+Counters are kept per (tenant, group, sender) with the sliding window counter
+approximation: each key holds the message count of the current fixed window
+and of the previous one, and the rate is
+
+    previous * (share of the sliding window still overlapping it) + current
+
+which tracks a true sliding log within a message or two while costing two
+integers per sender instead of one timestamp per message.
+
+The counter table is split into shards, each a plain dict behind its own
+lock, so concurrent checks for different senders rarely contend. A counter is
+a fixed-size list that is mutated in place: after a sender's first message a
+check allocates nothing beyond the key tuple. Senders that go quiet for
+idle_ttl seconds are swept out shard by shard, which keeps memory
+proportional to the senders active recently rather than to everyone ever seen.
+
+ShardedRateLimiter counts per process: with several uvicorn workers each one
+sees only the messages it handled, so a sender could post up to workers x
+messageLimit before being flagged. When REDIS_URL is set, RedisRateLimiter
+keeps the same two window counts in Redis instead (one INCR and one GET per
+message, expired by Redis rather than swept) and every worker enforces one
+shared limit. If Redis stops answering it falls back to the local counters
+for a few seconds rather than failing the request.
+"""
+import json
+import logging
+import threading
+import time
+
+from modules.config.rate_limit import rate_limit_config
+
+# Counter slots: [window index, previous window count, current window count, last message time]
+_WINDOW, _PREVIOUS, _CURRENT, _LAST_SEEN = range(4)
+
+
+class ShardedRateLimiter:
+    def __init__(self, window_seconds, shards, idle_ttl, sweep_interval, default_action="warn"):
+        if shards & (shards - 1):
+            raise ValueError("shards must be a power of two")
+        self.window_seconds = float(window_seconds)
+        self.idle_ttl = idle_ttl
+        self.sweep_interval = sweep_interval
+        self.default_action = default_action
+        self._mask = shards - 1
+        self._shards = [{} for _ in range(shards)]
+        self._locks = [threading.Lock() for _ in range(shards)]
+        self._next_sweep = [0.0] * shards
+        self._counters = [[0, 0, 0] for _ in range(shards)]  # Per shard: checks, exceeded, evicted
+
+    def hit(self, key, limit, now=None):
+        """
+        Record one message for key and return the sender's rate over the sliding window,
+        including this message, or 0 when limit is unset. The message is over the limit
+        when the returned rate exceeds limit.
+
+        now is the server clock (time.time() by default), never a time taken from the message:
+        a client-supplied timestamp could roll a sender's counter back or push the sweep schedule out.
+        """
+        if not limit or limit <= 0:
+            return 0
+        if now is None:
+            now = time.time()
+        window = int(now // self.window_seconds)
+        index = hash(key) & self._mask
+        shard = self._shards[index]
+
+        with self._locks[index]:
+            if now >= self._next_sweep[index]:
+                self._sweep(index, now)
+
+            counter = shard.get(key)
+            if counter is None:
+                counter = shard[key] = [window, 0, 0, now]
+            elif window < counter[_WINDOW]:
+                # The clock stepped back; count against the newer window instead of rolling the counter back
+                window = counter[_WINDOW]
+                now = window * self.window_seconds
+            elif counter[_WINDOW] != window:
+                # Roll over; anything older than the previous window no longer overlaps
+                counter[_PREVIOUS] = counter[_CURRENT] if counter[_WINDOW] == window - 1 else 0
+                counter[_CURRENT] = 0
+                counter[_WINDOW] = window
+            counter[_CURRENT] += 1
+            counter[_LAST_SEEN] = max(counter[_LAST_SEEN], now)
+
+            overlap = 1.0 - (now - window * self.window_seconds) / self.window_seconds
+            rate = counter[_PREVIOUS] * overlap + counter[_CURRENT]
+
+            stats = self._counters[index]
+            stats[0] += 1
+            if rate > limit:
+                stats[1] += 1
+        return rate
+
+    def _sweep(self, index, now):
+        # Caller holds the shard lock
+        shard = self._shards[index]
+        cutoff = now - self.idle_ttl
+        idle = [key for key, counter in shard.items() if counter[_LAST_SEEN] < cutoff]
+        for key in idle:
+            del shard[key]
+        self._counters[index][2] += len(idle)
+        self._next_sweep[index] = now + self.sweep_interval
+
+    def reset(self, key):
+        index = hash(key) & self._mask
+        with self._locks[index]:
+            self._shards[index].pop(key, None)
+
+    def __len__(self):
+        return sum(len(shard) for shard in self._shards)
+
+    def stats(self):
+        checks = exceeded = evicted = 0
+        for index, lock in enumerate(self._locks):
+            with lock:
+                shard_checks, shard_exceeded, shard_evicted = self._counters[index]
+            checks += shard_checks
+            exceeded += shard_exceeded
+            evicted += shard_evicted
+        return {
+            "senders": len(self),
+            "shards": len(self._shards),
+            "window_seconds": self.window_seconds,
+            "checks": checks,
+            "exceeded": exceeded,
+            "evicted": evicted,
+            "shared_backend": False,
+        }
+
+
+class RedisRateLimiter:
+    """The sliding window counter of ShardedRateLimiter kept in Redis, shared by every worker."""
+
+    def __init__(self, url, fallback, retry_after=5, prefix="ratelimit"):
+        import redis  # Only needed when a shared backend is configured
+
+        self._client = redis.Redis.from_url(url, socket_timeout=0.5, socket_connect_timeout=0.5)
+        self._fallback = fallback
+        self._retry_after = retry_after
+        self._prefix = prefix
+        self._unavailable_until = 0.0
+        self._lock = threading.Lock()
+        self._counters = {"checks": 0, "exceeded": 0, "backend_errors": 0}
+        self.window_seconds = fallback.window_seconds
+        self.default_action = fallback.default_action
+
+    def hit(self, key, limit, now=None):
+        """Same contract as ShardedRateLimiter.hit(), counted across all workers."""
+        if not limit or limit <= 0:
+            return 0
+        if now is None:
+            now = time.time()
+        if time.monotonic() < self._unavailable_until:
+            return self._fallback.hit(key, limit, now)
+
+        window = int(now // self.window_seconds)
+        name = f"{self._prefix}:{json.dumps(key, separators=(',', ':'))}"
+        try:
+            pipe = self._client.pipeline(transaction=False)
+            pipe.incr(f"{name}:{window}")
+            # Kept while it can still be the previous window
+            pipe.expire(f"{name}:{window}", int(self.window_seconds * 2) + 1)
+            pipe.get(f"{name}:{window - 1}")
+            current, _, previous = pipe.execute()
+        except Exception as e:
+            logging.warning(f"Rate limiter backend unavailable, counting per worker for {self._retry_after}s: {e}")
+            self._unavailable_until = time.monotonic() + self._retry_after
+            with self._lock:
+                self._counters["backend_errors"] += 1
+            return self._fallback.hit(key, limit, now)
+
+        overlap = 1.0 - (now - window * self.window_seconds) / self.window_seconds
+        rate = int(previous or 0) * overlap + current
+        with self._lock:
+            self._counters["checks"] += 1
+            if rate > limit:
+                self._counters["exceeded"] += 1
+        return rate
+
+    def reset(self, key):
+        self._fallback.reset(key)
+        name = f"{self._prefix}:{json.dumps(key, separators=(',', ':'))}"
+        window = int(time.time() // self.window_seconds)
+        self._client.delete(f"{name}:{window}", f"{name}:{window - 1}")
+
+    def stats(self):
+        with self._lock:
+            counters = dict(self._counters)
+        return {
+            **counters,
+            "shared_backend": True,
+            "window_seconds": self.window_seconds,
+            "fallback": self._fallback.stats(),
+        }
+
+
+def create_limiter(redis_url=None, **config):
+    limiter = ShardedRateLimiter(**config)
+    if redis_url:
+        return RedisRateLimiter(redis_url, limiter)
+    logging.warning("REDIS_URL is not set: messageLimit is counted per worker process")
+    return limiter
+
+
+message_limiter = create_limiter(**rate_limit_config)
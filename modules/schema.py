@@ -0,0 +1,418 @@
+"""
+Versioned schema migrations.
+
+The tables, columns and indexes this service adds to the database are
+created by the numbered migrations below. Applied versions are recorded in whatsapp_schema_migrations,
+so each migration runs once per database; ensure_schema() at startup applies
+whatever is pending and then checks that every index the applied migrations
+define actually exists and is valid, logging the ones that don't (a missing
+index turns the hot queries into sequential scans over whatsapp_messages).
+GET /db/schema reports the same, plus the versions still pending.
+
+- Migrations run under a session advisory lock. Workers start at the same
+  time; one of them migrates while the others poll for the lock for up to
+  migration_config['lock_wait'] seconds and then carry on without it.
+- The platform owns tenant_tenant and the core whatsapp_* tables (groups,
+  members, messages, sentiment, bot configs and logs); they must exist
+  before migrating and are only ever extended here. The one platform table
+  this service used to create itself, whatsapp_scheduled_messages, is
+  migration 1 with its original definition. Every statement is IF NOT
+  EXISTS so databases set up before versioning adopt the migrations without
+  changes.
+- Indexes on the large platform tables are built with CREATE INDEX
+  CONCURRENTLY outside a transaction, so writes keep flowing while they
+  build. Such migrations may only build indexes: they run after every
+  transactional one, under a separate lock, and never during startup.
+  By default the first worker builds them on a background thread after
+  starting up; with SCHEMA_INDEX_BUILDS=manual they are left to
+  python -m modules.schema, run before or after a deploy. A build that is
+  interrupted leaves an invalid index behind; it is dropped and rebuilt on
+  the next attempt.
+
+Append new migrations with the next version number; never edit or reorder
+applied ones. Run all of them, index builds included, in the foreground with:
+
+    python -m modules.schema
+"""
+import logging
+import re
+import threading
+import time
+from contextlib import closing, contextmanager
+
+import psycopg2
+
+from modules.config.database import conn_config, migration_config
+from modules.config.dispatcher import dispatcher_config
+from modules.db import get_connection
+
+# Arbitrary constants for the advisory locks taken while migrating and while building indexes
+_MIGRATION_LOCK_KEY = 720503
+_INDEX_BUILD_LOCK_KEY = 720504
+
+MIGRATIONS_TABLE = """
+    CREATE TABLE IF NOT EXISTS whatsapp_schema_migrations (
+        version INTEGER PRIMARY KEY,
+        description TEXT NOT NULL,
+        applied_at TIMESTAMP WITHOUT TIME ZONE DEFAULT now(),
+        duration_ms INTEGER NOT NULL
+    );
+"""
+
+# Indexes behind the request paths, built concurrently by migration 7
+HOT_PATH_INDEXES = {
+    # Per-group message scans: rollup catch-up, sentiment windows, group activity
+    "whatsapp_messages_tenant_group_time_idx": "whatsapp_messages (tenant_id, group_name, message_time)",
+    # Dashboard engagement window; covers the query so it runs as an index-only scan
+    "whatsapp_messages_tenant_time_idx": "whatsapp_messages (tenant_id, message_time) INCLUDE (group_name, phone_number)",
+    # Cross-tenant time ranges (rollup refresh, sentiment fetch); rows arrive in time order so BRIN stays tiny
+    "whatsapp_messages_time_brin_idx": "whatsapp_messages USING brin (message_time)",
+    "whatsapp_groups_tenant_name_idx": "whatsapp_groups (tenant_id, group_name)",
+    "whatsapp_sentiment_tenant_group_idx": "whatsapp_sentiment (tenant_id, group_name)",
+    # Latest logs per tenant for /bot_details/get_bot_config
+    "whatsapp_bot_logs_tenant_time_idx": "whatsapp_bot_logs (tenant_id, timestamp DESC)",
+    "whatsapp_botconfig_tenant_idx": "whatsapp_botconfig (tenant_id, id)",
+}
+
+# (version, description, statements, transactional)
+MIGRATIONS = [
+    # Exactly the definition save_scheduled_message_to_db() used to carry inline
+    (1, "scheduled messages", [
+        """
+        CREATE TABLE IF NOT EXISTS whatsapp_scheduled_messages (
+            id SERIAL PRIMARY KEY,
+            groups TEXT NOT NULL,
+            message_type TEXT NOT NULL,
+            message_content TEXT NOT NULL,
+            schedule_time TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+            created_at TIMESTAMP WITHOUT TIME ZONE DEFAULT now(),
+            updated_at TIMESTAMP WITHOUT TIME ZONE DEFAULT now(),
+            status TEXT DEFAULT 'false',
+            media JSON,
+            tenant_id VARCHAR(50) NOT NULL,
+            CONSTRAINT fk_tenant FOREIGN KEY (tenant_id) REFERENCES tenant_tenant (tenant_id)
+                ON DELETE CASCADE
+                ON UPDATE CASCADE
+        );
+        """,
+    ], True),
+    # Per (tenant, group, day, sender) message counts, see modules/store_get_data/message_rollup.py
+    (2, "message rollup", [
+        """
+        CREATE TABLE IF NOT EXISTS whatsapp_message_daily_counts (
+            tenant_id VARCHAR(50) NOT NULL,
+            group_name TEXT NOT NULL,
+            day DATE NOT NULL,
+            sender TEXT NOT NULL,           -- '' stands in for a NULL sender so it can be part of the key
+            message_count INTEGER NOT NULL,
+            PRIMARY KEY (tenant_id, group_name, day, sender)
+        );
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS whatsapp_rollup_watermarks (
+            rollup_name TEXT PRIMARY KEY,
+            last_message_time TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+            updated_at TIMESTAMP WITHOUT TIME ZONE DEFAULT now()
+        );
+        """,
+    ], True),
+    # Last message_time analyzed per group, see run_sentiment_analysis() in modules/sentiment.py
+    (3, "incremental sentiment", [
+        """
+        CREATE TABLE IF NOT EXISTS whatsapp_sentiment_watermarks (
+            tenant_id VARCHAR(50) NOT NULL,
+            group_name TEXT NOT NULL,
+            last_message_time TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+            updated_at TIMESTAMP WITHOUT TIME ZONE DEFAULT now(),
+            PRIMARY KEY (tenant_id, group_name)
+        );
+        """,
+        # Incremental sentiment rows are keyed by the newest message they cover; older rows have no window
+        "ALTER TABLE whatsapp_sentiment ADD COLUMN IF NOT EXISTS window_end TIMESTAMP WITHOUT TIME ZONE;",
+        """
+        CREATE UNIQUE INDEX IF NOT EXISTS whatsapp_sentiment_window_idx
+            ON whatsapp_sentiment (tenant_id, group_name, window_end)
+            WHERE window_end IS NOT NULL;
+        """,
+    ], True),
+    # Claim bookkeeping for the scheduled message dispatcher, see modules/dispatcher.py
+    (4, "scheduled message claims", [
+        """
+        ALTER TABLE whatsapp_scheduled_messages
+            ADD COLUMN IF NOT EXISTS claimed_by TEXT,
+            ADD COLUMN IF NOT EXISTS claimed_at TIMESTAMP WITHOUT TIME ZONE,
+            ADD COLUMN IF NOT EXISTS attempts INTEGER NOT NULL DEFAULT 0,
+            ADD COLUMN IF NOT EXISTS last_error TEXT;
+        """,
+        """
+        CREATE INDEX IF NOT EXISTS whatsapp_scheduled_messages_due_idx
+            ON whatsapp_scheduled_messages (schedule_time)
+            WHERE status = 'pending';
+        """,
+        """
+        CREATE INDEX IF NOT EXISTS whatsapp_scheduled_messages_claims_idx
+            ON whatsapp_scheduled_messages (claimed_at)
+            WHERE status IN ('claimed', 'sending');
+        """,
+    ], True),
+    # Keyset pagination of the list endpoints: one index per sort order and filter combination
+    (5, "keyset pagination indexes", [
+        "CREATE INDEX IF NOT EXISTS whatsapp_scheduled_messages_tenant_time_idx ON whatsapp_scheduled_messages (tenant_id, schedule_time, id);",
+        "CREATE INDEX IF NOT EXISTS whatsapp_scheduled_messages_tenant_status_time_idx ON whatsapp_scheduled_messages (tenant_id, status, schedule_time, id);",
+        "CREATE INDEX IF NOT EXISTS whatsapp_groups_tenant_id_idx ON whatsapp_groups (tenant_id, id);",
+        "CREATE INDEX IF NOT EXISTS whatsapp_group_members_group_member_idx ON whatsapp_group_members (group_id, member_id);",
+        "CREATE INDEX IF NOT EXISTS whatsapp_group_members_group_role_idx ON whatsapp_group_members (group_id, role, member_id);",
+    ], True),
+    # GPT results by content hash when GPT_CACHE_BACKEND=postgres, see modules/gpt_cache.py
+    (6, "gpt cache", [
+        """
+        CREATE TABLE IF NOT EXISTS whatsapp_gpt_cache (
+            cache_key TEXT PRIMARY KEY,
+            result JSONB NOT NULL,
+            size INTEGER NOT NULL,
+            created_at TIMESTAMP WITHOUT TIME ZONE DEFAULT now(),
+            last_used TIMESTAMP WITHOUT TIME ZONE DEFAULT now()
+        );
+        """,
+        "CREATE INDEX IF NOT EXISTS whatsapp_gpt_cache_last_used_idx ON whatsapp_gpt_cache (last_used);",
+    ], True),
+    (7, "hot path indexes", [
+        f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON {definition};"
+        for name, definition in HOT_PATH_INDEXES.items()
+    ], False),
+    # Which backend (gpt or lexicon) produced each sentiment row; older rows have none
+    (8, "sentiment analyzer", [
+        "ALTER TABLE whatsapp_sentiment ADD COLUMN IF NOT EXISTS analyzer TEXT;",
+    ], True),
+    # Rows were saved as 'pending' long before anything sent them; retire the ones already past
+    # the dispatcher's max_lateness so enabling it doesn't send months of backlog, see modules/dispatcher.py
+    (9, "expire overdue scheduled messages", [
+        f"""
+        UPDATE whatsapp_scheduled_messages
+        SET status = 'expired', last_error = 'Not sent: overdue before the dispatcher was deployed', updated_at = now()
+        WHERE status = 'pending'
+          AND schedule_time < (now() AT TIME ZONE '{dispatcher_config['timezone']}')
+                              - {int(dispatcher_config['max_lateness'])} * INTERVAL '1 second';
+        """,
+    ], True),
+    # Per-tenant dashboard cache generations shared by every worker, see modules/dashboard_cache.py
+    (10, "dashboard cache generations", [
+        """
+        CREATE TABLE IF NOT EXISTS whatsapp_dashboard_generations (
+            tenant_id VARCHAR(50) PRIMARY KEY,
+            generation BIGINT NOT NULL DEFAULT 0,
+            updated_at TIMESTAMP WITHOUT TIME ZONE DEFAULT now()
+        );
+        """,
+    ], True),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+_INDEX_NAME = re.compile(r"CREATE\s+(?:UNIQUE\s+)?INDEX\s+(?:CONCURRENTLY\s+)?IF NOT EXISTS\s+(\w+)", re.IGNORECASE)
+
+
+def migration_indexes(statements):
+    return [match.group(1) for statement in statements for match in _INDEX_NAME.finditer(statement)]
+
+
+def applied_versions(cursor):
+    cursor.execute(MIGRATIONS_TABLE)
+    cursor.execute("SELECT version FROM whatsapp_schema_migrations;")
+    return {row[0] for row in cursor.fetchall()}
+
+
+def index_state(cursor, names):
+    """{index name: is valid} for the given indexes visible on the search path."""
+    cursor.execute("""
+        SELECT c.relname, i.indisvalid
+        FROM pg_index i
+        JOIN pg_class c ON c.oid = i.indexrelid
+        WHERE c.relname = ANY(%s) AND pg_table_is_visible(c.oid);
+    """, (list(names),))
+    return dict(cursor.fetchall())
+
+
+def apply_migration(conn, version, description, statements, transactional):
+    started = time.perf_counter()
+    with conn.cursor() as cursor:
+        if transactional:
+            for statement in statements:
+                cursor.execute(statement)
+        else:
+            # CREATE INDEX CONCURRENTLY can't run inside a transaction block
+            conn.commit()
+            conn.autocommit = True
+            try:
+                invalid = [name for name, valid in index_state(cursor, migration_indexes(statements)).items() if not valid]
+                for name in invalid:
+                    # Left behind by a failed concurrent build; IF NOT EXISTS would skip it forever
+                    logging.warning("Dropping invalid index %s before rebuilding it", name)
+                    cursor.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name};")
+                for statement in statements:
+                    cursor.execute(statement)
+            finally:
+                conn.autocommit = False
+        duration_ms = int((time.perf_counter() - started) * 1000)
+        cursor.execute(
+            "INSERT INTO whatsapp_schema_migrations (version, description, duration_ms) VALUES (%s, %s, %s);",
+            (version, description, duration_ms),
+        )
+    conn.commit()
+    logging.info("Applied schema migration %s (%s) in %sms", version, description, duration_ms)
+
+
+@contextmanager
+def advisory_lock(conn, key, wait):
+    """Hold a session advisory lock for the block; yields False if it wasn't free within wait seconds."""
+    deadline = time.monotonic() + wait
+    with conn.cursor() as cursor:
+        # Polled instead of blocking in pg_advisory_lock: a session waiting inside a statement
+        # holds a snapshot, and CREATE INDEX CONCURRENTLY in the migrating session waits for it
+        while True:
+            cursor.execute("SELECT pg_try_advisory_lock(%s)", (key,))
+            locked = cursor.fetchone()[0]
+            conn.commit()
+            if locked or time.monotonic() >= deadline:
+                break
+            time.sleep(1)
+        if not locked:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            cursor.execute("SELECT pg_advisory_unlock(%s)", (key,))
+            conn.commit()
+
+
+def migrate(conn, target=None, transactional=None, lock_wait=None):
+    """
+    Apply pending migrations up to target (all by default) on conn and return the versions applied.
+    Transactional migrations go first, in version order, then the concurrent index builds, each kind
+    under its own lock; transactional=True or False applies only that kind. A kind whose lock is
+    held by another process for longer than lock_wait is skipped.
+    """
+    lock_wait = migration_config['lock_wait'] if lock_wait is None else lock_wait
+    applied = []
+    for kind, lock_key in ((True, _MIGRATION_LOCK_KEY), (False, _INDEX_BUILD_LOCK_KEY)):
+        if transactional is not None and kind != transactional:
+            continue
+        migrations = [migration for migration in MIGRATIONS
+                      if migration[3] == kind and (target is None or migration[0] <= target)]
+        if not migrations:
+            continue
+
+        with advisory_lock(conn, lock_key, lock_wait) as locked:
+            if not locked:
+                logging.warning("Schema migrations are running in another process; skipping them here",
+                                extra={"transactional": kind})
+                continue
+            with conn.cursor() as cursor:
+                done = applied_versions(cursor)
+            conn.commit()
+            for version, description, statements, _ in migrations:
+                if version in done:
+                    continue
+                try:
+                    apply_migration(conn, version, description, statements, kind)
+                except Exception:
+                    conn.rollback()
+                    raise
+                applied.append(version)
+    return applied
+
+
+def verify_indexes(conn, done):
+    """Return the indexes of the applied migrations (versions in done) that are missing or invalid, logging them."""
+    required = [name for version, _, statements, _ in MIGRATIONS if version in done
+                for name in migration_indexes(statements)]
+    with conn.cursor() as cursor:
+        state = index_state(cursor, required)
+    conn.rollback()
+    missing = [name for name in required if name not in state]
+    invalid = [name for name in required if state.get(name) is False]
+    if missing or invalid:
+        logging.error("Schema is missing indexes the hot queries rely on; expect sequential scans",
+                      extra={"missing_indexes": missing, "invalid_indexes": invalid})
+    return {"missing_indexes": missing, "invalid_indexes": invalid}
+
+
+def index_build_running(cursor):
+    # Single bigint advisory keys show up in pg_locks as classid 0, objid key, objsubid 1
+    cursor.execute("""
+        SELECT EXISTS (
+            SELECT 1 FROM pg_locks
+            WHERE locktype = 'advisory' AND granted AND classid = 0 AND objid = %s AND objsubid = 1
+              AND database = (SELECT oid FROM pg_database WHERE datname = current_database())
+        );
+    """, (_INDEX_BUILD_LOCK_KEY,))
+    return cursor.fetchone()[0]
+
+
+def schema_status():
+    with get_connection() as conn, conn.cursor() as cursor:
+        done = applied_versions(cursor)
+        building = index_build_running(cursor)
+        conn.commit()
+        return {
+            "version": max(done, default=0),
+            "latest_version": LATEST_VERSION,
+            "pending": [version for version, *_ in MIGRATIONS if version not in done],
+            "index_build_running": building,
+            **verify_indexes(conn, done),
+        }
+
+
+def build_indexes():
+    """Apply the pending concurrent index builds; runs on a background thread started by ensure_schema()."""
+    try:
+        # A dedicated connection: a build can take minutes and shouldn't hold a pool slot that long
+        with closing(psycopg2.connect(**conn_config)) as conn:
+            applied = migrate(conn, transactional=False, lock_wait=0)
+            if applied:
+                logging.info("Built the indexes of schema migrations %s", applied)
+            with conn.cursor() as cursor:
+                done = applied_versions(cursor)
+            conn.commit()
+            verify_indexes(conn, done)
+    except Exception as e:
+        logging.error(f"Error building schema indexes: {e}")
+
+
+def ensure_schema():
+    """
+    Apply pending transactional migrations and check their indexes. Concurrent index builds never
+    gate startup: they run on a background thread, or are left to python -m modules.schema when
+    SCHEMA_INDEX_BUILDS=manual.
+    """
+    try:
+        with get_connection() as conn:
+            applied = migrate(conn, transactional=True)
+            if applied:
+                logging.info("Applied schema migrations %s", applied)
+            with conn.cursor() as cursor:
+                done = applied_versions(cursor)
+            conn.commit()
+            verify_indexes(conn, done)
+    except Exception as e:
+        logging.error(f"Error applying schema migrations: {e}")
+        return
+
+    pending = [version for version, _, _, transactional in MIGRATIONS if not transactional and version not in done]
+    if not pending:
+        return
+    if migration_config['index_builds'] == "background":
+        threading.Thread(target=build_indexes, name="schema-index-builds", daemon=True).start()
+    else:
+        logging.warning("Schema migrations %s are pending; run python -m modules.schema to build their indexes", pending)
+
+
+if __name__ == "__main__":
+    from modules.log import configure_logging
+
+    configure_logging()
+    # Out of band: everything, index builds included, in the foreground
+    with get_connection() as conn:
+        migrate(conn)
+    print(schema_status())
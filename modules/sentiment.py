@@ -1,120 +1,406 @@
-from fastapi import FastAPI, HTTPException
-import psycopg2
 import logging
 import json
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from itertools import groupby
+from operator import itemgetter
+import openai
 from openai import OpenAI
-from modules.config.database import conn_config
+from psycopg2.extras import execute_values
+from modules.db import get_connection
+from modules.dashboard_cache import dashboard_cache
+from modules.gpt_cache import gpt_cache, cache_key
+from modules.analyzers import SentimentAnalyzer, LexiconAnalyzer, FallbackAnalyzer
 
-# client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+_client = None
+_client_lock = threading.Lock()
 
-# Sentiment analysis function
-def analyze_topic_and_sentiment(messages):
-    prompt = f"""
+def get_openai_client():
+    """
+    Shared OpenAI client, created on first use. OPENAI_BASE_URL points it at another
+    OpenAI-compatible endpoint, e.g. benchmarks/sentiment_concurrency.py's fake server.
+    """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = OpenAI(
+                    api_key=os.getenv("OPENAI_API_KEY"),
+                    base_url=os.getenv("OPENAI_BASE_URL") or None,
+                    timeout=float(os.getenv("OPENAI_TIMEOUT", "120")),
+                )
+    return _client
+
+GPT_MODEL = "gpt-4"
+PROMPT_VERSION = 1                  # Bump when PROMPT_TEMPLATE changes so cached results are not reused
+CONTEXT_WINDOW_TOKENS = 8192        # gpt-4 context window
+RESPONSE_MAX_TOKENS = 400           # Room for the JSON answer; 150 truncated it mid-object
+PROMPT_SAFETY_MARGIN = 256          # Slack for token-count estimation error
+TOP_TOPICS = 10                     # Topics kept after merging batch results
+SENTIMENT_CONCURRENCY = int(os.getenv("SENTIMENT_CONCURRENCY", "8"))  # Groups analyzed in parallel
+SENTIMENT_ANALYZER = os.getenv("SENTIMENT_ANALYZER", "gpt")  # "gpt" (lexicon fallback) or "lexicon" (offline only)
+LEXICON_MIN_MESSAGES = int(os.getenv("SENTIMENT_LEXICON_MIN_MESSAGES", "0"))  # Groups this large skip GPT; 0 = never
+SENTIMENT_INTERVAL_MINUTES = int(os.getenv("SENTIMENT_INTERVAL_MINUTES", "30"))  # How often the scheduled job runs
+GPT_COOLDOWN_SECONDS = 60           # After GPT fails outright, skip it for this long
+
+SENTIMENT_KEYS = ("Positive", "Neutral", "Negative", "Commercial")
+
+PROMPT_TEMPLATE = """
     Analyze the following messages collectively for sentiment and topics. Ensure to provide a structured JSON response as follows:
     {{
         "sentiment_data": {{"Positive": int, "Neutral": int, "Negative": int, "Commercial": int}},
         "topic_data": [{{"topic": "string", "frequency": int}}, ...]
     }}
     Provide aggregated sentiment data and at least 6 important topics with their frequencies across all messages. The topics should be the most relevant ones based on the messages.
-    Messages: {json.dumps(messages)}
+    Messages: {messages}
     """
-    print("Messages Batch Prompt:", prompt)
-    return call_gpt_api(prompt)
+
+try:
+    import tiktoken
+    _encoding = tiktoken.encoding_for_model(GPT_MODEL)
+except Exception:
+    _encoding = None
+
+
+def count_tokens(text):
+    """Token count for text; falls back to a conservative 3-characters-per-token estimate."""
+    if _encoding is not None:
+        return len(_encoding.encode(text))
+    return len(text) // 3 + 1
+
+
+def batch_token_budget():
+    """Tokens available for the messages themselves in one prompt."""
+    overhead = count_tokens(PROMPT_TEMPLATE.format(messages="[]"))
+    return CONTEXT_WINDOW_TOKENS - RESPONSE_MAX_TOKENS - PROMPT_SAFETY_MARGIN - overhead
+
+
+def chunk_messages(messages, budget):
+    """Split messages into consecutive batches whose JSON encoding fits in `budget` tokens."""
+    empty = 2  # The surrounding brackets
+    batches = []
+    current, current_tokens = [], empty
+    for message in messages:
+        encoded = json.dumps(message)
+        tokens = count_tokens(encoded) + 1  # +1 for the separating comma
+        # A single oversized message is cut down so it fits a batch on its own. Escaping makes
+        # tokens uneven along the message, so a proportional cut is repeated until it fits.
+        while empty + tokens > budget and len(message) > 1:
+            message = message[:max(1, min(len(message) - 1, len(message) * (budget - empty) // tokens))]
+            tokens = count_tokens(json.dumps(message)) + 1
+        if current and current_tokens + tokens > budget:
+            batches.append(current)
+            current, current_tokens = [], empty
+        current.append(message)
+        current_tokens += tokens
+    if current:
+        batches.append(current)
+    return batches
+
+
+def merge_analyses(analyses):
+    """Reduce per-batch results into one: sentiment counts add up, topic frequencies are summed by name."""
+    sentiment_data = {key: 0 for key in SENTIMENT_KEYS}
+    topics = {}  # normalized topic -> [display name, frequency]
+    for analysis in analyses:
+        for key in SENTIMENT_KEYS:
+            try:
+                sentiment_data[key] += int(analysis.get("sentiment_data", {}).get(key, 0) or 0)
+            except (TypeError, ValueError):
+                pass
+        for item in analysis.get("topic_data", []) or []:
+            if not isinstance(item, dict) or not item.get("topic"):
+                continue
+            name = str(item["topic"]).strip()
+            entry = topics.setdefault(name.casefold(), [name, 0])
+            try:
+                entry[1] += int(item.get("frequency", 0) or 0)
+            except (TypeError, ValueError):
+                pass
+
+    topic_data = sorted(
+        ({"topic": name, "frequency": frequency} for name, frequency in topics.values()),
+        key=lambda item: item["frequency"],
+        reverse=True,
+    )[:TOP_TOPICS]
+    return {"sentiment_data": sentiment_data, "topic_data": topic_data}
+
+
+class GPTAnalyzer(SentimentAnalyzer):
+    """
+    Map-reduce over token-budgeted batches: each batch is analyzed on its own and the
+    results are merged, so busy groups never exceed the model's context window.
+    """
+
+    name = "gpt"
+
+    def __init__(self, cooldown=GPT_COOLDOWN_SECONDS):
+        self.cooldown = cooldown
+        self._unavailable_until = 0.0
+
+    def analyze(self, messages):
+        # Right after an outage, rate limit or missing credentials, don't wait on more API errors
+        if time.monotonic() < self._unavailable_until:
+            return None
+        try:
+            result = _analyze_with_gpt(messages)
+        except GPTUnavailable as e:
+            # Every group would hit the same error; an unusable answer for one group (None) doesn't count
+            logging.error(f"GPT unavailable, using the fallback for {self.cooldown}s: {e}")
+            self._unavailable_until = time.monotonic() + self.cooldown
+            return None
+        if result:
+            result["analyzer"] = self.name
+        return result
+
+_analyzer = None
+
+def get_analyzer():
+    global _analyzer
+    if _analyzer is None:
+        lexicon = LexiconAnalyzer(top_topics=TOP_TOPICS)
+        if SENTIMENT_ANALYZER == "lexicon":
+            _analyzer = lexicon
+        else:
+            _analyzer = FallbackAnalyzer(GPTAnalyzer(), lexicon, fallback_above=LEXICON_MIN_MESSAGES)
+    return _analyzer
+
+# Sentiment analysis function
+def analyze_topic_and_sentiment(messages):
+    return get_analyzer().analyze(messages)
+
+def _analyze_with_gpt(messages):
+    batches = chunk_messages(messages, batch_token_budget())
+    analyses = []
+    for index, batch in enumerate(batches):
+        # Identical batches (reruns, manual /sentiment calls) are answered from the cache
+        key = cache_key(batch, PROMPT_VERSION, GPT_MODEL)
+        analysis = gpt_cache.get(key)
+        if analysis is None:
+            prompt = PROMPT_TEMPLATE.format(messages=json.dumps(batch))
+            logging.debug("Messages batch prompt %d/%d (%d messages)", index + 1, len(batches), len(batch))
+            analysis = call_gpt_api(prompt)
+            if analysis:
+                gpt_cache.set(key, analysis)
+        if analysis:
+            analyses.append(analysis)
+        else:
+            logging.warning(f"Sentiment batch {index + 1}/{len(batches)} failed; merging the remaining batches")
+
+    if not analyses:
+        return None
+    return merge_analyses(analyses)
+
+def _parse_json_response(content):
+    # Models sometimes wrap the JSON in a markdown code fence
+    content = content.strip()
+    if content.startswith("```"):
+        content = content.strip("`")
+        if content.startswith("json"):
+            content = content[4:]
+    return json.loads(content)
+
+class GPTUnavailable(Exception):
+    """The API itself failed (connection, credentials, rate limit, server error), not one prompt's answer."""
+
+
+def _is_outage(error):
+    if isinstance(error, openai.APIConnectionError):  # Includes timeouts
+        return True
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code in (401, 403, 429) or error.status_code >= 500
+    # Client setup errors such as a missing OPENAI_API_KEY
+    return isinstance(error, openai.OpenAIError) and not isinstance(error, openai.APIError)
 
 # Unified function to call the GPT API
 def call_gpt_api(prompt):
     """
     A unified function to call the GPT API with the provided prompt.
-    Returns the parsed response.
+    Returns the parsed response, or None when this prompt's answer is unusable.
+    Raises GPTUnavailable when the API itself fails.
     """
     try:
-        response = client.chat.completions.create(
-            model="gpt-4",  # Use a suitable GPT model
+        response = get_openai_client().chat.completions.create(
+            model=GPT_MODEL,  # Use a suitable GPT model
             messages=[{"role": "user", "content": prompt}],
-            max_tokens=150
+            max_tokens=RESPONSE_MAX_TOKENS
         )
 
         raw_response_content = response.choices[0].message.content.strip()
-        print("GPT Response:", raw_response_content)
-        return json.loads(raw_response_content)
+        logging.debug("GPT response: %s", raw_response_content)
+        return _parse_json_response(raw_response_content)
 
     except Exception as e:
+        if _is_outage(e):
+            raise GPTUnavailable(str(e)) from e
         logging.error(f"Error during GPT API call: {e}")
         return None
     
-from collections import defaultdict
+def analyze_groups(grouped_messages, concurrency=None):
+    """
+    Analyze many groups concurrently. Takes an iterable of (key, messages) and yields
+    (key, analysis) in the same order. At most `concurrency` groups are in flight, so an
+    iterable that produces groups lazily is never read far ahead of the results.
+    """
+    concurrency = max(1, concurrency or SENTIMENT_CONCURRENCY)
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="sentiment") as executor:
+        in_flight = deque()
+        for key, messages in grouped_messages:
+            in_flight.append((key, executor.submit(analyze_topic_and_sentiment, messages)))
+            if len(in_flight) >= concurrency:
+                key, future = in_flight.popleft()
+                yield key, future.result()
+        while in_flight:
+            key, future = in_flight.popleft()
+            yield key, future.result()
+
+MESSAGE_FETCH_SIZE = 2000  # Rows per round-trip from the server-side cursor
+WATERMARK_LAG = timedelta(minutes=5)       # Leave the newest messages for the next run in case of late writes
+INITIAL_LOOKBACK = timedelta(days=1)       # Where a group without a watermark starts
+MAX_LOOKBACK = timedelta(days=7)           # A run never reaches further back than this, whatever the watermark
+
+# Arbitrary constant for pg_try_advisory_lock so only one analysis runs at a time
+_SENTIMENT_LOCK_KEY = 720502
+
+def get_groups_message(cutoff=None):
+    """
+    Yield ((group_name, tenant_id, window_end), messages) for every group with messages newer
+    than its watermark in whatsapp_sentiment_watermarks, up to `cutoff`. window_end is the
+    newest message_time in the group's batch and becomes its next watermark.
+    Rows are streamed from a server-side cursor sorted by tenant and group, so only one
+    group's messages are held in memory at a time.
+    """
+    cutoff = cutoff or datetime.now() - WATERMARK_LAG
 
-from datetime import datetime,timedelta
-def get_groups_message():
     try:
-        # Connect to PostgreSQL database
-        conn = psycopg2.connect(**conn_config)
-        cursor = conn.cursor()
-
-        # Get today's date and calculate the previous day
-        today = datetime.now()
-        previous_day = today - timedelta(days=1)
-        previous_day_str = previous_day.strftime("%Y-%m-%d 00:00:00")  # Start of the previous day
-
-        # Fetch messages from the previous day
-        cursor.execute("""
-            SELECT group_name, message_time, message, phone_number, sender, tenant_id
-            FROM whatsapp_messages
-            WHERE message_time >= %s AND message_time < %s
-        """, (previous_day_str, today.strftime("%Y-%m-%d 00:00:00")))
-        rows = cursor.fetchall()
-
-        # Log the rows returned from the database
-        print("Fetched Rows:", rows)  # Log to see if we're getting data
-
-        # If no rows are returned, return an empty dictionary
-        if not rows:
-            return {}
-
-        # Organize messages by group (group_name, tenant_id as the key)
-        grouped_messages = {}
-        for row in rows:
-            group_name = row[0]
-            message = row[2]
-            tenant_id = row[5]  # Make sure tenant_id is at index 5 (as it's in the SELECT query)
-
-            # Use (group_name, tenant_id) as the key for grouped_messages
-            if (group_name, tenant_id) not in grouped_messages:
-                grouped_messages[(group_name, tenant_id)] = []  # Initialize list for each (group_name, tenant_id) pair
-            
-            grouped_messages[(group_name, tenant_id)].append(message)
-
-        # Log the grouped messages to confirm the structure
-        print("Grouped Messages:", grouped_messages)  # Check the structure of the data
-
-        return grouped_messages  # Ensure we're returning a dictionary of (group_name, tenant_id) -> messages
+        # The named cursor lives in the connection's transaction, so the connection
+        # stays checked out until the last group has been consumed
+        with get_connection() as conn, conn.cursor(name="sentiment_messages") as cursor:
+            cursor.itersize = MESSAGE_FETCH_SIZE
+            cursor.execute("""
+                SELECT m.tenant_id, m.group_name, m.message, m.message_time
+                FROM whatsapp_messages m
+                LEFT JOIN whatsapp_sentiment_watermarks w
+                    ON w.tenant_id = m.tenant_id AND w.group_name = m.group_name
+                WHERE m.message_time > COALESCE(w.last_message_time, %(initial)s)
+                  AND m.message_time > %(floor)s
+                  AND m.message_time <= %(cutoff)s
+                ORDER BY m.tenant_id, m.group_name, m.message_time
+            """, {"initial": cutoff - INITIAL_LOOKBACK, "floor": cutoff - MAX_LOOKBACK, "cutoff": cutoff})
+
+            for (tenant_id, group_name), rows in groupby(cursor, key=itemgetter(0, 1)):
+                rows = list(rows)
+                yield (group_name, tenant_id, rows[-1][3]), [row[2] for row in rows]
 
     except Exception as e:
         logging.error(f"Error fetching messages: {e}")
-        return {}  # Return an empty dictionary if there's an error
 
-    finally:
-        cursor.close()
-        conn.close()
-    
-# Function to insert sentiment and topic data into the database
-def save_sentiment_data(group_name, sentiment_data, topic_data, time,tenant_id):
+SENTIMENT_INSERT_PAGE_SIZE = 1000  # Rows per multi-row INSERT statement
+
+# Upsert many sentiment rows and advance their watermarks in one transaction
+def save_sentiment_batch(rows):
+    """
+    Write (group_name, sentiment_data, topic_data, created_at, tenant_id, window_end, analyzer) tuples
+    to whatsapp_sentiment with multi-row INSERTs in a single transaction. A row for a window that
+    was already saved replaces it, and each group's watermark moves to its window_end in the
+    same transaction. Returns the number of rows written.
+    """
+    if not rows:
+        return 0
+
+    started = time.perf_counter()
     try:
-        # Connect to the PostgreSQL database
-        conn = psycopg2.connect(**conn_config)
-        cursor = conn.cursor()
-
-        # Prepare SQL query to insert the data
-        cursor.execute("""
-            INSERT INTO whatsapp_sentiment (group_name,created_at, sentiment_data, topic_data,tenant_id)
-            VALUES (%s, %s, %s, %s,%s)
-        """, (group_name, time, json.dumps(sentiment_data), json.dumps(topic_data),tenant_id))
-        
-        conn.commit()
+        with get_connection() as conn, conn.cursor() as cursor:
+            execute_values(cursor, """
+                INSERT INTO whatsapp_sentiment (group_name, created_at, sentiment_data, topic_data, tenant_id, window_end, analyzer)
+                VALUES %s
+                ON CONFLICT (tenant_id, group_name, window_end) WHERE window_end IS NOT NULL
+                DO UPDATE SET created_at = EXCLUDED.created_at,
+                              sentiment_data = EXCLUDED.sentiment_data,
+                              topic_data = EXCLUDED.topic_data,
+                              analyzer = EXCLUDED.analyzer
+            """, [
+                (group_name, created_at, json.dumps(sentiment_data), json.dumps(topic_data), tenant_id, window_end, analyzer)
+                for group_name, sentiment_data, topic_data, created_at, tenant_id, window_end, analyzer in rows
+            ], page_size=SENTIMENT_INSERT_PAGE_SIZE)
+
+            watermarks = {}
+            for group_name, _, _, _, tenant_id, window_end, _ in rows:
+                if window_end is not None:
+                    key = (tenant_id, group_name)
+                    watermarks[key] = max(window_end, watermarks.get(key, window_end))
+            execute_values(cursor, """
+                INSERT INTO whatsapp_sentiment_watermarks (tenant_id, group_name, last_message_time)
+                VALUES %s
+                ON CONFLICT (tenant_id, group_name)
+                DO UPDATE SET last_message_time = GREATEST(whatsapp_sentiment_watermarks.last_message_time, EXCLUDED.last_message_time),
+                              updated_at = now()
+            """, [(tenant_id, group_name, window_end) for (tenant_id, group_name), window_end in watermarks.items()],
+                page_size=SENTIMENT_INSERT_PAGE_SIZE)
+
+            conn.commit()
 
     except Exception as e:
-        logging.error(f"Error saving sentiment data: {e}")
-    finally:
-        cursor.close()
-        conn.close()
-    
\ No newline at end of file
+        logging.error(f"Error saving sentiment data ({len(rows)} rows): {e}")
+        return 0
+
+    # New sentiment rows change the dashboards of every tenant involved
+    for tenant_id in {row[4] for row in rows}:
+        dashboard_cache.invalidate(tenant_id)
+
+    elapsed = time.perf_counter() - started
+    logging.info(f"Saved {len(rows)} sentiment rows in {elapsed:.3f}s ({len(rows) / max(elapsed, 1e-9):.0f} rows/s)")
+    return len(rows)
+
+# Function to insert sentiment and topic data into the database
+def save_sentiment_data(group_name, sentiment_data, topic_data, created_at, tenant_id, window_end=None, analyzer=None):
+    save_sentiment_batch([(group_name, sentiment_data, topic_data, created_at, tenant_id, window_end, analyzer)])
+
+def run_sentiment_analysis(concurrency=None):
+    """
+    Analyze every group's messages since its watermark. Safe to run often and to rerun:
+    a window is only ever stored once, and overlapping runs are skipped.
+    """
+    with get_connection() as lock_conn, lock_conn.cursor() as lock_cursor:
+        # Session-level lock so a manual /sentiment call and the scheduled job don't overlap
+        lock_cursor.execute("SELECT pg_try_advisory_lock(%s)", (_SENTIMENT_LOCK_KEY,))
+        if not lock_cursor.fetchone()[0]:
+            return {"status": "Sentiment analysis already running"}
+        lock_conn.commit()  # The lock is session-level; don't sit idle in a transaction while analyzing
+        try:
+            results = []
+
+            # Groups are streamed from the database and analyzed in parallel; results come back
+            # in the order the groups were fetched
+            for (group_name, tenant_id, window_end), analysis in analyze_groups(get_groups_message(), concurrency):
+                logging.debug("Analyzed group %s", group_name, extra={"tenant_id": tenant_id})
+
+                # A failed group keeps its watermark and is retried next run
+                if analysis:
+                    sentiment_data = analysis.get("sentiment_data", {"Positive": 0, "Neutral": 0, "Negative": 0, "Commercial": 0})
+                    topic_data = analysis.get("topic_data", {})
+
+                    # Get current timestamp for the time when the sentiment data is processed
+                    current_time = datetime.now()
+
+                    results.append((group_name, sentiment_data, topic_data, current_time, tenant_id, window_end,
+                                    analysis.get("analyzer")))
+
+            # Save the whole run at once instead of one connection and commit per group
+            started = time.perf_counter()
+            saved = save_sentiment_batch(results)
+            elapsed = time.perf_counter() - started
+        finally:
+            lock_cursor.execute("SELECT pg_advisory_unlock(%s)", (_SENTIMENT_LOCK_KEY,))
+            lock_conn.commit()
+
+    return {
+        "status": "Sentiment analysis completed successfully",
+        "rows_saved": saved,
+        "rows_per_second": round(saved / elapsed) if saved else 0,
+        "gpt_cache": gpt_cache.stats()
+    }
@@ -0,0 +1,186 @@
+"""
+One-pass spam keyword matching for bot configs.
+
+BotConfig.spamKeywordsActions maps keywords (or phrases) to actions. A bot
+can have hundreds of them, so instead of testing each keyword against each
+message they are compiled into an Aho-Corasick automaton: a trie of the
+keywords with failure links, which finds every occurrence of every keyword
+in a single left-to-right scan. The cost per message depends on its length,
+not on the number of keywords.
+
+The scan uses the pyahocorasick C extension when it is installed and a
+pure-Python automaton otherwise; both report the same matches.
+
+Matching is case-insensitive and on word boundaries ("sale" does not match
+"wholesale"). Compiled matchers are cached per bot and rebuilt once the
+tenant's bot config version (modules/bot_config_cache.py) has moved on.
+"""
+import threading
+from collections import deque
+
+try:
+    import ahocorasick
+except ImportError:
+    ahocorasick = None
+
+from modules.bot_config_cache import bot_configs
+from modules.config.cache import spam_matcher_cache_config
+from modules.dashboard_cache import LRUCache
+
+MESSAGE_LIMIT_ACTION_KEY = "messageLimit"  # Reserved spamKeywordsActions entry, see SpamMatcherCache.get
+
+# When several keywords match, the most severe action wins; unknown actions rank lowest
+ACTION_SEVERITY = {"remove": 4, "ban": 4, "block": 4, "kick": 3, "delete": 3, "mute": 2, "warn": 1}
+
+
+class KeywordAutomaton:
+    def __init__(self, keyword_actions):
+        self.keywords = []   # pattern index -> (keyword, action)
+        self._goto = [{}]    # node -> {char: node}
+        self._fail = [0]
+        self._output = [()]  # node -> (pattern index, length, check start, check end) ending here
+        self._native = ahocorasick.Automaton() if ahocorasick is not None else None
+
+        for keyword, action in (keyword_actions or {}).items():
+            pattern = " ".join(str(keyword).casefold().split())
+            if pattern:
+                # Word boundaries only matter at edges that are themselves word characters ("₹" matches in "₹500")
+                entry = (len(self.keywords), len(pattern), pattern[0].isalnum(), pattern[-1].isalnum())
+                if self._native is not None:
+                    self._add_native(pattern, entry)
+                else:
+                    self._add(pattern, entry)
+                self.keywords.append((str(keyword), action))
+
+        if self._native is not None:
+            if len(self._native):
+                self._native.make_automaton()
+            else:
+                self._native = None  # An empty automaton can't be searched; the Python trie is empty too
+        else:
+            self._build_failure_links()
+
+    def __len__(self):
+        return len(self.keywords)
+
+    def _add_native(self, pattern, entry):
+        # Keywords that only differ in spacing/case collapse to one pattern; keep them all
+        existing = self._native.get(pattern, ())
+        self._native.add_word(pattern, existing + (entry,))
+
+    def _add(self, pattern, entry):
+        node = 0
+        for char in pattern:
+            next_node = self._goto[node].get(char)
+            if next_node is None:
+                next_node = len(self._goto)
+                self._goto[node][char] = next_node
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append(())
+            node = next_node
+        self._output[node] += (entry,)
+
+    def _build_failure_links(self):
+        # Breadth-first, so a node's failure target is always finished before the node
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, child in self._goto[node].items():
+                queue.append(child)
+                fallback = self._fail[node]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                target = self._goto[fallback].get(char, 0)
+                self._fail[child] = target if target != child else 0
+                self._output[child] += self._output[self._fail[child]]
+
+    def _scan(self, text):
+        # (end, entries) for every node with output, C extension or pure Python
+        if self._native is not None:
+            for last, entries in self._native.iter(text):
+                yield last + 1, entries
+            return
+        goto, fail, output = self._goto, self._fail, self._output
+        node = 0
+        for position, char in enumerate(text):
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            if output[node]:
+                yield position + 1, output[node]
+
+    def find(self, text):
+        """Yield (pattern index, start, end) for every whole-word keyword occurrence in text."""
+        text = text.casefold()
+        for end, entries in self._scan(text):
+            for index, length, check_start, check_end in entries:
+                start = end - length
+                # Whole words only: the keyword must not be glued to letters or digits
+                if check_start and start > 0 and text[start - 1].isalnum():
+                    continue
+                if check_end and end < len(text) and text[end].isalnum():
+                    continue
+                yield index, start, end
+
+    def classify(self, text):
+        """Keywords found in text with their counts, and the most severe action among them."""
+        counts = {}
+        for index, _, _ in self.find(" ".join(str(text or "").split())):
+            counts[index] = counts.get(index, 0) + 1
+
+        matches = [
+            {"keyword": self.keywords[index][0], "action": self.keywords[index][1], "count": count}
+            for index, count in sorted(counts.items())
+        ]
+        action = max((match["action"] for match in matches),
+                     key=lambda action: ACTION_SEVERITY.get(str(action).lower(), 0), default=None)
+        return {"matches": matches, "action": action}
+
+
+class SpamMatcherCache:
+    """Compiled automatons per (tenant, bot), built on first use and rebuilt after config changes."""
+
+    def __init__(self, ttl, max_bots, max_patterns):
+        self.ttl = ttl
+        self._cache = LRUCache(max_bots, max_patterns)  # Entry size is the bot's keyword count
+        self._lock = threading.Lock()
+        self._counters = {"hits": 0, "builds": 0, "stale": 0}
+
+    def get(self, tenant_id, bot_id, load):
+        """
+        (is_bot_enabled, automaton, message_limit, message_limit_action) for the bot, or None if it
+        doesn't exist. load() returns (is_bot_enabled, keyword -> action map, message_limit) or None
+        and is only called to build a missing entry.
+        """
+        key = (tenant_id, bot_id)
+        version = bot_configs.config_version(tenant_id)
+        cached = self._cache.get(key)
+        if cached is not None:
+            if cached[0] == version:
+                with self._lock:
+                    self._counters["hits"] += 1
+                return cached[1]
+            with self._lock:
+                self._counters["stale"] += 1
+
+        config = load()
+        if config is None:
+            return None
+        is_bot_enabled, keyword_actions, message_limit = config
+        # "messageLimit" in the keyword map names the action for senders over the limit; it is not a keyword
+        keyword_actions = dict(keyword_actions or {})
+        message_limit_action = keyword_actions.pop(MESSAGE_LIMIT_ACTION_KEY, None)
+        entry = (is_bot_enabled, KeywordAutomaton(keyword_actions), message_limit, message_limit_action)
+        self._cache.set(key, (version, entry), max(1, len(entry[1])), self.ttl)
+        with self._lock:
+            self._counters["builds"] += 1
+        return entry
+
+    def stats(self):
+        with self._lock:
+            counters = dict(self._counters)
+        return {**counters, "bots": len(self._cache), "patterns": self._cache.size_bytes}
+
+
+spam_matchers = SpamMatcherCache(**spam_matcher_cache_config)
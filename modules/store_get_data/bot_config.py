@@ -1,15 +1,17 @@
+import logging
 import psycopg2
-from modules.config.database import conn_config
+from modules.db import get_connection
 from fastapi import HTTPException
 from modules.model.bot_config import BotConfig,BotLog,BotConfigResponse
+from modules.spam_matcher import spam_matchers
+from modules.bot_config_cache import bot_configs
+from modules.bot_log_sink import bot_log_sink
+from modules.rate_limiter import message_limiter
 import json
+from datetime import datetime, timezone
 
 def store_bot_config(bot: BotConfig, tenant_id):
     try:
-        # Connect to the PostgreSQL database
-        conn = psycopg2.connect(**conn_config)
-        cursor = conn.cursor()
-
         # Extract and handle bot configuration values
         is_bot_enabled = bot.isBotEnabled if bot.isBotEnabled is not None else True  # Default to True if not provided
         spamKeywordsActions = json.dumps(bot.spamKeywordsActions) if bot.spamKeywordsActions else json.dumps({"spam": "warn"})  # Convert dict to JSON
@@ -23,47 +25,51 @@ def store_bot_config(bot: BotConfig, tenant_id):
         logs = bot.logs if bot.logs else []
 
         # Log the values being inserted for debugging purposes
-        print(f"Inserting bot data: {bot.name}, {is_bot_enabled}, {spamKeywordsActions}, {message_limit}, {reply_message},{ai_detection},{ai_reply},{prompt},{tenant_id}")
+        logging.debug("Inserting bot config %s for tenant %s", bot.name, tenant_id,
+                      extra={"enabled": is_bot_enabled, "keywords": spamKeywordsActions, "message_limit": message_limit})
 
         # Insert bot data into the database
         insert_query = """
         INSERT INTO whatsapp_botconfig (name, isbotenabled, spam_keywords_actions, messagelimit, replymessage, ai_detection, ai_reply, prompt, tenant_id)
         VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
         """
-        
-        cursor.execute(
-            insert_query,
-            (
-                bot.name,
-                is_bot_enabled,  
-                spamKeywordsActions,  # JSON data for keyword-action mapping
-                message_limit,   # Message limit
-                reply_message,   # Reply message for spam detection
-                ai_detection,    # AI detection flag
-                ai_reply,
-                prompt,
-                tenant_id
-            ),
-        )
-        conn.commit()  # Commit the transaction to save the data
+
+        with get_connection() as conn, conn.cursor() as cursor:
+            cursor.execute(
+                insert_query,
+                (
+                    bot.name,
+                    is_bot_enabled,
+                    spamKeywordsActions,  # JSON data for keyword-action mapping
+                    message_limit,   # Message limit
+                    reply_message,   # Reply message for spam detection
+                    ai_detection,    # AI detection flag
+                    ai_reply,
+                    prompt,
+                    tenant_id
+                ),
+            )
+            conn.commit()  # Commit the transaction to save the data
+
+        bot_configs.bump(tenant_id)
 
         # Return success response
         return {"message": f"Bot {bot.name} added successfully"}
 
     except Exception as e:
-        print(f"Error occurred: {str(e)}")
+        logging.error(f"Error occurred: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Internal Server Error: {str(e)}")
-
-    finally:
-        if cursor:
-            cursor.close()
-        if conn:
-            conn.close()
     
 def fetch_bot_config_from_db(tenant_id):
+    # Reuses the tenant's last response until a config or log write bumps its version
+    return bot_configs.get(tenant_id, lambda: load_bot_configs(tenant_id),
+                           size=lambda response: len(response.bots) + sum(len(bot.logs or []) for bot in response.bots))
+
+
+def load_bot_configs(tenant_id):
     try:
-        # Connect to the PostgreSQL database
-        with psycopg2.connect(**conn_config) as conn:
+        # Check out a pooled connection
+        with get_connection() as conn:
             with conn.cursor() as cursor:
                 # Fetch all bot configurations for the tenant
                 cursor.execute("""
@@ -73,12 +79,10 @@ def fetch_bot_config_from_db(tenant_id):
                     FROM whatsapp_botconfig
                     WHERE tenant_id = %s;
                 """, (tenant_id,))
-                bot_configs = cursor.fetchall()
-                print(f"Fetched bot configurations: {bot_configs}")
+                config_rows = cursor.fetchall()
 
                 # Check if no bot configurations are found
-                if not bot_configs:
-                    print("No bot configurations found for the given tenant_id.")
+                if not config_rows:
                     return BotConfigResponse(bots=[], detail="No bot found")
 
                 # Fetch logs for all bots associated with the tenant
@@ -92,7 +96,6 @@ def fetch_bot_config_from_db(tenant_id):
                     LIMIT 10;
                 """, (tenant_id,))
                 logs = cursor.fetchall()
-                print(f"Fetched all logs: {logs}")
                 if not logs:
                     logs = []
 
@@ -115,13 +118,11 @@ def fetch_bot_config_from_db(tenant_id):
 
         # Prepare BotConfig objects
         bots = []
-        for bot in bot_configs:
+        for bot in config_rows:
             # Unpack bot configuration columns
             (bot_id, name, is_bot_enabled, spam_keywords_actions, message_limit, reply_message, 
               ai_detection, ai_reply, prompt, tenant_id) = bot
 
-            print(f"Processing bot with id={bot_id}, name={name}")
-
             # Parse spam_keywords_actions (ensure valid JSON or default to an empty list)
             if spam_keywords_actions is None:
                 spam_keywords_actions = {}
@@ -129,14 +130,11 @@ def fetch_bot_config_from_db(tenant_id):
                 try:
                     spam_keywords_actions = json.loads(spam_keywords_actions) if spam_keywords_actions else []
                 except json.JSONDecodeError:
-                    print(f"Error parsing spam_keywords_actions for bot {bot_id}, defaulting to empty list.")
+                    logging.error(f"Error parsing spam_keywords_actions for bot {bot_id}, defaulting to empty list.")
                     spam_keywords_actions = {}
 
-            print(f"spam_keywords_actions for bot {bot_id}: {spam_keywords_actions}")
-
             # Retrieve logs for this bot
             bot_logs = logs_by_bot.get(bot_id, [])
-            print(f"Logs for bot {bot_id}: {bot_logs}")
 
             # Add bot configuration to the response list
             bots.append(
@@ -159,60 +157,37 @@ def fetch_bot_config_from_db(tenant_id):
         return BotConfigResponse(bots=bots)
 
     except psycopg2.DatabaseError as e:
-        print(f"Database error: {str(e)}")
+        logging.error(f"Database error: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
     except Exception as e:
-        print(f"Unexpected error: {str(e)}")
+        logging.error(f"Unexpected error: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Internal Server Error: {str(e)}")
 
-    finally:
-        # Ensure proper cleanup
-        if cursor:
-            cursor.close()
-        if conn:
-            conn.close()
-
 
 def delete_bot_config(bot_id,tenant_id):
     try:
-        # Connect to the PostgreSQL database
-        conn = psycopg2.connect(**conn_config)
-        cursor = conn.cursor()
+        with get_connection() as conn, conn.cursor() as cursor:
+            # Check if the bot exists
+            cursor.execute("SELECT id FROM whatsapp_botconfig WHERE id = %s AND tenant_id = %s;", (bot_id,tenant_id))
+            if not cursor.fetchone():
+                raise HTTPException(status_code=404, detail=f"Bot with ID {bot_id} not found")
 
-        # Check if the bot exists
-        cursor.execute("SELECT id FROM whatsapp_botconfig WHERE id = %s AND tenant_id = %s;", (bot_id,tenant_id))
-        if not cursor.fetchone():
-            raise HTTPException(status_code=404, detail=f"Bot with ID {bot_id} not found")
+            # Delete the bot configuration
+            cursor.execute("DELETE FROM whatsapp_botconfig WHERE id = %s AND tenant_id = %s;", (bot_id,tenant_id))
+            conn.commit()
 
-        # Delete the bot configuration
-        cursor.execute("DELETE FROM whatsapp_botconfig WHERE id = %s AND tenant_id = %s;", (bot_id,tenant_id))
-        conn.commit()
+        bot_configs.bump(tenant_id)
 
         return {"message": f"Bot with ID {bot_id} and its logs deleted successfully"}
 
     except Exception as e:
-        print(f"Error occurred while deleting bot config: {str(e)}")
+        logging.error(f"Error occurred while deleting bot config: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Internal Server Error: {str(e)}")
 
-    finally:
-        if cursor:
-            cursor.close()
-        if conn:
-            conn.close()
-
 
 
 def update_bot_config(bot_id, bot: BotConfig, tenant_id):
     try:
-        # Connect to the PostgreSQL database
-        conn = psycopg2.connect(**conn_config)
-        cursor = conn.cursor()
-
-        # Check if the bot exists
-        cursor.execute("SELECT id FROM whatsapp_botconfig WHERE id = %s AND tenant_id = %s;", (bot_id, tenant_id))
-        if not cursor.fetchone():
-            raise HTTPException(status_code=404, detail=f"Bot with ID {bot_id} not found")
-
         # Prepare the update query
         update_query = """
         UPDATE whatsapp_botconfig
@@ -242,23 +217,101 @@ def update_bot_config(bot_id, bot: BotConfig, tenant_id):
         )
 
         # Log the parameters for debugging
-        print(f"Executing query with parameters: {params}")
+        logging.debug("Updating bot config with parameters %s", params)
+
+        with get_connection() as conn, conn.cursor() as cursor:
+            # Check if the bot exists
+            cursor.execute("SELECT id FROM whatsapp_botconfig WHERE id = %s AND tenant_id = %s;", (bot_id, tenant_id))
+            if not cursor.fetchone():
+                raise HTTPException(status_code=404, detail=f"Bot with ID {bot_id} not found")
 
-        # Execute the query
-        cursor.execute(update_query, params)
-        conn.commit()
+            # Execute the query
+            cursor.execute(update_query, params)
+            conn.commit()
+
+        # Cached responses and compiled keyword matchers for the tenant are rebuilt on next use
+        bot_configs.bump(tenant_id)
 
         return {"message": f"Bot with ID {bot_id} updated successfully"}
 
     except Exception as e:
-        print(f"Error occurred while updating bot config: {str(e)}")
+        logging.error(f"Error occurred while updating bot config: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Internal Server Error: {str(e)}")
 
-    finally:
-        if cursor:
-            cursor.close()
-        if conn:
-            conn.close()
+def fetch_spam_keywords(bot_id, tenant_id):
+    """(is_bot_enabled, keyword -> action map, message limit) for a bot, or None if it doesn't exist."""
+    with get_connection() as conn, conn.cursor() as cursor:
+        cursor.execute("""
+            SELECT isbotenabled, spam_keywords_actions, messagelimit
+            FROM whatsapp_botconfig
+            WHERE id = %s AND tenant_id = %s;
+        """, (bot_id, tenant_id))
+        row = cursor.fetchone()
+
+    if row is None:
+        return None
+    is_bot_enabled, spam_keywords_actions, message_limit = row
+    if isinstance(spam_keywords_actions, str):
+        try:
+            spam_keywords_actions = json.loads(spam_keywords_actions)
+        except json.JSONDecodeError:
+            spam_keywords_actions = {}
+    return is_bot_enabled, spam_keywords_actions if isinstance(spam_keywords_actions, dict) else {}, message_limit
+
+
+def classify_messages(bot_id, tenant_id, messages):
+    """Match messages against a bot's spam keywords. One result per message, in order."""
+    # The config is only read from the database when the bot's matcher isn't compiled yet
+    matcher = spam_matchers.get(tenant_id, bot_id, lambda: fetch_spam_keywords(bot_id, tenant_id))
+    if matcher is None:
+        raise HTTPException(status_code=404, detail=f"Bot with ID {bot_id} not found")
+    is_bot_enabled, automaton, _, _ = matcher
+
+    if not is_bot_enabled:
+        return {"bot_id": bot_id, "enabled": False, "results": [{"matches": [], "action": None} for _ in messages]}
+
+    return {"bot_id": bot_id, "enabled": True, "results": [automaton.classify(message) for message in messages]}
+
+
+def evaluate_messages(bot_id, tenant_id, messages):
+    """
+    Run incoming group messages through a bot: spam keywords and the per-sender messageLimit.
+    Every message that triggers an action is queued for whatsapp_bot_logs. One result per message, in order.
+    messageLimit is enforced across workers only when REDIS_URL is set; otherwise each worker
+    process counts on its own (see modules/rate_limiter.py).
+    """
+    matcher = spam_matchers.get(tenant_id, bot_id, lambda: fetch_spam_keywords(bot_id, tenant_id))
+    if matcher is None:
+        raise HTTPException(status_code=404, detail=f"Bot with ID {bot_id} not found")
+    is_bot_enabled, automaton, message_limit, message_limit_action = matcher
+
+    if not is_bot_enabled:
+        return {"bot_id": bot_id, "enabled": False,
+                "results": [{"matches": [], "action": None, "rate_limited": False} for _ in messages]}
+
+    limit_action = message_limit_action or message_limiter.default_action
+    results, logs = [], []
+    for item in messages:
+        logged_at = item.timestamp or datetime.now(timezone.utc)
+        result = automaton.classify(item.message)
+        if result["action"]:
+            logs.append((bot_id, item.message, result["action"], item.sender, item.group_name, logged_at, tenant_id))
+
+        # Counted per sender within a group, whether or not the message was spam. The limiter runs on
+        # server time; item.timestamp is client-supplied and only dates the log row
+        rate = message_limiter.hit((tenant_id, item.group_name, item.sender), message_limit)
+        result["rate_limited"] = bool(message_limit) and rate > message_limit
+        if result["rate_limited"]:
+            result["message_limit_action"] = limit_action
+            logs.append((bot_id, f"Message limit exceeded ({message_limit}/{message_limiter.window_seconds:g}s): {item.message}",
+                         limit_action, item.sender, item.group_name, logged_at, tenant_id))
+        results.append(result)
+
+    # Written in batches by the background sink; the caller acts on the verdicts right away
+    bot_log_sink.submit(logs)
+
+    return {"bot_id": bot_id, "enabled": True, "results": results}
+
 
 # def store_bot_config(bot:BotConfig,tenant_id):
 #     try:
@@ -0,0 +1,161 @@
+from modules.model.dashboard import DashboardResponse, SentimentData, EngagementData
+from datetime import datetime, timedelta
+from typing import List
+
+# The dashboard used to run five queries per group (5N round-trips for a tenant
+# with N groups). Each query below covers every group of the tenant at once, so
+# building the dashboard costs four round-trips regardless of group count.
+# The queries filter on tenant only; rows for groups no longer in
+# whatsapp_groups are dropped while assembling the response.
+
+GROUP_NAMES_QUERY = """
+    SELECT DISTINCT group_name
+    FROM whatsapp_groups
+    WHERE tenant_id = $1
+    ORDER BY group_name;
+"""
+
+# Sentiment and topics for the 10 most recent days of each group. The dashboard
+# shows one entry per day, but incremental sentiment runs store one row per
+# analysis window (many per day), so the rows are collapsed per group and day
+# first: sentiment counts add up, and topic frequencies are summed by topic
+# name into that day's top 10. Rows from before windows existed (window_end
+# NULL) were already daily snapshots and fall on their created_at day.
+# frequency is the number of sentiment rows merged into the day.
+SENTIMENT_TOPICS_QUERY = """
+    WITH windows AS (
+        SELECT group_name, COALESCE(window_end, created_at)::date AS day,
+               sentiment_data::jsonb AS sentiment_data, topic_data::jsonb AS topic_data
+        FROM whatsapp_sentiment
+        WHERE tenant_id = $1
+    ),
+    daily AS (
+        SELECT
+            group_name,
+            day,
+            COALESCE(SUM((sentiment_data->>'Positive')::int), 0) AS positive,
+            COALESCE(SUM((sentiment_data->>'Neutral')::int), 0) AS neutral,
+            COALESCE(SUM((sentiment_data->>'Negative')::int), 0) AS negative,
+            COALESCE(SUM((sentiment_data->>'Commercial')::int), 0) AS commercial,
+            COUNT(*) AS frequency,
+            ROW_NUMBER() OVER (PARTITION BY group_name ORDER BY day DESC) AS day_rank
+        FROM windows
+        GROUP BY group_name, day
+    ),
+    topic_items AS (
+        -- topic_data is a [{"topic", "frequency"}] list; anything else has no topics to merge
+        SELECT w.group_name, w.day, item->>'topic' AS topic,
+               CASE WHEN jsonb_typeof(item->'frequency') = 'number' THEN (item->>'frequency')::numeric ELSE 0 END AS frequency
+        FROM windows w
+        JOIN daily d ON d.group_name = w.group_name AND d.day = w.day AND d.day_rank <= 10
+        CROSS JOIN LATERAL jsonb_array_elements(
+            CASE WHEN jsonb_typeof(w.topic_data) = 'array' THEN w.topic_data ELSE '[]'::jsonb END
+        ) AS items(item)
+        WHERE jsonb_typeof(item) = 'object' AND COALESCE(item->>'topic', '') <> ''
+    ),
+    daily_topics AS (
+        SELECT group_name, day,
+               jsonb_agg(jsonb_build_object('topic', topic, 'frequency', frequency)
+                         ORDER BY frequency DESC, topic) AS topics
+        FROM (
+            SELECT group_name, day, MIN(topic) AS topic, SUM(frequency)::bigint AS frequency,
+                   ROW_NUMBER() OVER (PARTITION BY group_name, day ORDER BY SUM(frequency) DESC, MIN(topic)) AS topic_rank
+            FROM topic_items
+            GROUP BY group_name, day, lower(topic)
+        ) per_topic
+        WHERE topic_rank <= 10
+        GROUP BY group_name, day
+    )
+    SELECT d.group_name, d.day, d.positive, d.neutral, d.negative, d.commercial,
+           COALESCE(t.topics, '[]'::jsonb)::text AS topic, d.frequency
+    FROM daily d
+    LEFT JOIN daily_topics t ON t.group_name = d.group_name AND t.day = d.day
+    WHERE d.day_rank <= 10
+    ORDER BY d.group_name, d.day DESC;
+"""
+
+# Distinct senders and message volume over the engagement window. Grouping by
+# (group, phone) first lets Postgres hash-aggregate instead of sorting for COUNT(DISTINCT).
+MESSAGE_ACTIVITY_QUERY = """
+    SELECT group_name, COUNT(*) AS active_members, SUM(sent) AS total_messages
+    FROM (
+        SELECT group_name, phone_number, COUNT(*) AS sent
+        FROM whatsapp_messages
+        WHERE tenant_id = $1 AND message_time >= $2
+        GROUP BY group_name, phone_number
+    ) per_sender
+    GROUP BY group_name;
+"""
+
+# Distinct member phone numbers per group
+MEMBER_COUNT_QUERY = """
+    SELECT group_name, COUNT(phone_number) AS total_members
+    FROM (
+        SELECT g.group_name, m.phone_number
+        FROM whatsapp_groups g
+        JOIN whatsapp_group_members m ON m.group_id = g.id
+        WHERE g.tenant_id = $1
+        GROUP BY g.group_name, m.phone_number
+    ) per_phone
+    GROUP BY group_name;
+"""
+
+
+async def fetch_dashboard(conn, tenant_id, engagement_days=7) -> List[DashboardResponse]:
+    """Build the dashboard for every group of a tenant using an asyncpg connection."""
+    group_names = [row["group_name"] for row in await conn.fetch(GROUP_NAMES_QUERY, tenant_id)]
+    if not group_names:
+        return []
+
+    since = datetime.now() - timedelta(days=engagement_days)
+    sentiment_rows = await conn.fetch(SENTIMENT_TOPICS_QUERY, tenant_id)
+    activity_rows = await conn.fetch(MESSAGE_ACTIVITY_QUERY, tenant_id, since)
+    member_rows = await conn.fetch(MEMBER_COUNT_QUERY, tenant_id)
+
+    return build_dashboard(group_names, sentiment_rows, activity_rows, member_rows)
+
+
+def build_dashboard(group_names, sentiment_rows, activity_rows, member_rows) -> List[DashboardResponse]:
+    """Assemble DashboardResponse objects from the set-based query results."""
+    sentiment_by_group = {name: [] for name in group_names}
+    topics_by_group = {name: [] for name in group_names}
+    for row in sentiment_rows:
+        group_name = row["group_name"]
+        # Sentiment rows can outlive their group; only groups in whatsapp_groups are shown
+        if group_name not in sentiment_by_group:
+            continue
+        sentiment_by_group[group_name].append(SentimentData(
+            day=row["day"].strftime('%A'),
+            Positive=row["positive"],
+            Neutral=row["neutral"],
+            Negative=row["negative"],
+            Commercial=row["commercial"]
+        ))
+        topics_by_group[group_name].append({"topic": row["topic"], "frequency": row["frequency"]})
+
+    activity_by_group = {row["group_name"]: (row["active_members"], row["total_messages"]) for row in activity_rows}
+    members_by_group = {row["group_name"]: row["total_members"] for row in member_rows}
+
+    dashboard_data = []
+    for group_name in group_names:
+        active_members_count, total_messages = activity_by_group.get(group_name, (0, 0))
+        total_members = members_by_group.get(group_name, 0)
+
+        # Same metrics the per-group loop computed
+        active_member_score = (active_members_count / total_members * 100) if total_members > 0 else 0
+        engagement_rate = (active_members_count / total_messages * 100) if total_messages > 0 else 0
+        # The old loop divided the 7-day message COUNT(*) by itself, so this is 100% whenever there was traffic
+        response_rate = 100.0 if total_messages > 0 else 0
+
+        dashboard_data.append(DashboardResponse(
+            name=group_name,
+            sentimentData=sentiment_by_group[group_name],
+            engagementData=[
+                EngagementData(metric="Active Members", score=active_member_score),
+                EngagementData(metric="Engagement Rate", score=engagement_rate),
+                EngagementData(metric="Response Rate", score=response_rate)
+            ],
+            topicsData=topics_by_group[group_name]
+        ))
+
+    return dashboard_data
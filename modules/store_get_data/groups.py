@@ -1,42 +1,36 @@
-import psycopg2
-from modules.config.database import conn_config
+import logging
+from modules.db import get_connection
+from modules.dashboard_cache import dashboard_cache
+from modules.bot_config_cache import bot_configs
+from modules.store_get_data.message_rollup import DAILY_COUNTS_CTE
+from modules.store_get_data.pagination import clamp_limit, decode_cursor, split_page
 from fastapi import HTTPException
 from typing import Optional, List, Dict
 
 # New function to get group details by ID
-from typing import Optional, Dict, List
-import psycopg2
-
-from typing import Optional, Dict
-import psycopg2
-
 def get_group_details_by_id(group_id: int, tenant_id: str) -> Optional[Dict]:
-    conn = None
-    cursor = None
     try:
-        conn = psycopg2.connect(**conn_config)
-        cursor = conn.cursor()
-
-        # Fetch group details and member details in a single query
-        cursor.execute("""
-            SELECT 
-                g.id AS group_id, 
-                g.group_name, 
-                g.group_description,
-                g.botconfig_id,
-                m.member_id,
-                m.name AS member_name,
-                m.phone_number,
-                m.role,
-                m.status,
-                m.rating,
-                m.avatar
-            FROM whatsapp_groups g
-            LEFT JOIN whatsapp_group_members m ON g.id = m.group_id
-            WHERE g.id = %s AND g.tenant_id = %s
-        """, (group_id, tenant_id))
-
-        rows = cursor.fetchall()
+        with get_connection() as conn, conn.cursor() as cursor:
+            # Fetch group details and member details in a single query
+            cursor.execute("""
+                SELECT
+                    g.id AS group_id,
+                    g.group_name,
+                    g.group_description,
+                    g.botconfig_id,
+                    m.member_id,
+                    m.name AS member_name,
+                    m.phone_number,
+                    m.role,
+                    m.status,
+                    m.rating,
+                    m.avatar
+                FROM whatsapp_groups g
+                LEFT JOIN whatsapp_group_members m ON g.id = m.group_id
+                WHERE g.id = %s AND g.tenant_id = %s
+            """, (group_id, tenant_id))
+
+            rows = cursor.fetchall()
 
         # If no rows are returned, the group doesn't exist
         if not rows:
@@ -69,98 +63,78 @@ def get_group_details_by_id(group_id: int, tenant_id: str) -> Optional[Dict]:
         return group_details
 
     except Exception as e:
-        print(f"Error fetching group details from database: {e}")
+        logging.error(f"Error fetching group details from database: {e}")
         return None
 
-    finally:
-        if cursor:
-            cursor.close()
-        if conn:
-            conn.close()
 
-    
 def get_messages_per_day(group_name, tenant_id):
     try:
-        conn = psycopg2.connect(**conn_config)
-        cursor = conn.cursor()
-
-        # SQL Query to get messages sent each day
-        query = """
-            SELECT DATE(message_time) AS message_date, COUNT(*) AS message_count
-            FROM whatsapp_messages
-            WHERE group_name = %s AND tenant_id = %s
-            GROUP BY DATE(message_time)
-            ORDER BY message_date;
-        """
-        cursor.execute(query, (group_name, tenant_id))
-        rows = cursor.fetchall()
+        with get_connection() as conn, conn.cursor() as cursor:
+            # Messages sent each day, read from the daily rollup
+            query = DAILY_COUNTS_CTE + """
+                SELECT day AS message_date, SUM(message_count)::bigint AS message_count
+                FROM daily_counts
+                GROUP BY day
+                ORDER BY message_date;
+            """
+            cursor.execute(query, {"group_name": group_name, "tenant_id": tenant_id})
+            rows = cursor.fetchall()
 
         messages_per_day = [{"message_date": row[0], "message_count": row[1]} for row in rows]
 
-        conn.close()
         return messages_per_day
     except Exception as e:
-        print(f"Error fetching messages per day: {e}")
+        logging.error(f"Error fetching messages per day: {e}")
         return []
 
 def get_total_messages(group_name, tenant_id):
     try:
-        conn = psycopg2.connect(**conn_config)
-        cursor = conn.cursor()
-
-        # SQL Query to get the total message count
-        query = """
-            SELECT COUNT(*) 
-            FROM whatsapp_messages
-            WHERE group_name = %s AND tenant_id = %s;
-        """
-        cursor.execute(query, (group_name, tenant_id))
-        total_messages = cursor.fetchone()[0]
-
-        conn.close()
+        with get_connection() as conn, conn.cursor() as cursor:
+            # Total message count, read from the daily rollup
+            query = DAILY_COUNTS_CTE + """
+                SELECT COALESCE(SUM(message_count), 0)::bigint
+                FROM daily_counts;
+            """
+            cursor.execute(query, {"group_name": group_name, "tenant_id": tenant_id})
+            total_messages = cursor.fetchone()[0]
+
         return total_messages
     except Exception as e:
-        print(f"Error fetching total messages: {e}")
+        logging.error(f"Error fetching total messages: {e}")
         return 0
 
 def get_active_members(group_name, tenant_id, days=2):
     try:
-        conn = psycopg2.connect(**conn_config)
-        cursor = conn.cursor()
-
-        # SQL Query to find members who posted every day in the past 'days'
-        query = f"""
-            SELECT sender
-            FROM whatsapp_messages
-            WHERE group_name = %s AND tenant_id = %s AND message_time >= (CURRENT_TIMESTAMP + INTERVAL '5 hours 30 minutes') - %s * INTERVAL '1 day'
-            GROUP BY sender, DATE(message_time)
-            HAVING COUNT(DISTINCT DATE(message_time)) = %s;
-        """
-        cursor.execute(query, (group_name, tenant_id, days, days))
-        active_members = [row[0] for row in cursor.fetchall()]
-
-        conn.close()
+        with get_connection() as conn, conn.cursor() as cursor:
+            # Members who posted on each of the last 'days' days (IST), today included
+            query = DAILY_COUNTS_CTE + """
+                SELECT sender
+                FROM daily_counts
+                WHERE day > (CURRENT_TIMESTAMP + INTERVAL '5 hours 30 minutes')::date - %(days)s
+                GROUP BY sender
+                HAVING COUNT(DISTINCT day) = %(days)s;
+            """
+            cursor.execute(query, {"group_name": group_name, "tenant_id": tenant_id, "days": days})
+            active_members = [row[0] for row in cursor.fetchall()]
+
         return active_members
     except Exception as e:
-        print(f"Error fetching active members: {e}")
+        logging.error(f"Error fetching active members: {e}")
         return []
 
 def get_top_member(group_name, tenant_id):
     try:
-        conn = psycopg2.connect(**conn_config)
-        cursor = conn.cursor()
-
-        # SQL Query to get the member who sent the most messages
-        query = """
-            SELECT sender, COUNT(*) AS message_count
-            FROM whatsapp_messages
-            WHERE group_name = %s AND tenant_id = %s
-            GROUP BY sender
-            ORDER BY message_count DESC
-            LIMIT 1;
-        """
-        cursor.execute(query, (group_name, tenant_id))
-        top_member_row = cursor.fetchone()
+        with get_connection() as conn, conn.cursor() as cursor:
+            # Member who sent the most messages, read from the daily rollup
+            query = DAILY_COUNTS_CTE + """
+                SELECT sender, SUM(message_count)::bigint AS message_count
+                FROM daily_counts
+                GROUP BY sender
+                ORDER BY message_count DESC
+                LIMIT 1;
+            """
+            cursor.execute(query, {"group_name": group_name, "tenant_id": tenant_id})
+            top_member_row = cursor.fetchone()
 
         top_member = None
         if top_member_row:
@@ -169,61 +143,105 @@ def get_top_member(group_name, tenant_id):
                 "message_count": top_member_row[1]
             }
 
-        conn.close()
         return top_member
     except Exception as e:
-        print(f"Error fetching top member: {e}")
+        logging.error(f"Error fetching top member: {e}")
         return None
 
-def get_group_activity(group_name, tenant_id):
+def get_group_activity(group_name, tenant_id, days=2):
     try:
-        # Get messages per day
-        messages_per_day = get_messages_per_day(group_name, tenant_id)
-
-        # Get total messages
-        total_messages = get_total_messages(group_name, tenant_id)
-
-        # Get active members (who posted at least once every day in the last 'days')
-        active_members = get_active_members(group_name, tenant_id)
-
-        # Get top member (who sent the most messages)
-        top_member = get_top_member(group_name, tenant_id)
+        with get_connection() as conn, conn.cursor() as cursor:
+            # Messages per day, total, active members and top member in one round-trip.
+            # daily_counts is referenced several times, so Postgres materializes it once.
+            query = DAILY_COUNTS_CTE + """,
+                per_day AS (
+                    SELECT day, SUM(message_count)::bigint AS message_count
+                    FROM daily_counts
+                    GROUP BY day
+                ),
+                top_member AS (
+                    SELECT sender, SUM(message_count)::bigint AS message_count
+                    FROM daily_counts
+                    GROUP BY sender
+                    ORDER BY message_count DESC
+                    LIMIT 1
+                ),
+                active_members AS (
+                    SELECT sender
+                    FROM daily_counts
+                    WHERE day > (CURRENT_TIMESTAMP + INTERVAL '5 hours 30 minutes')::date - %(days)s
+                    GROUP BY sender
+                    HAVING COUNT(DISTINCT day) = %(days)s
+                )
+                SELECT
+                    (SELECT array_agg(day ORDER BY day) FROM per_day),
+                    (SELECT array_agg(message_count ORDER BY day) FROM per_day),
+                    (SELECT COALESCE(SUM(message_count), 0)::bigint FROM per_day),
+                    (SELECT array_agg(sender) FROM active_members),
+                    (SELECT sender FROM top_member),
+                    (SELECT message_count FROM top_member);
+            """
+            cursor.execute(query, {"group_name": group_name, "tenant_id": tenant_id, "days": days})
+            days_list, counts, total_messages, active_members, top_sender, top_count = cursor.fetchone()
 
         # Prepare response
         group_activity = {
             "group_name": group_name,
-            "messages_per_day": messages_per_day,
+            "messages_per_day": [
+                {"message_date": day, "message_count": count}
+                for day, count in zip(days_list or [], counts or [])
+            ],
             "total_messages": total_messages,
-            "active_members": active_members,
-            "top_member": top_member
+            "active_members": active_members or [],
+            # top_count is only NULL when the group has no messages at all
+            "top_member": {"sender": top_sender, "message_count": top_count} if top_count is not None else None
         }
 
         return group_activity
     except Exception as e:
-        print(f"Error fetching group activity: {e}")
+        logging.error(f"Error fetching group activity: {e}")
         return None
 
 # Function to fetch member data
-def get_members_from_db(tenant_id):
+def get_members_from_db(tenant_id, limit=None, cursor=None, group_id=None, group_name=None, role=None):
+    """
+    One page of a tenant's members ordered by member_id, optionally filtered by group (id or name)
+    and role. Returns (members, next_cursor); next_cursor is None on the last page.
+    """
+    limit = clamp_limit(limit)
+    after = decode_cursor(cursor, 1)
     try:
-        # Establishing connection to the database
-        conn = psycopg2.connect(**conn_config)
-        cursor = conn.cursor()
-
-        # Query to get all members and their associated group
-        cursor.execute("""
-            SELECT m.member_id, m.name, m.phone_number, m.role, m.status, m.rating, m.avatar, g.group_name
-            FROM whatsapp_group_members m
-            JOIN whatsapp_groups g ON m.group_id = g.id
-            WHERE tenant_id = %s;
-        """,(tenant_id,))
-        
-        rows = cursor.fetchall()
+        with get_connection() as conn, conn.cursor() as cursor:
+            # Query to get one page of members and their associated group
+            cursor.execute("""
+                SELECT m.member_id, m.name, m.phone_number, m.role, m.status, m.rating, m.avatar, g.group_name
+                FROM whatsapp_group_members m
+                JOIN whatsapp_groups g ON m.group_id = g.id
+                WHERE g.tenant_id = %(tenant_id)s
+                  AND (%(group_id)s::int IS NULL OR g.id = %(group_id)s)
+                  AND (%(group_name)s::text IS NULL OR g.group_name = %(group_name)s)
+                  AND (%(role)s::text IS NULL OR m.role = %(role)s)
+                  AND (%(after_id)s::int IS NULL OR m.member_id > %(after_id)s)
+                ORDER BY m.member_id
+                LIMIT %(limit)s;
+            """, {
+                "tenant_id": tenant_id,
+                "group_id": group_id,
+                "group_name": group_name,
+                "role": role,
+                "after_id": after[0] if after else None,
+                "limit": limit + 1,
+            })
+
+            rows = cursor.fetchall()
+
+        rows, next_cursor = split_page(rows, limit, key=lambda row: (row[0],))
+
         members = []
-        
+
         for row in rows:
             member_id, name, phone_number, role, status, rating, avatar, group_name = row
-            
+
             member = {
                 "id": member_id,
                 "name": name,
@@ -235,39 +253,46 @@ def get_members_from_db(tenant_id):
             }
             members.append(member)
 
-        return members
-    
+        return members, next_cursor
+
     except Exception as e:
-        print(f"Error fetching data: {e}")
-        return []
-    
-    finally:
-        if conn:
-            cursor.close()
-            conn.close()
+        logging.error(f"Error fetching data: {e}")
+        return [], None
 
 # Function to fetch group and member data
-def get_groups_from_db(tenant_id):
+def get_groups_from_db(tenant_id, limit=None, cursor=None):
+    """
+    One page of a tenant's groups ordered by id, each with all of its members.
+    Returns (groups, next_cursor); next_cursor is None on the last page.
+    """
+    limit = clamp_limit(limit)
+    after = decode_cursor(cursor, 1)
     try:
-        # Establishing connection to the database
-        conn = psycopg2.connect(**conn_config)
-        cursor = conn.cursor()
-
-        # Query to get all groups and their members
-        cursor.execute("""
-            SELECT g.id, g.group_name, g.group_description, 
-                m.member_id, m.name, m.phone_number, m.role, m.status, m.rating, m.avatar
-            FROM whatsapp_groups g
-            LEFT JOIN whatsapp_group_members m ON g.id = m.group_id
-            WHERE g.tenant_id = %s;
-        """,(tenant_id,))
-        
-        rows = cursor.fetchall()
+        with get_connection() as conn, conn.cursor() as cursor:
+            # Query to get one page of groups (plus one to detect a next page) and their members
+            cursor.execute("""
+                WITH page AS (
+                    SELECT id, group_name, group_description
+                    FROM whatsapp_groups
+                    WHERE tenant_id = %(tenant_id)s
+                      AND (%(after_id)s::int IS NULL OR id > %(after_id)s)
+                    ORDER BY id
+                    LIMIT %(limit)s
+                )
+                SELECT g.id, g.group_name, g.group_description,
+                    m.member_id, m.name, m.phone_number, m.role, m.status, m.rating, m.avatar
+                FROM page g
+                LEFT JOIN whatsapp_group_members m ON g.id = m.group_id
+                ORDER BY g.id, m.member_id;
+            """, {"tenant_id": tenant_id, "after_id": after[0] if after else None, "limit": limit + 1})
+
+            rows = cursor.fetchall()
+
         groups = {}
-        
+
         for row in rows:
             group_id, group_name, group_description, member_id, member_name, phone_number, role, status, rating, avatar = row
-            
+
             if group_id not in groups:
                 groups[group_id] = {
                     "id": group_id,
@@ -275,7 +300,7 @@ def get_groups_from_db(tenant_id):
                     "description": group_description,
                     "members": []
                 }
-            
+
             if any(field is not None for field in [member_id, member_name, phone_number, role, status, rating, avatar]):
                 member = {
                     "id": member_id,
@@ -288,86 +313,65 @@ def get_groups_from_db(tenant_id):
                 }
                 groups[group_id]["members"].append(member)
 
-        return list(groups.values())
-    
+        return split_page(list(groups.values()), limit, key=lambda group: (group["id"],))
+
     except Exception as e:
-        print(f"Error fetching data: {e}")
-        return []
-    
-    finally:
-        if conn:
-            cursor.close()
-            conn.close()
+        logging.error(f"Error fetching data: {e}")
+        return [], None
 
 
 # Function to update the botconfig_id in the database
 def update_botconfig_in_db(group_id: int, tenant_id: str, botconfig_id: int):
-    conn = None
-    cursor = None
     try:
-        # Establish a database connection
-        conn = psycopg2.connect(**conn_config)
-        cursor = conn.cursor()
-
-        # Update the botconfig_id for the specified group and tenant
-        cursor.execute("""
-            UPDATE whatsapp_groups
-            SET botconfig_id = %s
-            WHERE id = %s AND tenant_id = %s;
-        """, (botconfig_id, group_id, tenant_id))
-
-        # Check if any rows were updated
-        if cursor.rowcount == 0:
-            return {"status": "error", "detail": "Group not found or botconfig_id not updated."}
-
-        # Commit the changes
-        conn.commit()
-        print(f"Updated botconfig_id for group ID {group_id} and tenant {tenant_id}.")
+        # Check out a pooled connection; it is rolled back automatically on error
+        with get_connection() as conn, conn.cursor() as cursor:
+            # Update the botconfig_id for the specified group and tenant
+            cursor.execute("""
+                UPDATE whatsapp_groups
+                SET botconfig_id = %s
+                WHERE id = %s AND tenant_id = %s;
+            """, (botconfig_id, group_id, tenant_id))
+
+            # Check if any rows were updated
+            if cursor.rowcount == 0:
+                return {"status": "error", "detail": "Group not found or botconfig_id not updated."}
+
+            # Commit the changes
+            conn.commit()
+
+        bot_configs.bump(tenant_id)
+        logging.info(f"Updated botconfig_id for group ID {group_id} and tenant {tenant_id}.")
         return {"status": "success", "message": f"botconfig_id updated successfully for group ID {group_id}"}
 
     except Exception as e:
-        # Rollback on error and return the exception details
-        if conn:
-            conn.rollback()
+        # Return the exception details
         error_message = f"Error updating botconfig_id in DB: {e}"
-        print(error_message)
+        logging.error(error_message)
         return {"status": "error", "detail": error_message}
 
-    finally:
-        if cursor:
-            cursor.close()
-        if conn:
-            conn.close()
-
 
 def delete_group(group_name: str, tenant_id: str):
     try:
-        # Establish a database connection
-        conn = psycopg2.connect(**conn_config)
-        cursor = conn.cursor()
+        with get_connection() as conn, conn.cursor() as cursor:
+            # Delete the group from the database
+            cursor.execute("""
+                DELETE FROM whatsapp_groups
+                WHERE group_name = %s AND tenant_id = %s;
+            """, (group_name, tenant_id))
 
-        # Delete the group from the database
-        cursor.execute("""
-            DELETE FROM whatsapp_groups
-            WHERE group_name = %s AND tenant_id = %s;
-        """, (group_name, tenant_id))
+            # Commit the changes
+            conn.commit()
 
-        # Commit the changes
-        conn.commit()
+            # Check if any rows were deleted
+            if cursor.rowcount == 0:
+                return None  # No group was deleted
 
-        # Check if any rows were deleted
-        if cursor.rowcount == 0:
-            return None  # No group was deleted
+        # The dashboard lists every group of the tenant
+        dashboard_cache.invalidate(tenant_id)
 
-        print(f"Deleted group {group_name} for tenant {tenant_id}.")
+        logging.info(f"Deleted group {group_name} for tenant {tenant_id}.")
         return group_name  # Return the deleted group's name
 
     except Exception as e:
-        print(f"Error deleting group from DB: {e}")
+        logging.error(f"Error deleting group from DB: {e}")
         raise HTTPException(status_code=500, detail="Database operation failed.")
-
-    finally:
-        if cursor:
-            cursor.close()
-        if conn:
-            conn.close()
@@ -0,0 +1,122 @@
+"""
+Daily message rollup for the group activity queries.
+
+whatsapp_message_daily_counts holds one row per (tenant, group, day, sender)
+with the number of messages sent. refresh_message_rollup() brings it up to
+date incrementally: it recomputes the days from ROLLUP_LATE_DAYS before the
+previous watermark's day onwards and moves the watermark to the newest
+message it has seen.
+
+Messages are not always inserted in message_time order (delayed webhooks,
+history imports), so a message can land behind the watermark. Recomputing a
+trailing window of whole days picks those up, and readers (DAILY_COUNTS_CTE)
+take that same window from the raw messages instead of the rollup, so they
+are exact for it before the next refresh. Only messages more than
+ROLLUP_LATE_DAYS days older than the newest one are missed. The cost of a
+read still does not depend on how much history a group has.
+"""
+import logging
+import os
+
+from modules.db import get_connection
+
+ROLLUP_NAME = "message_daily_counts"
+ROLLUP_LATE_DAYS = int(os.getenv("MESSAGE_ROLLUP_LATE_DAYS", "2"))  # Days before the watermark's day that are recomputed
+
+# Arbitrary constant for pg_try_advisory_lock so only one worker refreshes at a time
+_REFRESH_LOCK_KEY = 720501
+
+# First day recomputed by the next refresh, and read from the raw messages until it is
+# final; -infinity before the first refresh
+RECOMPUTE_START_SQL = f"""
+    COALESCE(
+        (SELECT date_trunc('day', last_message_time) - interval '{ROLLUP_LATE_DAYS} days'
+         FROM whatsapp_rollup_watermarks WHERE rollup_name = '{ROLLUP_NAME}'),
+        '-infinity'::timestamp
+    )
+"""
+
+# Yields (day, sender, message_count) for %(tenant_id)s / %(group_name)s:
+# final rolled-up days plus the raw messages of the days still being recomputed.
+DAILY_COUNTS_CTE = f"""
+    WITH recompute AS (
+        SELECT {RECOMPUTE_START_SQL} AS start
+    ),
+    daily_counts AS (
+        SELECT day, NULLIF(sender, '') AS sender, message_count
+        FROM whatsapp_message_daily_counts, recompute r
+        WHERE tenant_id = %(tenant_id)s AND group_name = %(group_name)s
+          AND day < r.start
+        UNION ALL
+        SELECT DATE(m.message_time), m.sender, COUNT(*)
+        FROM whatsapp_messages m, recompute r
+        WHERE m.tenant_id = %(tenant_id)s AND m.group_name = %(group_name)s
+          AND m.message_time >= r.start
+        GROUP BY DATE(m.message_time), m.sender
+    )
+"""
+
+
+def refresh_message_rollup():
+    """Recount the trailing ROLLUP_LATE_DAYS days and everything newer into the daily rollup."""
+    try:
+        with get_connection() as conn, conn.cursor() as cursor:
+            # Every worker runs this job. The lock is session-level and taken before the refresh
+            # transaction starts: a worker that queued on a transaction lock would work from a
+            # snapshot older than the refresh it waited for and fail on the rows it replaced.
+            cursor.execute("SELECT pg_try_advisory_lock(%s)", (_REFRESH_LOCK_KEY,))
+            locked = cursor.fetchone()[0]
+            conn.commit()
+            if not locked:
+                return 0
+            try:
+                refreshed, new_watermark = _recount(cursor)
+                conn.commit()
+            finally:
+                conn.rollback()
+                cursor.execute("SELECT pg_advisory_unlock(%s)", (_REFRESH_LOCK_KEY,))
+                conn.commit()
+
+        if new_watermark is not None:
+            logging.info(f"Message rollup refreshed: {refreshed} rows up to {new_watermark}")
+        return refreshed
+
+    except Exception as e:
+        logging.error(f"Error refreshing message rollup: {e}")
+        return 0
+
+
+def _recount(cursor):
+    # One consistent snapshot for the watermark and the counts
+    cursor.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ")
+
+    # Recompute whole days starting ROLLUP_LATE_DAYS before the old watermark's day (or
+    # everything on first run), so messages inserted late within that window are counted
+    cursor.execute(f"""
+        SELECT r.start, MAX(m.message_time)
+        FROM (SELECT {RECOMPUTE_START_SQL} AS start) r
+        LEFT JOIN whatsapp_messages m ON m.message_time >= r.start
+        GROUP BY r.start
+    """)
+    start, new_watermark = cursor.fetchone()
+    if new_watermark is None:
+        return 0, None
+
+    # Replace the window's days outright; a recount can also drop senders whose messages are gone
+    cursor.execute("DELETE FROM whatsapp_message_daily_counts WHERE day >= %s", (start,))
+    cursor.execute("""
+        INSERT INTO whatsapp_message_daily_counts (tenant_id, group_name, day, sender, message_count)
+        SELECT tenant_id, group_name, DATE(message_time), COALESCE(sender, ''), COUNT(*)
+        FROM whatsapp_messages
+        WHERE message_time >= %s AND message_time <= %s
+        GROUP BY tenant_id, group_name, DATE(message_time), COALESCE(sender, '');
+    """, (start, new_watermark))
+    refreshed = cursor.rowcount
+
+    cursor.execute("""
+        INSERT INTO whatsapp_rollup_watermarks (rollup_name, last_message_time, updated_at)
+        VALUES (%s, %s, now())
+        ON CONFLICT (rollup_name)
+        DO UPDATE SET last_message_time = EXCLUDED.last_message_time, updated_at = EXCLUDED.updated_at;
+    """, (ROLLUP_NAME, new_watermark))
+    return refreshed, new_watermark
@@ -0,0 +1,48 @@
+"""
+Keyset (cursor) pagination helpers for the list endpoints.
+
+A page is requested with ?limit=N&cursor=... . The cursor is an opaque,
+URL-safe token holding the sort key of the last row of the previous page, and
+the next page is read with `WHERE (sort key) > (cursor values)`. That stays
+an index range scan however deep the client pages, unlike OFFSET.
+"""
+import base64
+import json
+from datetime import datetime
+
+from fastapi import HTTPException
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 500
+
+
+def clamp_limit(limit):
+    if limit is None:
+        return DEFAULT_PAGE_SIZE
+    return max(1, min(int(limit), MAX_PAGE_SIZE))
+
+
+def encode_cursor(*values):
+    payload = json.dumps([value.isoformat() if isinstance(value, datetime) else value for value in values])
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor, size):
+    """Values stored by encode_cursor(), or None without a cursor. Raises 400 for a malformed one."""
+    if not cursor:
+        return None
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except ValueError:
+        values = None
+    if not isinstance(values, list) or len(values) != size:
+        raise HTTPException(status_code=400, detail="Invalid pagination cursor.")
+    return values
+
+
+def split_page(rows, limit, key):
+    """Trim the look-ahead row fetched with LIMIT limit + 1 and build the next cursor from the last row kept."""
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor(*key(rows[-1]))
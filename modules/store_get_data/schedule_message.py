@@ -1,163 +1,234 @@
+import logging
 from fastapi import APIRouter, HTTPException,Request
 from pydantic import ValidationError
 from datetime import datetime
-import psycopg2
-from modules.config.database import conn_config
+from modules.db import get_connection
 from modules.model.schedule_model import ScheduleMessageRequest
+from modules.dispatcher import dispatcher
+from modules.store_get_data.pagination import clamp_limit, decode_cursor, split_page
+from psycopg2.extras import execute_values
+from functools import lru_cache
+from typing import List
 import json 
 import mimetypes
 import validators
 import pytz
 
+KOLKATA_TZ = pytz.timezone('Asia/Kolkata')
+
+
+MAX_BULK_SCHEDULED_MESSAGES = 1000  # Messages accepted by one bulk create request
+
+INSERT_SCHEDULED_MESSAGES = """
+    INSERT INTO whatsapp_scheduled_messages (groups, message_type, message_content, schedule_time, media, tenant_id, status)
+    VALUES %s
+    RETURNING id;
+"""
+
+# RETURNING order isn't guaranteed to follow VALUES order, so ids are drawn per input position
+# first and the statement returns (position, id) pairs
+INSERT_SCHEDULED_MESSAGES_BULK = """
+    WITH input AS (
+        SELECT v.*, nextval(pg_get_serial_sequence('whatsapp_scheduled_messages', 'id')) AS id
+        FROM (VALUES %s) AS v(position, groups, message_type, message_content, schedule_time, media, tenant_id, status)
+    ), inserted AS (
+        INSERT INTO whatsapp_scheduled_messages (id, groups, message_type, message_content, schedule_time, media, tenant_id, status)
+        SELECT id, groups, message_type, message_content, schedule_time, media, tenant_id, status FROM input
+        RETURNING id
+    )
+    SELECT input.position, input.id FROM input JOIN inserted USING (id);
+"""
+
+# Campaigns repeat the same media types and URLs across hundreds of messages
+@lru_cache(maxsize=256)
+def guess_file_extension(media_type):
+    # Extract file extension from media type
+    file_extension = mimetypes.guess_extension(media_type)
+    if not file_extension:
+        # Fallback for common media types
+        if "image" in media_type:
+            file_extension = ".jpg"
+        elif "video" in media_type:
+            file_extension = ".mp4"
+        elif "document" in media_type:
+            file_extension = ".pdf"
+        else:
+            file_extension = ".bin"  # Default for unknown types
+    return file_extension
+
+@lru_cache(maxsize=4096)
+def is_valid_url(url):
+    return bool(validators.url(url))
+
+def prepare_scheduled_message(data: ScheduleMessageRequest, tenant_id):
+    """
+    Validate a ScheduleMessageRequest and return the row to insert into
+    whatsapp_scheduled_messages. Raises HTTPException(400) if it is invalid.
+    """
+    # Validate messageType and media
+    media = data.media
+
+    # Enforce media presence for specific message types
+    if data.messageType in ["image", "document", "video"]:
+        if not media:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Media data is required for message type '{data.messageType}'."
+            )
 
-def save_scheduled_message_to_db(data: ScheduleMessageRequest,tenant_id):
-    try:
-        # Validate messageType and media
-        media = data.media
-        
-        # Enforce media presence for specific message types
-        if data.messageType in ["image", "document", "video"]:
-            if not media:
-                raise HTTPException(
-                    status_code=400,
-                    detail=f"Media data is required for message type '{data.messageType}'."
-                )
-            
-            # Extract media fields
-            media_url = media.url
-            media_type = media.type
-            media_name = media.name
-
-            # Validate media URL
-            if not validators.url(str(media_url)):
-                raise HTTPException(
-                    status_code=400,
-                    detail=f"Invalid media URL for message type '{data.messageType}'."
-                )
+        # Validate media URL
+        if not is_valid_url(str(media.url)):
+            raise HTTPException(
+                status_code=400,
+                detail=f"Invalid media URL for message type '{data.messageType}'."
+            )
 
-            # Extract file extension from media type
-            file_extension = mimetypes.guess_extension(media_type)
-            if not file_extension:
-                # Fallback for common media types
-                if "image" in media_type:
-                    file_extension = ".jpg"
-                elif "video" in media_type:
-                    file_extension = ".mp4"
-                elif "document" in media_type:
-                    file_extension = ".pdf"
-                else:
-                    file_extension = ".bin"  # Default for unknown types
-
-            # Add file extension to media object
-            media_dict = media.dict()
-            media_dict["file_extension"] = file_extension
-            media_dict["url"] = str(media_dict["url"])  # Convert URL to string
-
-            # Serialize media dictionary to JSON
-            media_json = json.dumps(media_dict)
-
-        elif data.messageType == "text":
-            # Validate content for text messages
-            if not data.content.strip():
-                raise HTTPException(
-                    status_code=400,
-                    detail="Message content cannot be empty for text messages."
-                )
-            media_json = None  # No media required for text
+        # Add file extension to media object
+        media_dict = media.dict()
+        media_dict["file_extension"] = guess_file_extension(media.type)
+        media_dict["url"] = str(media_dict["url"])  # Convert URL to string
 
-        else:
+        # Serialize media dictionary to JSON
+        media_json = json.dumps(media_dict)
+
+    elif data.messageType == "text":
+        # Validate content for text messages
+        if not data.content.strip():
             raise HTTPException(
                 status_code=400,
-                detail=f"Unsupported message type: {data.messageType}"
+                detail="Message content cannot be empty for text messages."
             )
+        media_json = None  # No media required for text
 
-        # Convert groups to a comma-separated string if it's a list
-        if isinstance(data.groups, list):
-            groups = ', '.join(data.groups)
-        else:
-            raise HTTPException(status_code=400, detail="Groups must be provided as a list.")
-        
-        # Convert the scheduledTime to Asia/Kolkata time zone
-        if data.scheduledTime:
-            if isinstance(data.scheduledTime, str):
-                # Parse string to datetime
-                scheduled_time_utc = datetime.strptime(data.scheduledTime, "%Y-%m-%d %H:%M:%S")
-            elif isinstance(data.scheduledTime, datetime):
-                # Already a datetime object
-                scheduled_time_utc = data.scheduledTime
-            else:
-                raise HTTPException(status_code=400, detail="Invalid format for scheduledTime. Must be a string or datetime.")
-
-            # Convert to Asia/Kolkata timezone
-            kolkata_tz = pytz.timezone('Asia/Kolkata')
-            scheduled_time_kolkata = scheduled_time_utc.replace(tzinfo=pytz.utc).astimezone(kolkata_tz)
-            # Convert to string if needed
-            scheduled_time_str = scheduled_time_kolkata.strftime("%Y-%m-%d %H:%M:%S")
+    else:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unsupported message type: {data.messageType}"
+        )
+
+    # Convert groups to a comma-separated string if it's a list
+    if isinstance(data.groups, list):
+        groups = ', '.join(data.groups)
+    else:
+        raise HTTPException(status_code=400, detail="Groups must be provided as a list.")
+
+    # Convert the scheduledTime to Asia/Kolkata time zone
+    if data.scheduledTime:
+        if isinstance(data.scheduledTime, str):
+            # Parse string to datetime
+            scheduled_time_utc = datetime.strptime(data.scheduledTime, "%Y-%m-%d %H:%M:%S")
+        elif isinstance(data.scheduledTime, datetime):
+            # Already a datetime object
+            scheduled_time_utc = data.scheduledTime
         else:
-            raise HTTPException(status_code=400, detail="Scheduled time is required.")
-            
-        # Connect to the database
-        conn = psycopg2.connect(**conn_config)
-        cursor = conn.cursor()
-
-        create = """
-            CREATE TABLE IF NOT EXISTS whatsapp_scheduled_messages (
-                id SERIAL PRIMARY KEY,
-                groups TEXT NOT NULL,
-                message_type TEXT NOT NULL,
-                message_content TEXT NOT NULL,
-                schedule_time TIMESTAMP WITHOUT TIME ZONE NOT NULL,
-                created_at TIMESTAMP WITHOUT TIME ZONE DEFAULT now(),
-                updated_at TIMESTAMP WITHOUT TIME ZONE DEFAULT now(),
-                status TEXT DEFAULT 'false',
-                media JSON,
-                tenant_id VARCHAR(50) NOT NULL,
-                CONSTRAINT fk_tenant FOREIGN KEY (tenant_id) REFERENCES tenant_tenant (tenant_id)
-                    ON DELETE CASCADE
-                    ON UPDATE CASCADE
-            );
-                
-        """
+            raise HTTPException(status_code=400, detail="Invalid format for scheduledTime. Must be a string or datetime.")
+
+        # Convert to Asia/Kolkata timezone
+        scheduled_time_kolkata = scheduled_time_utc.replace(tzinfo=pytz.utc).astimezone(KOLKATA_TZ)
+        # Convert to string if needed
+        scheduled_time_str = scheduled_time_kolkata.strftime("%Y-%m-%d %H:%M:%S")
+    else:
+        raise HTTPException(status_code=400, detail="Scheduled time is required.")
+
+    return (groups, data.messageType, data.content, scheduled_time_str, media_json, tenant_id, "pending")
+
+
+def save_scheduled_message_to_db(data: ScheduleMessageRequest,tenant_id):
+    try:
+        row = prepare_scheduled_message(data, tenant_id)
 
         # Insert the scheduled message into the database
-        query = """
-        INSERT INTO whatsapp_scheduled_messages (groups, message_type, message_content, schedule_time, media, tenant_id,status)
-        VALUES (%s, %s, %s, %s, %s, %s,%s)
-        RETURNING id;
-        """
-        cursor.execute(
-            query,
-            (groups, data.messageType, data.content, scheduled_time_str, media_json,tenant_id, "pending"),
-        )
-        message_id = cursor.fetchone()[0]
-        conn.commit()
+        with get_connection() as conn, conn.cursor() as cursor:
+            message_id = execute_values(cursor, INSERT_SCHEDULED_MESSAGES, [row], fetch=True)[0][0]
+            conn.commit()
+
+        # Don't leave a message that is due soon waiting for the dispatcher's next pass
+        dispatcher.wake()
 
         return {"message": "Scheduled message saved successfully", "id": message_id}
 
     except Exception as e:
-        print(f"Error saving scheduled message: {e}")
+        logging.error(f"Error saving scheduled message: {e}")
         raise HTTPException(status_code=500, detail="Failed to save the scheduled message.")
 
-    finally:
-        if "conn" in locals() and conn:
-            conn.close()  # Ensure the connection is closed
+
+def save_scheduled_messages_bulk(messages: List[ScheduleMessageRequest], tenant_id):
+    """
+    Validate every message, then insert the valid ones with a single multi-row INSERT in one
+    transaction. Returns one result per input, in order: created with its id, or the reason
+    it was rejected.
+    """
+    if len(messages) > MAX_BULK_SCHEDULED_MESSAGES:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BULK_SCHEDULED_MESSAGES} messages per request.")
+
+    results = []
+    rows = []
+    for index, data in enumerate(messages):
+        try:
+            rows.append((index, *prepare_scheduled_message(data, tenant_id)))
+            results.append({"index": index, "status": "created"})
+        except HTTPException as e:
+            results.append({"index": index, "status": "error", "detail": e.detail})
+
+    if rows:
+        try:
+            with get_connection() as conn, conn.cursor() as cursor:
+                # page_size keeps it one statement; the casts type the VALUES columns for the INSERT ... SELECT
+                ids = execute_values(cursor, INSERT_SCHEDULED_MESSAGES_BULK, rows, page_size=len(rows), fetch=True,
+                                     template="(%s, %s, %s, %s, %s::timestamp, %s::json, %s, %s)")
+                conn.commit()
+        except Exception as e:
+            logging.error(f"Error saving scheduled messages in bulk: {e}")
+            raise HTTPException(status_code=500, detail="Failed to save the scheduled messages.")
+
+        # Matched on the input position, not on the order rows came back in
+        for position, message_id in ids:
+            results[position]["id"] = message_id
+
+        dispatcher.wake()
+
+    return {
+        "message": "Scheduled messages processed",
+        "created": len(rows),
+        "failed": len(messages) - len(rows),
+        "results": results
+    }
 
     
-def get_all_scheduled_messages(tenant_id):
+def get_all_scheduled_messages(tenant_id, limit=None, cursor=None, status=None, from_time=None, to_time=None):
+    """
+    One page of a tenant's scheduled messages ordered by schedule_time, optionally filtered by
+    status and a schedule_time range. Returns (messages, next_cursor); next_cursor is None on the last page.
+    """
+    limit = clamp_limit(limit)
+    after = decode_cursor(cursor, 2)
     try:
-        # Connect to the database
-        conn = psycopg2.connect(**conn_config)
-        cursor = conn.cursor()
-
-        # Fetch all scheduled messages
+        # Fetch one page of scheduled messages
         query = """
         SELECT id, groups, message_type, message_content, schedule_time, status, media 
         FROM whatsapp_scheduled_messages
-        where tenant_id = %s;
-        
+        WHERE tenant_id = %(tenant_id)s
+          AND (%(status)s::text IS NULL OR status = %(status)s)
+          AND (%(from_time)s::timestamp IS NULL OR schedule_time >= %(from_time)s)
+          AND (%(to_time)s::timestamp IS NULL OR schedule_time < %(to_time)s)
+          AND (%(after_time)s::timestamp IS NULL OR (schedule_time, id) > (%(after_time)s::timestamp, %(after_id)s))
+        ORDER BY schedule_time, id
+        LIMIT %(limit)s;
         """
-        cursor.execute(query,(tenant_id,))
-        messages = cursor.fetchall()
+        params = {
+            "tenant_id": tenant_id,
+            "status": status,
+            "from_time": from_time,
+            "to_time": to_time,
+            "after_time": after[0] if after else None,
+            "after_id": after[1] if after else None,
+            "limit": limit + 1,
+        }
+        with get_connection() as conn, conn.cursor() as cursor:
+            cursor.execute(query, params)
+            messages = cursor.fetchall()
+
+        messages, next_cursor = split_page(messages, limit, key=lambda row: (row[4], row[0]))
 
         # Map the results to a list of dictionaries
         scheduled_messages = [
@@ -173,10 +244,9 @@ def get_all_scheduled_messages(tenant_id):
             for row in messages
         ]
 
-        conn.close()
-        return scheduled_messages
+        return scheduled_messages, next_cursor
     except Exception as e:
-        print(f"Error fetching scheduled messages: {e}")
+        logging.error(f"Error fetching scheduled messages: {e}")
         raise HTTPException(status_code=500, detail="Failed to fetch scheduled messages")
     
 
@@ -189,10 +259,6 @@ def update_schedule_message(message_id,updated_message,tenant_id):
                     status_code=400,
                     detail=f"Media data is required for message type '{updated_message.messageType}'."
                 )
-        
-        # Connect to the PostgreSQL database
-        conn = psycopg2.connect(**conn_config)
-        cursor = conn.cursor()
 
         # Prepare media details
         media_url = str(updated_message.media.url) if updated_message.media and updated_message.media.url else None
@@ -210,62 +276,49 @@ def update_schedule_message(message_id,updated_message,tenant_id):
             scheduled_time = %s
         WHERE id = %s and tenant_id =%s
         """
-        cursor.execute(
-            update_query,
-            (
-                json.dumps(updated_message.groups),
-                updated_message.messageType,
-                updated_message.content,
-                media_url,
-                media_type,
-                media_name,
-                updated_message.scheduledTime,
-                message_id,
-                tenant_id
-            ),
-        )
+        with get_connection() as conn, conn.cursor() as cursor:
+            cursor.execute(
+                update_query,
+                (
+                    json.dumps(updated_message.groups),
+                    updated_message.messageType,
+                    updated_message.content,
+                    media_url,
+                    media_type,
+                    media_name,
+                    updated_message.scheduledTime,
+                    message_id,
+                    tenant_id
+                ),
+            )
 
-        conn.commit()
+            conn.commit()
 
-        # Check if update succeeded
-        if cursor.rowcount == 0:
-            raise HTTPException(status_code=404, detail="Message not found or no changes made")
+            # Check if update succeeded
+            if cursor.rowcount == 0:
+                raise HTTPException(status_code=404, detail="Message not found or no changes made")
 
         return {"message": f"Scheduled message {message_id} updated successfully"}
 
     except Exception as e:
-        print(f"Error occurred: {str(e)}")
+        logging.error(f"Error occurred: {str(e)}")
         raise HTTPException(status_code=500, detail="Internal Server Error")
 
-    finally:
-        if cursor:
-            cursor.close()
-        if conn:
-            conn.close()
-
 
 def delete_schedule_message(message_id,tenant_id):
     try:
-        conn = psycopg2.connect(**conn_config)
-        cursor = conn.cursor()
-
         # Delete query
         delete_query = "DELETE FROM whatsapp_scheduled_messages WHERE id = %s AND tenant_id = %s"
-        cursor.execute(delete_query, (message_id,tenant_id))
-        conn.commit()
+        with get_connection() as conn, conn.cursor() as cursor:
+            cursor.execute(delete_query, (message_id,tenant_id))
+            conn.commit()
 
-        # Check if delete succeeded
-        if cursor.rowcount == 0:
-            raise HTTPException(status_code=404, detail="Message not found")
+            # Check if delete succeeded
+            if cursor.rowcount == 0:
+                raise HTTPException(status_code=404, detail="Message not found")
 
         return {"message": f"Scheduled message {message_id} deleted successfully"}
 
     except Exception as e:
-        print(f"Error occurred: {str(e)}")
+        logging.error(f"Error occurred: {str(e)}")
         raise HTTPException(status_code=500, detail="Internal Server Error")
-
-    finally:
-        if cursor:
-            cursor.close()
-        if conn:
-            conn.close()
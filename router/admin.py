@@ -0,0 +1,78 @@
+"""
+Operational endpoints: connection pools, statement timings, schema state,
+request metrics and the scheduled message dispatcher.
+
+They report on every tenant at once (SQL fingerprints, schema and pool
+state) and some change state (DELETE /db/query_stats), so they are not part
+of the tenant-facing API. Every route here requires
+`Authorization: Bearer <ADMIN_TOKEN>`, the header Prometheus sends for
+bearer-token scrapes. While ADMIN_TOKEN is unset they are switched off and
+answer 404.
+"""
+import hmac
+from typing import Optional
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Query
+from fastapi.responses import PlainTextResponse
+
+from modules.config.admin import admin_config
+from modules.db import pool_stats
+from modules.db_async import async_pool_stats
+from modules.dispatcher import dispatcher
+from modules.metrics import route_metrics
+from modules.query_stats import query_stats
+from modules.schema import schema_status
+
+
+def require_admin(authorization: Optional[str] = Header(None)):
+    token = admin_config['token']
+    if not token:
+        raise HTTPException(status_code=404, detail="Not Found")
+    scheme, _, supplied = (authorization or "").partition(" ")
+    if scheme.lower() != "bearer" or not hmac.compare_digest(supplied.strip().encode(), token.encode()):
+        raise HTTPException(status_code=401, detail="Admin token required.", headers={"WWW-Authenticate": "Bearer"})
+
+
+admin_router = APIRouter(dependencies=[Depends(require_admin)])
+
+
+@admin_router.get("/db/query_stats")
+def get_query_stats(
+    route: Optional[str] = None,
+    sort: str = Query("total_ms", regex="^(total_ms|mean_ms|max_ms|calls|rows)$"),
+    limit: int = Query(50, ge=1, le=1000),
+):
+    # Statement timings per route for this worker process
+    return query_stats.snapshot(route, sort, limit)
+
+
+@admin_router.delete("/db/query_stats")
+def reset_query_stats():
+    query_stats.reset()
+    return {"message": "Query statistics reset"}
+
+
+@admin_router.get("/db/pool_stats")
+def get_pool_stats():
+    # Connection pool usage for this worker process
+    return {"sync": pool_stats(), "async": async_pool_stats()}
+
+
+@admin_router.get("/metrics")
+def get_metrics(format: str = Query("prometheus", regex="^(prometheus|json)$")):
+    # Request metrics for this worker process
+    if format == "json":
+        return route_metrics.snapshot()
+    return PlainTextResponse(route_metrics.render(), media_type="text/plain; version=0.0.4")
+
+
+@admin_router.get("/dispatcher/stats")
+def get_dispatcher_stats():
+    # Scheduled message dispatcher state for this worker process
+    return dispatcher.stats()
+
+
+@admin_router.get("/db/schema")
+def get_schema_status():
+    # Applied migrations and any missing or invalid indexes
+    return schema_status()
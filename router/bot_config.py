@@ -1,10 +1,14 @@
 from fastapi import APIRouter, HTTPException, status,Request
 from typing import List
-import psycopg2
-from modules.config.database import conn_config
-from modules.store_get_data.bot_config import fetch_bot_config_from_db,store_bot_config,delete_bot_config,update_bot_config
-from modules.model.bot_config import BotConfigResponse,BotConfig
+from modules.store_get_data.bot_config import fetch_bot_config_from_db,store_bot_config,delete_bot_config,update_bot_config,classify_messages,evaluate_messages
+from modules.model.bot_config import BotConfigResponse,BotConfig,ClassifyMessagesRequest,EvaluateMessagesRequest
+from modules.spam_matcher import spam_matchers
+from modules.rate_limiter import message_limiter
+from modules.bot_config_cache import bot_configs
+from modules.bot_log_sink import bot_log_sink
+from modules.db_async import run_sync
 import json
+import logging
 
 # Initialize the FastAPI router
 bot_config_router = APIRouter()
@@ -18,8 +22,7 @@ async def get_bot_config(tenant:Request):
             raise HTTPException(status_code=400, detail="tenant_id header is missing.")
         
         # Attempt to fetch bot configuration from the database
-        bot_config = fetch_bot_config_from_db(tenant_id)
-        print(bot_config)
+        bot_config = await run_sync(fetch_bot_config_from_db, tenant_id)
         if not bot_config:
             # If no bot config is found, raise a 404 not found error
             raise HTTPException(status_code=200, detail="Bot configuration not found")
@@ -32,50 +35,30 @@ async def get_bot_config(tenant:Request):
 @bot_config_router.post("/add_bot_config", status_code=status.HTTP_201_CREATED)
 async def add_bot_config(bot: BotConfig, tenant: Request):
     try:
-        # Print incoming bot configuration details
-        print(f"Received Bot Configuration: {bot.dict()}")
-        
-        # Print tenant ID extraction
         tenant_id = tenant.headers.get("X-tenant-id")
-        print(f"Extracted Tenant ID: {tenant_id}")
+        logging.debug("Received bot configuration", extra={"tenant_id": tenant_id, "bot": bot.dict()})
         
         # Validate tenant ID
         if not tenant_id:
-            print("ERROR: No tenant ID provided in headers")
             raise HTTPException(status_code=400, detail="tenant_id header is missing.")
         
-        # Print attempt to store bot configuration
-        print(f"Attempting to store bot configuration for tenant {tenant_id}")
-        
         # Attempt to add the bot configuration to the database
-        try:
-            add_bot = store_bot_config(bot, tenant_id)
-            print(f"Store bot config result: {add_bot}")
-        except Exception as store_error:
-            print(f"Error in store_bot_config: {store_error}")
-            raise
+        add_bot = await run_sync(store_bot_config, bot, tenant_id)
         
         # Check if bot configuration was successfully added
         if not add_bot:
-            print("Failed to add bot configuration")
             raise HTTPException(status_code=400, detail="Failed to add bot configuration. Please check the input data.")
         
-        print("Bot configuration added successfully")
         return {"message": "Bot configuration added successfully"}
     
     except HTTPException as http_error:
         # Log HTTP exceptions with their specific details
-        print(f"HTTP Exception: {http_error.status_code} - {http_error.detail}")
+        logging.warning(f"HTTP Exception: {http_error.status_code} - {http_error.detail}")
         raise
     
     except Exception as e:
-        # Print full exception details for unexpected errors
-        print(f"Unexpected Error: {type(e).__name__}")
-        print(f"Error Details: {str(e)}")
-        print(f"Error Args: {e.args}")
-        import traceback
-        print("Full Traceback:")
-        traceback.print_exc()
+        # Full traceback for unexpected errors
+        logging.exception(f"Unexpected error adding bot configuration: {type(e).__name__}: {e}")
         
         # Raise a detailed 500 Internal Server Error with the exception message
         raise HTTPException(status_code=500, detail=f"Error adding bot configuration: {str(e)}")
@@ -87,13 +70,13 @@ async def delete_botConfig(bot_id: int,tenant:Request):
         if not tenant_id:
             raise HTTPException(status_code=400, detail="tenant_id header is missing.")
         # Assuming delete_bot_config returns None or some indication when the bot is not found
-        delete_bot = delete_bot_config(bot_id,tenant_id)
+        delete_bot = await run_sync(delete_bot_config, bot_id, tenant_id)
         if not delete_bot:
             # If the bot is not found, raise a 404 error with a custom message
             raise HTTPException(status_code=404, detail=f"Bot with ID {bot_id} not found")
         return {"message": f"Bot with ID {bot_id} has been deleted successfully"}
     except Exception as e:
-        print(f"Error while deleting Bot {bot_id}: {str(e)}")
+        logging.error(f"Error while deleting Bot {bot_id}: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Internal Server Error: {str(e)}")
     
 @bot_config_router.put("/update_bot_config/{bot_id}", status_code=status.HTTP_200_OK)
@@ -103,11 +86,74 @@ async def update_botConfig(bot_id: int, bot: BotConfig,tenant:Request):
         if not tenant_id:
             raise HTTPException(status_code=400, detail="tenant_id header is missing.")
         # Assuming update_bot_config returns None or some indication when the bot is not found
-        update_bot = update_bot_config(bot_id, bot,tenant_id)
+        update_bot = await run_sync(update_bot_config, bot_id, bot, tenant_id)
         if not update_bot:
             # If the bot is not found, raise a 404 error with a custom message
             raise HTTPException(status_code=404, detail=f"Bot with ID {bot_id} not found")
         return {"message": f"Bot with ID {bot_id} has been updated successfully"}
     except Exception as e:
-        print(f"Error while updating Bot {bot_id}: {str(e)}")
-        raise HTTPException(status_code=500, detail=f"Internal Server Error: {str(e)}")
\ No newline at end of file
+        logging.error(f"Error while updating Bot {bot_id}: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Internal Server Error: {str(e)}")
+
+MAX_CLASSIFY_MESSAGES = 1000  # Messages accepted by one classify request
+
+@bot_config_router.post("/classify_messages/{bot_id}", status_code=status.HTTP_200_OK)
+async def classify_bot_messages(bot_id: int, body: ClassifyMessagesRequest, tenant: Request):
+    try:
+        tenant_id = tenant.headers.get("X-tenant-id")
+        if not tenant_id:
+            raise HTTPException(status_code=400, detail="tenant_id header is missing.")
+
+        messages = body.messages if body.messages is not None else ([body.message] if body.message is not None else [])
+        if not messages:
+            raise HTTPException(status_code=400, detail="Provide 'message' or 'messages'.")
+        if len(messages) > MAX_CLASSIFY_MESSAGES:
+            raise HTTPException(status_code=400, detail=f"At most {MAX_CLASSIFY_MESSAGES} messages per request.")
+
+        # Matching is CPU work on a cached automaton; keep it off the event loop like the database calls
+        return await run_sync(classify_messages, bot_id, tenant_id, messages)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logging.error(f"Error while classifying messages for Bot {bot_id}: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Internal Server Error: {str(e)}")
+
+@bot_config_router.get("/spam_matcher_stats")
+def get_spam_matcher_stats():
+    # Compiled keyword matcher cache usage for this worker process
+    return spam_matchers.stats()
+
+@bot_config_router.post("/evaluate_messages/{bot_id}", status_code=status.HTTP_200_OK, description=(
+    "Spam keywords and the per-sender messageLimit for each message. messageLimit is shared by every "
+    "worker only when REDIS_URL is set; without it each worker process counts its own messages."))
+async def evaluate_bot_messages(bot_id: int, body: EvaluateMessagesRequest, tenant: Request):
+    try:
+        tenant_id = tenant.headers.get("X-tenant-id")
+        if not tenant_id:
+            raise HTTPException(status_code=400, detail="tenant_id header is missing.")
+        if not body.messages:
+            raise HTTPException(status_code=400, detail="Provide at least one message.")
+        if len(body.messages) > MAX_CLASSIFY_MESSAGES:
+            raise HTTPException(status_code=400, detail=f"At most {MAX_CLASSIFY_MESSAGES} messages per request.")
+
+        return await run_sync(evaluate_messages, bot_id, tenant_id, body.messages)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logging.error(f"Error while evaluating messages for Bot {bot_id}: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Internal Server Error: {str(e)}")
+
+@bot_config_router.get("/rate_limiter_stats")
+def get_rate_limiter_stats():
+    # Per-sender messageLimit counters: shared in Redis, or held by this worker process without REDIS_URL
+    return message_limiter.stats()
+
+@bot_config_router.get("/config_cache_stats")
+def get_config_cache_stats():
+    # Bot config response cache for this worker process
+    return bot_configs.stats()
+
+@bot_config_router.get("/log_sink_stats")
+def get_log_sink_stats():
+    # Buffered bot log writer state for this worker process
+    return bot_log_sink.stats()
@@ -1,8 +1,8 @@
 from fastapi import APIRouter, HTTPException,Request
-from modules.model.dashboard import DashboardResponse, SentimentData, EngagementData
-from modules.config.database import conn_config
-import psycopg2
-from datetime import datetime, timedelta
+from modules.model.dashboard import DashboardResponse
+from modules.store_get_data.dashboard import fetch_dashboard
+from modules.db_async import async_connection
+from modules.dashboard_cache import dashboard_cache
 from typing import List
 
 # Define your router
@@ -10,166 +10,38 @@ dashboard_router = APIRouter()
 
 @dashboard_router.get("/dashboard", response_model=List[DashboardResponse])
 async def get_dashboard(tenant: Request):
-    conn = None  # Initialize the connection variable
     try:
         tenant_id = tenant.headers.get("X-tenant-id")
         if not tenant_id:
             raise HTTPException(status_code=400, detail="tenant_id header is missing.")
         
-        # Connect to the PostgreSQL database
-        conn = psycopg2.connect(**conn_config)
-        cursor = conn.cursor()
-
-        # Fetch all group names
-        cursor.execute("SELECT DISTINCT group_name FROM whatsapp_groups WHERE tenant_id = %s;", (tenant_id,))
-        group_names = cursor.fetchall()
-        if not group_names:
-            raise HTTPException(status_code=404, detail="No group names found")
+        # Serve from the cache until the TTL expires or new sentiment data is saved
+        cached = await dashboard_cache.aget(tenant_id)
+        if cached is not None:
+            return cached
+
+        # Read the generation first so an invalidation during the queries isn't overwritten
+        generation = await dashboard_cache.ageneration(tenant_id)
 
-        dashboard_data = []
-
-        for group_name in group_names:
-            group_name_str = group_name[0]
-
-            cursor.execute("""
-                SELECT 
-                    group_name,
-                    COALESCE(SUM((sentiment_data->>'Positive')::int), 0) AS Positive,
-                    COALESCE(SUM((sentiment_data->>'Neutral')::int), 0) AS Neutral,
-                    COALESCE(SUM((sentiment_data->>'Negative')::int), 0) AS Negative,
-                    COALESCE(SUM((sentiment_data->>'Commercial')::int), 0) AS Commercial,
-                    topic_data::text AS topic, COUNT(*) AS frequency
-                FROM 
-                    whatsapp_sentiment
-                WHERE 
-                    group_name = %s AND tenant_id = %s
-                GROUP BY 
-                    group_name, topic_data::text
-                ORDER BY 
-                    frequency DESC
-                LIMIT 10
-            """, (group_name_str, tenant_id))
-
-            data = cursor.fetchall()
-
-            # You can now iterate over `data` and separate sentiment and topics:
-            sentiment_data = []
-            topics_data = []
-
-            for row in data:
-                group_name_str = row[0]
-                positive = row[1]
-                neutral = row[2]
-                negative = row[3]
-                commercial = row[4]
-                topic = row[5]
-                frequency = row[6]
-
-                sentiment_data.append(SentimentData(
-                    day=datetime.strftime(datetime.now(), '%A'),  # you can adjust this logic based on how you want to store the day
-                    Positive=positive,
-                    Neutral=neutral,
-                    Negative=negative,
-                    Commercial=commercial
-                ))
-
-                topics_data.append({"topic": topic, "frequency": frequency})
-
-            # # Fetch sentiment data
-            # cursor.execute("""
-            #     SELECT group_name, 
-            #         COALESCE(SUM((sentiment_data->>'Positive')::int), 0) AS Positive,
-            #         COALESCE(SUM((sentiment_data->>'Neutral')::int), 0) AS Neutral,
-            #         COALESCE(SUM((sentiment_data->>'Negative')::int), 0) AS Negative,
-            #         COALESCE(SUM((sentiment_data->>'Commercial')::int), 0) AS Commercial
-            #     FROM whatsapp_sentiment
-            #     WHERE group_name = %s AND tenant_id = %s
-            # """, (group_name_str, tenant_id))
-            # sentiment_data = [
-            #     SentimentData(
-            #         day=datetime.strftime(message_time, '%A'),
-            #         Positive=positive,
-            #         Neutral=neutral,
-            #         Negative=negative,
-            #         Commercial=commercial
-            #     )
-            #     for message_time, positive, neutral, negative, commercial in cursor.fetchall()
-            # ] or None  # Set to None if empty
-
-            # # Fetch topics data
-            # cursor.execute("""
-            #     SELECT topic_data::text AS topic, COUNT(*) AS frequency
-            #     FROM whatsapp_sentiment
-            #     WHERE group_name = %s AND tenant_id = %s
-            #     GROUP BY topic_data::text
-            #     ORDER BY frequency DESC
-            #     LIMIT 10
-            # """, (group_name_str, tenant_id))
-            # topics_data = [{"topic": topic, "frequency": frequency} for topic, frequency in cursor.fetchall()] or None
-
-            # Engagement data calculation
-            seven_days_ago = datetime.now() - timedelta(days=7)
-
-            # Active members
-            cursor.execute("""
-                SELECT DISTINCT phone_number
-                FROM whatsapp_messages
-                WHERE group_name = %s AND tenant_id = %s AND message_time >= %s
-            """, (group_name_str, tenant_id, seven_days_ago))
-            active_members_count = len(cursor.fetchall())
-
-            # Total members
-            cursor.execute("""
-                SELECT COUNT(DISTINCT phone_number)
-                FROM whatsapp_group_members
-                WHERE group_id = (
-                    SELECT group_id FROM whatsapp_groups WHERE group_name = %s AND tenant_id = %s
-                )
-            """, (group_name_str, tenant_id))
-            total_members = cursor.fetchone()[0] or 0
-
-            # Active member score
-            active_member_score = (active_members_count / total_members * 100) if total_members > 0 else 0
-
-            # Engagement rate
-            cursor.execute("""
-                SELECT COUNT(*)
-                FROM whatsapp_messages
-                WHERE group_name = %s AND tenant_id = %s AND message_time >= %s
-            """, (group_name_str, tenant_id, seven_days_ago))
-            total_messages_last_7_days = cursor.fetchone()[0] or 0
-            engagement_rate = (active_members_count / total_messages_last_7_days * 100) if total_messages_last_7_days > 0 else 0
-
-            # Response rate
-            cursor.execute("""
-                SELECT COUNT(*)
-                FROM whatsapp_messages
-                WHERE group_name = %s AND tenant_id = %s AND message_time >= %s
-            """, (group_name_str, tenant_id, seven_days_ago))
-            response_messages = cursor.fetchone()[0] or 0
-            response_rate = (response_messages / total_messages_last_7_days * 100) if total_messages_last_7_days > 0 else 0
-
-            engagement_data = [
-                {"metric": "Active Members", "score": active_member_score},
-                {"metric": "Engagement Rate", "score": engagement_rate},
-                {"metric": "Response Rate", "score": response_rate}
-            ] or None
-
-            dashboard_data.append(DashboardResponse(
-                name=group_name_str,
-                sentimentData=sentiment_data,
-                engagementData=engagement_data,
-                topicsData=topics_data
-            ))
+        # Acquire a connection from the async pool so slow queries don't block the event loop
+        async with async_connection() as conn:
+            # Sentiment, topics and engagement for all groups in a constant number of queries
+            dashboard_data = await fetch_dashboard(conn, tenant_id)
+
+        if not dashboard_data:
+            raise HTTPException(status_code=404, detail="No group names found")
 
+        dashboard_data = [item.dict() for item in dashboard_data]
+        await dashboard_cache.aset(tenant_id, dashboard_data, generation)
         return dashboard_data
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Server error: {str(e)}")
 
-    finally:
-        if conn:
-            conn.close()
+@dashboard_router.get("/dashboard/cache_stats")
+def get_dashboard_cache_stats():
+    # Hit/miss counters and memory usage of the dashboard cache in this worker
+    return dashboard_cache.stats()
 
 # # Initialize the router
 # dashboard_router = APIRouter()
@@ -1,37 +1,62 @@
-from fastapi import APIRouter,HTTPException,Request
+import logging
+from fastapi import APIRouter,HTTPException,Request,Query
 from fastapi.responses import JSONResponse
 from modules.store_get_data.groups import get_groups_from_db , get_group_details_by_id , get_group_activity , get_members_from_db,update_botconfig_in_db,delete_group # Import the function
+from modules.db_async import run_sync
+from modules.store_get_data.pagination import MAX_PAGE_SIZE
+from typing import Optional
 
 router = APIRouter()
 
 @router.get("/get_groups")
-def get_groups(tenant:Request):
+def get_groups(
+    tenant:Request,
+    limit: Optional[int] = Query(None, ge=1, description=f"Page size, at most {MAX_PAGE_SIZE}"),
+    cursor: Optional[str] = Query(None, description="next_cursor of the previous page"),
+):
     try:
           # Extract tenant_id from request headers
         tenant_id = tenant.headers.get("X-tenant-id")
         if not tenant_id:
             raise HTTPException(status_code=400, detail="tenant_id header is missing.")
         
-        groups = get_groups_from_db(tenant_id)  # Call the function to fetch data from the database
-        return JSONResponse(content={"groups": groups})
+        groups, next_cursor = get_groups_from_db(tenant_id, limit, cursor)  # Fetch one page from the database
+        return JSONResponse(content={"groups": groups, "next_cursor": next_cursor})
+    except HTTPException as e:
+        if e.status_code == 400:
+            raise
+        logging.error(f"Error fetching groups: {e.detail}")
+        raise HTTPException(status_code=500, detail="Failed to fetch groups.")
     except Exception as e:
         # Log the error for debugging
-        print(f"Error fetching groups: {e}")
+        logging.error(f"Error fetching groups: {e}")
         raise HTTPException(status_code=500, detail="Failed to fetch groups.")
 
 @router.get("/get_members")
-def get_members(tenant:Request):
+def get_members(
+    tenant:Request,
+    limit: Optional[int] = Query(None, ge=1, description=f"Page size, at most {MAX_PAGE_SIZE}"),
+    cursor: Optional[str] = Query(None, description="next_cursor of the previous page"),
+    group_id: Optional[int] = None,
+    group_name: Optional[str] = None,
+    role: Optional[str] = None,
+):
     try:
          # Extract tenant_id from request headers
         tenant_id = tenant.headers.get("X-tenant-id")
         if not tenant_id:
             raise HTTPException(status_code=400, detail="tenant_id header is missing.")
         
-        members = get_members_from_db(tenant_id)  # Fetch data from the database
-        return JSONResponse(content={"members": members})
+        members, next_cursor = get_members_from_db(tenant_id, limit, cursor, group_id, group_name, role)  # Fetch one page
+        return JSONResponse(content={"members": members, "next_cursor": next_cursor})
+    except HTTPException as e:
+        if e.status_code == 400:
+            raise
+        logging.error(f"Error fetching members: {e.detail}")
+        raise HTTPException(status_code=500, detail="Failed to fetch members.")
     except Exception as e:
         # Log the error for debugging
-        print(f"Error fetching members: {e}")
+        logging.error(f"Error fetching members: {e}")
         raise HTTPException(status_code=500, detail="Failed to fetch members.")
 
 # FastAPI endpoint for group details
@@ -51,7 +76,7 @@ def get_group_details(id: int,tenant:Request):
             raise HTTPException(status_code=404, detail=f"Group with ID {id} not found")
     except Exception as e:
         # Log the error for debugging
-        print(f"Error fetching group details: {e}")
+        logging.error(f"Error fetching group details: {e}")
         raise HTTPException(status_code=500, detail="Failed to fetch group details.")
 
 @router.get("/get_group_activity/{group_name}")
@@ -70,7 +95,7 @@ def get_activity(group_name: str,tenant:Request):
             raise HTTPException(status_code=404, detail=f"Group activity not found for {group_name}")
     except Exception as e:
         # Log the error for debugging
-        print(f"Error fetching group activity: {e}")
+        logging.error(f"Error fetching group activity: {e}")
         raise HTTPException(status_code=500, detail="Failed to fetch group activity.")
     
 
@@ -90,13 +115,13 @@ async def update_botconfig(group_id: int, request: Request):
             raise HTTPException(status_code=400, detail="botconfig_id is missing in the request body.")
         
         # Update the botconfig_id in the database for the specified group and tenant
-        update_botconfig_in_db(group_id, tenant_id, botconfig_id)
+        await run_sync(update_botconfig_in_db, group_id, tenant_id, botconfig_id)
 
         return {"message": f"botconfig_id updated successfully for group ID {group_id}"}
     
     except Exception as e:
         # Log the error for debugging
-        print(f"Error updating botconfig_id: {e}")
+        logging.error(f"Error updating botconfig_id: {e}")
         raise HTTPException(status_code=500, detail="Failed to update botconfig_id.")
     
 @router.delete("/delete_group/{group_name}")
@@ -115,5 +140,5 @@ def delete_group_endpoint(group_name: str, req: Request):
             raise HTTPException(status_code=404, detail=f"Group with name {group_name} not found")
     except Exception as e:
         # Log the error for debugging
-        print(f"Error deleting group: {e}")
+        logging.error(f"Error deleting group: {e}")
         raise HTTPException(status_code=500, detail="Failed to delete group.")
\ No newline at end of file
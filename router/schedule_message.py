@@ -1,6 +1,11 @@
-from fastapi import APIRouter,HTTPException,status,Request
+import logging
+from fastapi import APIRouter,HTTPException,status,Request,Query
 from modules.model.schedule_model import ScheduleMessageRequest
-from modules.store_get_data.schedule_message import save_scheduled_message_to_db,get_all_scheduled_messages,update_schedule_message,delete_schedule_message
+from modules.store_get_data.schedule_message import save_scheduled_message_to_db,save_scheduled_messages_bulk,get_all_scheduled_messages,update_schedule_message,delete_schedule_message
+from modules.store_get_data.pagination import MAX_PAGE_SIZE
+from typing import List, Optional
+from datetime import datetime
+from modules.db_async import run_sync
 router = APIRouter()
 
     
@@ -12,36 +17,61 @@ async def schedule_message(data: ScheduleMessageRequest,tenant:Request):
         if not tenant_id:
             raise HTTPException(status_code=400, detail="tenant_id header is missing.")
         # Attempt to save the scheduled message
-        response = save_scheduled_message_to_db(data,tenant_id)
+        response = await run_sync(save_scheduled_message_to_db, data, tenant_id)
         if not response:
             # If saving failed, raise a 400 Bad Request
             raise HTTPException(status_code=400, detail="Failed to schedule the message.")
         return {"message": "Scheduled message created successfully", "data": response}
     except Exception as e:
-        print(f"Unexpected error occurred while scheduling message: {str(e)}")
+        logging.error(f"Unexpected error occurred while scheduling message: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Internal Server Error: {str(e)}")
+
+@router.post("/create_schedule_messages_bulk")
+async def schedule_messages_bulk(data: List[ScheduleMessageRequest],tenant:Request):
+    try:
+         # Extract tenant_id from request headers
+        tenant_id = tenant.headers.get("X-tenant-id")
+        if not tenant_id:
+            raise HTTPException(status_code=400, detail="tenant_id header is missing.")
+        # Validate all messages and insert the valid ones in one statement
+        return await run_sync(save_scheduled_messages_bulk, data, tenant_id)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logging.error(f"Unexpected error occurred while scheduling messages in bulk: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Internal Server Error: {str(e)}")
     
 @router.get("/get_schedule_messages")
-async def get_schedule_messages(tenant:Request):
+async def get_schedule_messages(
+    tenant:Request,
+    limit: Optional[int] = Query(None, ge=1, description=f"Page size, at most {MAX_PAGE_SIZE}"),
+    cursor: Optional[str] = Query(None, description="next_cursor of the previous page"),
+    status: Optional[str] = None,
+    from_time: Optional[datetime] = Query(None, description="schedule_time >= from_time"),
+    to_time: Optional[datetime] = Query(None, description="schedule_time < to_time"),
+):
     try:
          # Extract tenant_id from request headers
         tenant_id = tenant.headers.get("X-tenant-id")
         if not tenant_id:
             raise HTTPException(status_code=400, detail="tenant_id header is missing.")
         
-        # Attempt to retrieve all scheduled messages
-        response = get_all_scheduled_messages(tenant_id)
+        # Retrieve one page of scheduled messages
+        response, next_cursor = await run_sync(
+            get_all_scheduled_messages, tenant_id, limit, cursor, status, from_time, to_time
+        )
         
-        # If no messages are found, return an empty list
-        if not response:
-            return {"scheduled_messages": []}
-        
-        # Return the scheduled messages if found
-        return {"scheduled_messages": response}
+        # Return the scheduled messages (an empty list if none are found)
+        return {"scheduled_messages": response or [], "next_cursor": next_cursor}
     
+    except HTTPException as e:
+        if e.status_code == 400:
+            raise
+        logging.error(f"Unexpected error occurred while fetching scheduled messages: {e.detail}")
+        raise HTTPException(status_code=500, detail="Internal Server Error")
     except Exception as e:
         # Catch any other general exceptions
-        print(f"Unexpected error occurred while fetching scheduled messages: {str(e)}")
+        logging.error(f"Unexpected error occurred while fetching scheduled messages: {str(e)}")
         raise HTTPException(status_code=500, detail="Internal Server Error")
     
 from typing import Any
@@ -55,7 +85,7 @@ async def update_scheduledmessage(message_id: int, updated_message: ScheduleMess
             raise HTTPException(status_code=400, detail="tenant_id header is missing.")
 
         # Attempt to update the scheduled message
-        update_message = update_schedule_message(message_id, updated_message,tenant_id)
+        update_message = await run_sync(update_schedule_message, message_id, updated_message, tenant_id)
         
         if not update_message:
             # If the message update failed, raise a 404 error
@@ -65,7 +95,7 @@ async def update_scheduledmessage(message_id: int, updated_message: ScheduleMess
     
     except Exception as e:
         # For any other general exceptions
-        print(f"Unexpected error while updating message {message_id}: {str(e)}")
+        logging.error(f"Unexpected error while updating message {message_id}: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Internal Server Error: {str(e)}")
     
 @router.delete("/delete_scheduled_message/{message_id}/", status_code=status.HTTP_200_OK)
@@ -75,13 +105,12 @@ async def delete_scheduled_message(message_id: int,tenant:Request):
         if not tenant_id:
             raise HTTPException(status_code=404, detail=f"Message with ID {message_id} not found")
 
-        delete_message = delete_schedule_message(message_id,
-                                                 tenant_id)
+        delete_message = await run_sync(delete_schedule_message, message_id, tenant_id)
         if not delete_message:
             raise HTTPException(status_code=404,detail=f"Message with ID{message_id} not found")
         return{"message":f"Scheduled message with ID {message_id} delete successfully"}
     
     except Exception as e :
         # For any other general exceptions
-        print(f"Unexpected error while deleting message {message_id}: {str(e)}")
+        logging.error(f"Unexpected error while deleting message {message_id}: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Internal Server Error: {str(e)}")
\ No newline at end of file
@@ -0,0 +1,136 @@
+import threading
+import time
+
+import pytest
+
+from modules.bot_log_sink import BotLogSink
+
+
+class RecordingWriter:
+    def __init__(self, fail=0, gate=None):
+        self.batches = []
+        self.fail = fail          # Number of calls that raise before writes succeed
+        self.gate = gate          # Event the writer waits on, to simulate a slow database
+
+    def __call__(self, rows):
+        if self.gate is not None:
+            self.gate.wait(5)
+        if self.fail:
+            self.fail -= 1
+            raise RuntimeError("database down")
+        self.batches.append(list(rows))
+
+    @property
+    def rows(self):
+        return [row for batch in self.batches for row in batch]
+
+
+def make_sink(writer, **overrides):
+    config = dict(batch_size=100, flush_interval=60, max_buffered=4, overflow="block", block_timeout=0.2,
+                  retry_limit=3, writer=writer)
+    config.update(overrides)
+    return BotLogSink(**config)
+
+
+def buffered(sink):
+    return [row for row, _ in sink._buffer]
+
+
+def test_unknown_overflow_policy():
+    with pytest.raises(ValueError):
+        make_sink(RecordingWriter(), overflow="spill")
+
+
+def test_drop_newest_keeps_what_is_buffered():
+    sink = make_sink(RecordingWriter(), overflow="drop_newest")
+    assert sink.submit([1, 2, 3]) == 3
+    assert sink.submit([4, 5, 6]) == 1
+    assert buffered(sink) == [1, 2, 3, 4]
+    assert sink.stats()["dropped"] == 2
+    sink.stop()
+
+
+def test_drop_oldest_makes_room_for_new_rows():
+    sink = make_sink(RecordingWriter(), overflow="drop_oldest")
+    sink.submit([1, 2, 3])
+    assert sink.submit([4, 5, 6]) == 3
+    assert buffered(sink) == [3, 4, 5, 6]
+    assert sink.stats()["dropped"] == 2
+    sink.stop()
+
+
+def test_drop_oldest_with_more_rows_than_the_buffer_keeps_the_newest():
+    sink = make_sink(RecordingWriter(), overflow="drop_oldest")
+    sink.submit([1])
+    assert sink.submit([2, 3, 4, 5, 6, 7]) == 4
+    assert buffered(sink) == [4, 5, 6, 7]
+    assert sink.stats()["dropped"] == 3
+    sink.stop()
+
+
+def test_block_waits_for_the_flusher_to_make_room():
+    writer = RecordingWriter()
+    sink = make_sink(writer, block_timeout=5)
+    sink.submit([1, 2, 3, 4])
+    started = time.monotonic()
+    # The buffer is full but below batch_size; a blocked submitter makes the flusher write early
+    assert sink.submit([5, 6]) == 2
+    assert time.monotonic() - started < 2
+    sink.stop()
+    assert writer.rows == [1, 2, 3, 4, 5, 6]
+    assert sink.stats()["blocked"] == 1
+    assert sink.stats()["dropped"] == 0
+
+
+def test_block_drops_after_block_timeout():
+    gate = threading.Event()
+    writer = RecordingWriter(gate=gate)
+    sink = make_sink(writer, batch_size=2, max_buffered=2, block_timeout=0.2)
+    sink.submit([1, 2])
+    deadline = time.monotonic() + 2
+    while sink.stats()["buffered"] and time.monotonic() < deadline:
+        time.sleep(0.01)  # The flusher took the batch and is stuck writing it
+    assert sink.submit([3, 4]) == 2
+
+    started = time.monotonic()
+    assert sink.submit([5]) == 0
+    assert time.monotonic() - started >= 0.2
+    assert sink.stats()["dropped"] == 1
+
+    gate.set()
+    sink.stop()
+    assert writer.rows == [1, 2, 3, 4]
+
+
+def test_failed_flushes_are_retried_in_order():
+    writer = RecordingWriter(fail=1)
+    sink = make_sink(writer, batch_size=2, flush_interval=0.05, max_buffered=10)
+    sink.submit([1, 2])
+    sink.submit([3])
+    sink.stop()
+    assert writer.rows == [1, 2, 3]
+    assert sink.stats()["failed_flushes"] == 1
+    assert sink.stats()["dropped"] == 0
+
+
+def test_rows_are_dropped_after_retry_limit():
+    writer = RecordingWriter(fail=10)
+    sink = make_sink(writer, batch_size=2, flush_interval=0.01, max_buffered=10, retry_limit=2)
+    sink.submit([1, 2])
+    deadline = time.monotonic() + 5
+    while sink.stats()["dropped"] < 2 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    sink.stop()
+    assert writer.rows == []
+    assert sink.stats()["dropped"] == 2
+    assert sink.stats()["failed_flushes"] == 2
+
+
+def test_stop_flushes_everything_buffered():
+    writer = RecordingWriter()
+    sink = make_sink(writer, max_buffered=1000)
+    sink.submit(list(range(250)))
+    sink.stop()
+    assert writer.rows == list(range(250))
+    assert [len(batch) for batch in writer.batches] == [100, 100, 50]
+    assert sink.stats()["written"] == 250
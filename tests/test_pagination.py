@@ -0,0 +1,74 @@
+import base64
+import json
+from datetime import datetime
+
+import pytest
+from fastapi import HTTPException
+
+from modules.store_get_data.pagination import (
+    DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, clamp_limit, decode_cursor, encode_cursor, split_page,
+)
+
+
+def raw_cursor(payload):
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def test_clamp_limit():
+    assert clamp_limit(None) == DEFAULT_PAGE_SIZE
+    assert clamp_limit(0) == 1
+    assert clamp_limit(10) == 10
+    assert clamp_limit(MAX_PAGE_SIZE + 1) == MAX_PAGE_SIZE
+
+
+def test_cursor_round_trip():
+    scheduled = datetime(2024, 5, 1, 9, 30, 15, 123456)
+    cursor = encode_cursor(scheduled, 42, "group ü/+")
+    assert "=" not in cursor
+    assert decode_cursor(cursor, 3) == [scheduled.isoformat(), 42, "group ü/+"]
+
+
+def test_missing_cursor_is_first_page():
+    assert decode_cursor(None, 2) is None
+    assert decode_cursor("", 2) is None
+
+
+@pytest.mark.parametrize("cursor", [
+    "not a cursor!",
+    raw_cursor("{not json"),
+    raw_cursor('{"a": 1}'),
+    raw_cursor("[1]"),
+    raw_cursor("[1, 2, 3]"),
+    base64.urlsafe_b64encode(b"\xff\xfe[1, 2]").decode(),
+    encode_cursor(1, 2)[:-3],
+])
+def test_tampered_cursor_is_a_400(cursor):
+    with pytest.raises(HTTPException) as error:
+        decode_cursor(cursor, 2)
+    assert error.value.status_code == 400
+
+
+def test_split_page_last_page_has_no_cursor():
+    rows = [{"id": 1}, {"id": 2}]
+    assert split_page(rows, 2, lambda row: (row["id"],)) == (rows, None)
+
+
+def test_split_page_trims_look_ahead_row():
+    rows = [{"id": 1}, {"id": 2}, {"id": 3}]
+    page, cursor = split_page(rows, 2, lambda row: (row["id"],))
+    assert page == rows[:2]
+    assert decode_cursor(cursor, 1) == [2]
+
+
+def test_pages_cover_every_row_once():
+    table = [{"time": datetime(2024, 1, 1, hour), "id": id} for hour in range(3) for id in range(4)]
+    key = lambda row: (row["time"], row["id"])
+    seen, cursor = [], None
+    while True:
+        after = decode_cursor(cursor, 2)
+        remaining = [row for row in table if after is None or (row["time"].isoformat(), row["id"]) > tuple(after)]
+        page, cursor = split_page(remaining[:5 + 1], 5, key)
+        seen.extend(page)
+        if cursor is None:
+            break
+    assert seen == table
@@ -0,0 +1,87 @@
+import pytest
+
+from modules.rate_limiter import ShardedRateLimiter
+
+KEY = ("tenant", "group", "sender")
+
+
+@pytest.fixture
+def limiter():
+    return ShardedRateLimiter(window_seconds=60, shards=4, idle_ttl=600, sweep_interval=30)
+
+
+def test_shards_must_be_a_power_of_two():
+    with pytest.raises(ValueError):
+        ShardedRateLimiter(window_seconds=60, shards=6, idle_ttl=600, sweep_interval=30)
+
+
+def test_no_limit_counts_nothing(limiter):
+    assert limiter.hit(KEY, 0, now=6000) == 0
+    assert limiter.hit(KEY, None, now=6000) == 0
+    assert len(limiter) == 0
+
+
+def test_counts_within_one_window(limiter):
+    rates = [limiter.hit(KEY, 5, now=6000 + second) for second in range(6)]
+    assert rates == [1, 2, 3, 4, 5, 6]
+    assert limiter.stats()["exceeded"] == 1
+
+
+def test_previous_window_is_weighted_by_its_overlap(limiter):
+    for _ in range(10):
+        limiter.hit(KEY, 100, now=6000)
+    # Window boundary: the previous window still overlaps completely
+    assert limiter.hit(KEY, 100, now=6060) == pytest.approx(11)
+    # Halfway through the next window half of the previous one still counts
+    assert limiter.hit(KEY, 100, now=6090) == pytest.approx(10 * 0.5 + 2)
+    # Just before the next boundary almost nothing of it is left
+    assert limiter.hit(KEY, 100, now=6119.9) == pytest.approx(10 * (0.1 / 60) + 3)
+
+
+def test_windows_older_than_the_previous_one_are_dropped(limiter):
+    for _ in range(10):
+        limiter.hit(KEY, 100, now=6000)
+    assert limiter.hit(KEY, 100, now=6125) == 1
+
+
+def test_clock_stepping_back_does_not_reset_the_counter(limiter):
+    for second in range(5):
+        limiter.hit(KEY, 5, now=6060 + second)
+    assert limiter.hit(KEY, 5, now=6000) == 6
+
+
+def test_senders_are_counted_separately(limiter):
+    limiter.hit(KEY, 5, now=6000)
+    assert limiter.hit(("tenant", "group", "other"), 5, now=6000) == 1
+    assert limiter.hit(("tenant", "other group", "sender"), 5, now=6000) == 1
+
+
+def test_idle_senders_are_swept():
+    # One shard, so every hit can trigger the sweep that covers KEY
+    limiter = ShardedRateLimiter(window_seconds=60, shards=1, idle_ttl=600, sweep_interval=30)
+    active = ("tenant", "group", "active")
+    limiter.hit(KEY, 5, now=6000)
+    for second in range(0, 600, 30):
+        limiter.hit(active, 5, now=6000 + second)
+    assert len(limiter) == 2  # Idle for 570s, under idle_ttl
+
+    limiter.hit(active, 5, now=6630)
+    assert len(limiter) == 1
+    assert limiter.stats()["evicted"] == 1
+    # A swept sender starts over
+    assert limiter.hit(KEY, 5, now=6631) == 1
+
+
+def test_sweeps_wait_for_sweep_interval():
+    limiter = ShardedRateLimiter(window_seconds=60, shards=1, idle_ttl=10, sweep_interval=300)
+    limiter.hit(KEY, 5, now=6000)
+    limiter.hit(("tenant", "group", "other"), 5, now=6100)
+    assert len(limiter) == 2
+    limiter.hit(("tenant", "group", "other"), 5, now=6300)
+    assert len(limiter) == 1
+
+
+def test_reset(limiter):
+    limiter.hit(KEY, 5, now=6000)
+    limiter.reset(KEY)
+    assert limiter.hit(KEY, 5, now=6001) == 1
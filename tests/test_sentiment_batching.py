@@ -0,0 +1,79 @@
+import json
+
+import pytest
+
+from modules.sentiment import TOP_TOPICS, chunk_messages, count_tokens, merge_analyses
+
+
+def batch_tokens(batch):
+    return count_tokens(json.dumps(batch))
+
+
+def test_no_messages_no_batches():
+    assert chunk_messages([], 100) == []
+
+
+def test_small_input_is_one_batch():
+    messages = ["hello", "how are you", "fine"]
+    assert chunk_messages(messages, 1000) == [messages]
+
+
+@pytest.mark.parametrize("budget", [50, 120, 500])
+def test_batches_fit_the_budget_and_keep_order(budget):
+    # No message is oversized here, so none is cut
+    messages = [f"message number {index} " * (index % 7 + 1) for index in range(200)]
+    batches = chunk_messages(messages, budget)
+    assert len(batches) > 1
+    assert [message for batch in batches for message in batch] == messages
+    for batch in batches:
+        assert batch_tokens(batch) <= budget
+
+
+@pytest.mark.parametrize("message", ["word " * 2000, "😀" * 2000, '"quoted" ' * 2000])
+def test_oversized_message_is_cut_to_fit_alone(message):
+    batches = chunk_messages(["before", message, "after"], 100)
+    assert [len(batch) for batch in batches] == [1, 1, 1]
+    assert batches[0] == ["before"] and batches[2] == ["after"]
+    cut = batches[1][0]
+    assert 0 < len(cut) < len(message) and message.startswith(cut)
+    assert batch_tokens(batches[1]) <= 100
+
+
+def test_merge_adds_sentiment_counts():
+    merged = merge_analyses([
+        {"sentiment_data": {"Positive": 3, "Neutral": 1, "Negative": 0, "Commercial": 2}, "topic_data": []},
+        {"sentiment_data": {"Positive": 1, "Neutral": 4, "Negative": 2}, "topic_data": []},
+    ])
+    assert merged["sentiment_data"] == {"Positive": 4, "Neutral": 5, "Negative": 2, "Commercial": 2}
+
+
+def test_merge_weights_topics_by_frequency_across_batches():
+    merged = merge_analyses([
+        {"sentiment_data": {}, "topic_data": [{"topic": "Delivery", "frequency": 5}, {"topic": "Price", "frequency": 4}]},
+        {"sentiment_data": {}, "topic_data": [{"topic": "delivery ", "frequency": 2}, {"topic": "Refunds", "frequency": 6}]},
+    ])
+    # A topic seen in several batches is ranked by its total, under the first spelling seen
+    assert merged["topic_data"] == [
+        {"topic": "Delivery", "frequency": 7},
+        {"topic": "Refunds", "frequency": 6},
+        {"topic": "Price", "frequency": 4},
+    ]
+
+
+def test_merge_skips_malformed_values():
+    merged = merge_analyses([
+        {"sentiment_data": {"Positive": "3", "Neutral": "many", "Negative": None}, "topic_data": [
+            "not a dict", {"frequency": 3}, {"topic": "", "frequency": 1},
+            {"topic": "Ok", "frequency": "2"}, {"topic": "Odd", "frequency": "lots"},
+        ]},
+        {"topic_data": None},
+        {},
+    ])
+    assert merged["sentiment_data"] == {"Positive": 3, "Neutral": 0, "Negative": 0, "Commercial": 0}
+    assert merged["topic_data"] == [{"topic": "Ok", "frequency": 2}, {"topic": "Odd", "frequency": 0}]
+
+
+def test_merge_keeps_top_topics():
+    merged = merge_analyses([{"topic_data": [{"topic": f"t{index}", "frequency": index} for index in range(30)]}])
+    assert len(merged["topic_data"]) == TOP_TOPICS
+    assert merged["topic_data"][0] == {"topic": "t29", "frequency": 29}
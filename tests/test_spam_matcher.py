@@ -0,0 +1,91 @@
+import random
+
+import pytest
+
+from modules import spam_matcher
+from modules.spam_matcher import KeywordAutomaton
+
+KEYWORDS = {
+    "sale": "warn",
+    "for sale": "delete",
+    "free": "warn",
+    "free gift": "mute",
+    "Call  Now": "ban",
+    "₹": "warn",
+    "he": "warn",
+    "she": "mute",
+    "hers": "kick",
+}
+
+
+@pytest.fixture(params=["native", "python"])
+def build(request, monkeypatch):
+    if request.param == "native":
+        if spam_matcher.ahocorasick is None:
+            pytest.skip("pyahocorasick is not installed")
+    else:
+        monkeypatch.setattr(spam_matcher, "ahocorasick", None)
+    return KeywordAutomaton
+
+
+def found(automaton, text):
+    return {match["keyword"]: match["count"] for match in automaton.classify(text)["matches"]}
+
+
+def test_whole_words_only(build):
+    automaton = build({"sale": "warn"})
+    assert found(automaton, "wholesale prices") == {}
+    assert found(automaton, "salesman") == {}
+    assert found(automaton, "sale2") == {}
+    assert found(automaton, "Big SALE! sale, (sale)") == {"sale": 3}
+
+
+def test_phrases_match_across_any_whitespace(build):
+    automaton = build(KEYWORDS)
+    assert found(automaton, "CALL\n now for a free\tgift") == {"Call  Now": 1, "free": 1, "free gift": 1}
+
+
+def test_symbol_keywords_skip_the_boundary_check(build):
+    assert found(build(KEYWORDS), "only ₹500") == {"₹": 1}
+
+
+def test_overlapping_keywords_all_match(build):
+    automaton = build(KEYWORDS)
+    assert found(automaton, "she said hers") == {"she": 1, "hers": 1}
+    assert found(automaton, "items for sale") == {"sale": 1, "for sale": 1}
+
+
+def test_most_severe_action_wins(build):
+    automaton = build(KEYWORDS)
+    assert automaton.classify("free stuff, call now")["action"] == "ban"
+    assert automaton.classify("nothing here")["action"] is None
+
+
+def test_keywords_differing_in_case_and_spacing_are_all_reported(build):
+    automaton = build({"Free Gift": "warn", "free  gift": "mute"})
+    assert found(automaton, "a free gift") == {"Free Gift": 1, "free  gift": 1}
+
+
+def test_empty_keywords(build):
+    automaton = build({"": "warn", "   ": "ban"})
+    assert len(automaton) == 0
+    assert automaton.classify("anything") == {"matches": [], "action": None}
+    assert build(None).classify(None) == {"matches": [], "action": None}
+
+
+def test_native_and_python_tries_agree(monkeypatch):
+    if spam_matcher.ahocorasick is None:
+        pytest.skip("pyahocorasick is not installed")
+    rng = random.Random(7)
+    alphabet = ["a", "b", "ab", "ba", "aa", " ", ".", "₹"]
+    keywords = {"".join(rng.choice(alphabet) for _ in range(rng.randint(1, 3))).strip() or "a": "warn"
+                for _ in range(40)}
+    texts = ["".join(rng.choice(alphabet) for _ in range(rng.randint(0, 60))) for _ in range(300)]
+
+    native = KeywordAutomaton(keywords)
+    monkeypatch.setattr(spam_matcher, "ahocorasick", None)
+    python = KeywordAutomaton(keywords)
+
+    for text in texts:
+        assert sorted(native.find(text)) == sorted(python.find(text))
+        assert native.classify(text) == python.classify(text)